@@ -0,0 +1,3 @@
+"""
+Agent服务 API 路由
+"""
@@ -0,0 +1,155 @@
+"""
+知识库API
+"""
+import asyncio
+from contextlib import ExitStack
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, HTTPException, status
+
+from agent.knowledge import KnowledgeBase, ReindexStats, knowledge_bases
+from agent.knowledge.ingest import RAG_SOURCE_DIR, PostgresSink, SqlDumpIngester, default_dump_paths
+from agent.models.schemas import (
+    DocumentResponse, DocumentUpload, KnowledgeBaseCreate, KnowledgeBaseResponse,
+    KnowledgeQuery, KnowledgeResult, SqlDumpIngestRequest, SqlDumpIngestResponse, SuccessResponse,
+)
+
+router = APIRouter(prefix="/api/v1/knowledge", tags=["知识库"])
+
+
+def _get_base(kb_id: str) -> KnowledgeBase:
+    base = knowledge_bases.get(kb_id)
+    if base is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"知识库不存在: {kb_id}")
+    return base
+
+
+@router.post("", response_model=KnowledgeBaseResponse)
+async def create_knowledge_base(request: KnowledgeBaseCreate) -> Dict[str, Any]:
+    """创建知识库"""
+    try:
+        base = await asyncio.to_thread(knowledge_bases.create, request)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return base.to_response()
+
+
+@router.get("", response_model=List[KnowledgeBaseResponse])
+async def list_knowledge_bases() -> List[Dict[str, Any]]:
+    """知识库列表"""
+    return [base.to_response() for base in knowledge_bases.list()]
+
+
+@router.get("/{kb_id}", response_model=KnowledgeBaseResponse)
+async def get_knowledge_base(kb_id: str) -> Dict[str, Any]:
+    """知识库详情"""
+    return _get_base(kb_id).to_response()
+
+
+@router.get("/{kb_id}/manifest")
+async def get_manifest(kb_id: str) -> Dict[str, Dict[str, Any]]:
+    """
+    索引清单：
+    输出数据格式：
+      - { document_id: { filename, content_hash, chunks: [分块内容哈希], updated_at } }
+    """
+    return _get_base(kb_id).manifest()
+
+
+@router.delete("/{kb_id}", response_model=SuccessResponse)
+async def delete_knowledge_base(kb_id: str) -> Dict[str, Any]:
+    """删除知识库"""
+    if not knowledge_bases.delete(kb_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"知识库不存在: {kb_id}")
+    return {"success": True, "message": "知识库已删除"}
+
+
+@router.post("/{kb_id}/documents", response_model=DocumentResponse)
+async def upload_document(kb_id: str, upload: DocumentUpload) -> Dict[str, Any]:
+    """上传文档：分块、向量化并写入索引（在线程池中执行，不阻塞事件循环）；指定已存在的 document_id 时按内容哈希增量更新"""
+    base = _get_base(kb_id)
+    try:
+        document = await asyncio.to_thread(base.add_document, upload, upload.document_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return document.to_response()
+
+
+@router.get("/{kb_id}/documents", response_model=List[DocumentResponse])
+async def list_documents(kb_id: str) -> List[Dict[str, Any]]:
+    """文档列表"""
+    return [document.to_response() for document in _get_base(kb_id).documents.values()]
+
+
+@router.delete("/{kb_id}/documents/{document_id}", response_model=SuccessResponse)
+async def delete_document(kb_id: str, document_id: str) -> Dict[str, Any]:
+    """删除文档及其全部分块"""
+    if not _get_base(kb_id).remove_document(document_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"文档不存在: {document_id}")
+    return {"success": True, "message": "文档已删除"}
+
+
+@router.post("/{kb_id}/query", response_model=List[KnowledgeResult])
+async def query_knowledge_base(kb_id: str, query: KnowledgeQuery) -> List[KnowledgeResult]:
+    """
+    知识库检索：
+    输入数据格式：
+      - query: 查询内容；top_k: 返回结果数量；score_threshold: 向量检索的余弦相似度阈值（默认按向量化模型取值）
+      - mode: hybrid（BM25 + 向量，倒数排名融合）/ dense / bm25，默认取服务配置
+    输出数据格式：
+      - [ { content, score, metadata, document_id, chunk_index } ]，按分数降序
+    """
+    base = _get_base(kb_id)
+    try:
+        return await asyncio.to_thread(base.query, query)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.post("/{kb_id}/ingest/sql-dumps", response_model=SqlDumpIngestResponse)
+async def ingest_sql_dumps(kb_id: str, request: SqlDumpIngestRequest) -> Dict[str, Any]:
+    """
+    导入 RAG 源表 SQL 导出文件：
+    输入数据格式：
+      - files: Backend/rag/源表 下的文件名（为空时全部）；load_database: 是否同时写入 RAG PostgreSQL；batch_size: 每批行数
+    业务处理：
+      - 在线程池中流式解析导出文件，每批数据行生成一个知识库文档（ID 为「表名:首行内容哈希」）
+      - 重复导入时按内容哈希增量更新：未变化的文档跳过，变化的文档只向量化新增分块，源数据中已消失的文档被删除
+    输出数据格式：
+      - { files, rows, batches, documents, seconds, db_seconds, document_seconds, rows_per_second, tables, knowledge }
+      - knowledge: 增量索引统计 { documents_added, documents_updated, documents_unchanged, documents_removed,
+        chunks_embedded, chunks_reused, chunks_removed }
+    """
+    base = _get_base(kb_id)
+    if request.files:
+        paths = [RAG_SOURCE_DIR / name for name in request.files]
+        invalid = [name for name, path in zip(request.files, paths) if path.parent != RAG_SOURCE_DIR or path.suffix != ".sql" or not path.is_file()]
+        if invalid:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"导出文件不存在: {', '.join(invalid)}")
+    else:
+        paths = default_dump_paths()
+
+    def run() -> Dict[str, Any]:
+        reindex = ReindexStats()
+
+        def add_document(document_id: str, upload: DocumentUpload) -> None:
+            base.add_document(upload, document_id, reindex)
+
+        with ExitStack() as stack:
+            sink = stack.enter_context(PostgresSink()) if request.load_database else None
+            ingester = SqlDumpIngester(sink=sink, on_document=add_document, batch_size=request.batch_size)
+            stats = ingester.ingest(paths)
+        # 清理源数据中已消失的文档：全量导入时清理全部导出文件文档，指定文件时只清理涉及的表
+        if request.files:
+            for table, document_ids in ingester.emitted.items():
+                base.prune(document_ids, {"loader": "sql_dump", "table": table}, reindex)
+        else:
+            base.prune([item for ids in ingester.emitted.values() for item in ids], {"loader": "sql_dump"}, reindex)
+        return {**stats.to_dict(), "knowledge": reindex.to_dict()}
+
+    try:
+        return await asyncio.to_thread(run)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ImportError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="写入 RAG PostgreSQL 需要安装 psycopg")
@@ -4,652 +4,935 @@ Agent Service - FastAPI entry for LLM chat proxy with full LLM management featur
 Usage (dev):
   python -m uvicorn agent.app:app --reload --host 0.0.0.0 --port 8089
 """
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-import uvicorn
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
+from contextlib import AsyncExitStack, asynccontextmanager
+from functools import lru_cache
+import asyncio
+import json
 import os
+import uuid
 from pathlib import Path
-from dotenv import load_dotenv
-from langchain_community.chat_models.tongyi import ChatTongyi
-from langchain_core.tools import tool
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AIMessageChunk, ToolMessage
 import urllib3
-from langchain.chat_models import init_chat_model
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.prebuilt import create_react_agent
-from langchain_tavily import TavilySearch
+
+from agent.api.knowledge import router as knowledge_router
+from agent.core.agent_graph import AgentGraph, RunFinished, open_checkpointer
+from agent.core.config import settings
+from agent.core.history_compactor import HistoryCompactor, estimate_tokens, latest_analysis_type
+from agent.core.history_store import create_history_store
+from agent.core.llm import ChatModelRegistry, ClientDisconnected
+from agent.core.model_pool import ModelPool
+from agent.core.prompt_cache import build_system_message, prompt_cache_stats
+from agent.core.prompt_files import PromptFile
+from agent.core.rate_limiter import is_retryable, upstream_limiter
+from agent.core.response_cache import ResponseCache
+from agent.core.tracing import CONTENT_TYPE_LATEST, render_metrics, stage, trace_request
+from agent.tools import map_tool_registry
+from agent.tools.intent_router import route_intent
 
 # 关闭全局SSL验证以规避企业网络或中间代理引起的握手问题
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 os.environ["PYTHONHTTPSVERIFY"] = "0"
 
 
-class LLMSettings(BaseModel):
-    api_key: str = Field(default_factory=lambda: os.getenv("DASHSCOPE_API_KEY", ""))
-    base_url: str = Field(default_factory=lambda: os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"))
-    model: str = Field(default_factory=lambda: os.getenv("DASHSCOPE_MODEL", "qwen-max"))
-    temperature: float = Field(default_factory=lambda: float(os.getenv("DASHSCOPE_TEMPERATURE", "0.7")))
-    max_tokens: int = Field(default_factory=lambda: int(os.getenv("DASHSCOPE_MAX_TOKENS", "3000")))
-    cors_origins: str = Field(default_factory=lambda: os.getenv("CORS_ORIGINS", "*"))
-
-    def cors_list(self) -> List[str]:
-        raw = self.cors_origins or "*"
-        if raw == "*":
-            return ["*"]
-        return [o.strip() for o in raw.split(",")]
-
-
-# 加载后端环境变量文件 Backend/.env
-_ROOT = Path(__file__).resolve().parents[1]
-_ENV_PATH = _ROOT / ".env"
-if _ENV_PATH.exists():
-    load_dotenv(dotenv_path=str(_ENV_PATH))
-
-settings = LLMSettings()
-os.environ.setdefault("OPENAI_API_KEY", settings.api_key)
-os.environ.setdefault("OPENAI_BASE_URL", settings.base_url)
 class ChatResponse(BaseModel):
     success: bool
     data: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
 
 
-@tool
-def toggle_layer_visibility(layer_name: str, action: str) -> str:
+class UpstreamFailure(Exception):
     """
-    切换前端图层可见性（前端执行）。
-    输入参数：
-      - layer_name: string 图层名称
-      - action: string 'show'|'hide'|'toggle'
-    业务处理：
-      - 后端不直接操作地图，仅返回动作与图层名称供前端执行
-    输出数据格式：
-      - string: 格式 "action:layer_name"
+    非流式调用的上游错误（回退链上的模型均失败等）。
+    status_code: 可重试类错误（限流、连接失败、5xx）重试耗尽为 503，其它上游错误为 502；
+    response: 与流式 error 事件相同的错误信息（及已执行工具的结果）
     """
-    return f"{action}:{layer_name}"
 
+    def __init__(self, status_code: int, response: ChatResponse) -> None:
+        super().__init__(response.error)
+        self.status_code = status_code
+        self.response = response
 
-@tool
-def query_features_by_attribute(layer_name: str, field: str, operator: str, value: str) -> str:
-    """
-    按属性选择要素（前端执行）。
-    输入参数：
-      - layer_name: string 图层名称
-      - field: string 属性字段名
-      - operator: string 比较操作符 '='|'!='|'>'|'>='|'<'|'<='|'like'
-      - value: string 查询值
-    业务处理：
-      - 后端不直接操作地图，仅返回查询参数供前端执行
-    输出数据格式：
-      - string: 格式 "query:layer_name:field:operator:value"
-    """
-    return f"query:{layer_name}:{field}:{operator}:{value}"
 
+def _upstream_error_message(error: BaseException) -> str:
+    """上游错误的对外描述（流式 error 事件与非流式错误响应共用）"""
+    return f"LLM调用失败: {type(error).__name__}: {error}"
 
-@tool
-def save_query_results_as_layer(layer_name: str) -> str:
-    """
-    保存查询结果为新图层（前端执行）。
-    输入参数：
-      - layer_name: string 新图层名称
-    业务处理：
-      - 后端不直接操作地图，仅返回保存参数供前端执行
-    输出数据格式：
-      - string: 格式 "save_layer:layer_name"
-    """
-    print(f"[DEBUG] save_query_results_as_layer 被调用，参数: {layer_name}")
-    return f"保存操作已发送到前端，图层名称：{layer_name}"
 
+def _upstream_failure(error: BaseException, data: Optional[Dict[str, Any]] = None) -> UpstreamFailure:
+    status_code = 503 if is_retryable(error) else 502
+    return UpstreamFailure(status_code, ChatResponse(success=False, data=data, error=_upstream_error_message(error)))
 
-@tool
-def export_query_results_as_json(file_name: str) -> str:
-    """
-    导出查询结果为GeoJSON文件（前端执行）。
-    输入参数：
-      - file_name: string 文件名（不包含扩展名）
-    业务处理：
-      - 后端不直接操作地图，仅返回导出指令供前端执行
-    输出数据格式：
-      - string: 格式 "export_json:file_name"
-    """
-    return f"导出操作已发送到前端，文件名：{file_name}"
 
+_BASE_DIR = Path(__file__).resolve().parent
 
-@tool
-def execute_buffer_analysis(layer_name: str, radius: float, unit: str = "meters") -> str:
-    """
-    执行缓冲区分析（前端执行）。
-    输入参数：
-      - layer_name: string 图层名称
-      - radius: float 缓冲区半径
-      - unit: string 单位（默认meters）
-    业务处理：
-      - 后端不直接操作地图，仅返回分析参数供前端执行
-    输出数据格式：
-      - string: 格式 "buffer_analysis:layer_name:radius:unit"
-    """
-    return f"缓冲区分析操作已发送到前端，图层：{layer_name}，半径：{radius}{unit}"
+# 系统提示词文件（可选）：存在时作为前言放在内置工具说明与规则之前，首次访问时读取，之后按 mtime 热重载
+_system_prompt_file = PromptFile(
+    [_BASE_DIR / "prompt" / "tools.md", _BASE_DIR / "tools.md"],
+    check_interval=settings.prompt_reload_interval,
+)
 
 
-@tool
-def execute_intersection_analysis(target_layer_name: str, mask_layer_name: str) -> str:
-    """
-    执行相交分析（前端执行）。
-    输入参数：
-      - target_layer_name: string 目标图层名称
-      - mask_layer_name: string 掩膜图层名称
-    业务处理：
-      - 后端不直接操作地图，仅返回分析参数供前端执行
-    输出数据格式：
-      - string: 格式 "intersection_analysis:target_layer_name:mask_layer_name"
-    """
-    return f"相交分析操作已发送到前端，目标图层：{target_layer_name}，掩膜图层：{mask_layer_name}"
+def load_system_prompt() -> str:
+    """加载系统提示词文件，优先从prompt/tools.md读取（缓存，文件修改后自动重载；文件不存在时为空）"""
+    return _system_prompt_file.read()
 
 
-@tool
-def execute_erase_analysis(target_layer_name: str, erase_layer_name: str) -> str:
-    """
-    执行擦除分析（前端执行）。
-    输入参数：
-      - target_layer_name: string 目标图层名称
-      - erase_layer_name: string 擦除图层名称
-    业务处理：
-      - 后端不直接操作地图，仅返回分析参数供前端执行
-    输出数据格式：
-      - string: 格式 "erase_analysis:target_layer_name:erase_layer_name"
-    """
-    return f"擦除分析操作已发送到前端，目标图层：{target_layer_name}，擦除图层：{erase_layer_name}"
+router = APIRouter(prefix="/agent", tags=["agent"])
 
+# 会话图层操作历史：conversation_id -> ["action:layer_id", ...]，按配置使用内存或 Redis 存储
+_history_store = create_history_store()
 
-@tool
-def execute_shortest_path_analysis(start_layer_name: str, end_layer_name: str, obstacle_layer_name: str = "") -> str:
-    """
-    执行最短路径分析（前端执行）。
-    输入参数：
-      - start_layer_name: string 起点图层名称
-      - end_layer_name: string 终点图层名称
-      - obstacle_layer_name: string 障碍物图层名称（可选）
-    业务处理：
-      - 后端不直接操作地图，仅返回分析参数供前端执行
-    输出数据格式：
-      - string: 格式 "shortest_path_analysis:start_layer_name:end_layer_name:obstacle_layer_name"
-    """
-    obstacle_info = f"，障碍物图层：{obstacle_layer_name}" if obstacle_layer_name else ""
-    return f"最短路径分析操作已发送到前端，起点图层：{start_layer_name}，终点图层：{end_layer_name}{obstacle_info}"
 
+class ToolChatRequest(BaseModel):
+    model: str
+    temperature: float
+    prompt: str
+    stream: bool = False
+    conversation_id: str = "default"
+    summarize: bool = False  # 为 true 时前端执行工具也走第二次LLM调用生成回答
+    debug: bool = False  # 为 true 时在 data.debug 中返回各阶段耗时、LLM调用模型与token数
 
-# ===== 4个分析功能的导出和保存工具函数 =====
 
-@tool
-def save_buffer_results_as_layer(layer_name: str) -> Dict[str, Any]:
+def _templated_answer(req: ToolChatRequest, tool_calls: List[Dict[str, Any]]) -> Optional[str]:
     """
-    保存缓冲区分析结果为图层（前端执行）。
+    前端执行工具的快速回答。
     输入参数：
-      - layer_name: string 新图层名称
-    业务处理：
-      - 后端不直接操作地图，仅返回保存参数供前端执行
+      - req: 工具调用请求，summarize=true 时不使用快速回答
+      - tool_calls: 第一步调用返回的全部工具调用
     输出数据格式：
-      - { action: 'buffer.save_layer', params: { layer_name: string } }
-    """
-    print(f"[DEBUG] save_buffer_results_as_layer 被调用，参数: {layer_name}")
-    return {"action": "buffer.save_layer", "params": {"layer_name": layer_name}}
+      - string: 与第二步调用回复规则一致的模板回答（多个工具按调用顺序以逗号连接）；
+        任一工具不适用快速路径时返回 None
+    """
+    if req.summarize:
+        return None
+    answers: List[str] = []
+    for tool_call in tool_calls:
+        spec = map_tool_registry.get(tool_call.get("name", ""))
+        if spec is None or not spec.frontend_executed:
+            return None
+        answer = spec.render_answer(tool_call.get("args", {}))
+        if answer not in answers:
+            answers.append(answer)
+    return "，".join(answers)
+
+
+# 工具说明由注册表生成，启动时计算一次
+_CALL_TOOLS_PROMPT = map_tool_registry.prompt_section("call")
+_REPLY_TOOLS_PROMPT = map_tool_registry.prompt_section("reply")
+
+# 内置系统提示词：启动时构建一次，与提示词文件内容拼成静态前缀（见 _system_prompts），会话历史等动态内容追加在末尾，以命中上游前缀缓存
+_CALL_SYSTEM_PROMPT = (
+    f"你有{len(map_tool_registry)}个工具，分为三组：\n\n"
+    "=== 重要：上下文记忆规则 ===\n"
+    "你必须记住当前对话中最近执行的分析操作类型。当用户说'保存为图层'、'导出为JSON'等操作时：\n"
+    "- 如果最近执行了缓冲区分析 → 使用save_buffer_results_as_layer或export_buffer_results_as_json\n"
+    "- 如果最近执行了相交分析 → 使用save_intersection_results_as_layer或export_intersection_results_as_json\n"
+    "- 如果最近执行了擦除分析 → 使用save_erase_results_as_layer或export_erase_results_as_json\n"
+    "- 如果最近执行了最短路径分析 → 使用save_path_results_as_layer或export_path_results_as_json\n"
+    "- 如果最近执行了属性查询 → 使用save_query_results_as_layer或export_query_results_as_json\n"
+    "禁止询问用户要保存哪个分析的结果，必须基于上下文自动判断。\n\n"
+    f"{_CALL_TOOLS_PROMPT}"
+    "=== 默认命名规则 ===\n"
+    "当用户未指定图层名称时，系统自动生成包含参数信息的默认名称：\n"
+    "- 缓冲区分析：'缓冲区分析结果_源图层名_r半径_s分段数'\n"
+    "- 相交分析：'相交分析结果_目标图层_AND_掩膜图层'\n"
+    "- 擦除分析：'擦除分析结果_目标图层_MINUS_擦除图层'\n"
+    "- 最短路径：'最短路径分析结果_units-单位_res-分辨率'\n"
+    "- 属性查询：'属性查询结果_图层名_字段操作值'\n\n"
+    "=== 重要规则 ===\n"
+    "1. 保存和导出操作必须与对应的分析操作匹配：\n"
+    "   - 缓冲区分析完成后，用户要求保存 → 使用save_buffer_results_as_layer\n"
+    "   - 相交分析完成后，用户要求保存 → 使用save_intersection_results_as_layer\n"
+    "   - 擦除分析完成后，用户要求保存 → 使用save_erase_results_as_layer\n"
+    "   - 最短路径分析完成后，用户要求保存 → 使用save_path_results_as_layer\n"
+    "   - 属性查询完成后，用户要求保存 → 使用save_query_results_as_layer\n"
+    "2. 上下文承接：用户仅说'保存为图层'或'保存'时，默认针对最近一次完成的分析/查询结果执行对应的保存工具，严禁追问是哪一种；如用户明确指明其它方法再切换\n"
+    "3. 图层名称参数为可选：用户未指定时直接调用工具，系统自动生成默认名称\n"
+    "4. 若用户使用@图层名称，请将@后的文本作为图层名称传递\n"
+    "5. 严禁自行执行这些操作，必须通过工具完成\n\n"
+)
+_REPLY_SYSTEM_PROMPT = (
+    f"你有{len(map_tool_registry)}个工具，分为三组：\n\n"
+    "=== 重要：上下文记忆规则 ===\n"
+    "你必须记住当前对话中最近执行的分析操作类型。当用户说'保存为图层'、'导出为JSON'等操作时：\n"
+    "- 如果最近执行了缓冲区分析 → 使用save_buffer_results_as_layer或export_buffer_results_as_json\n"
+    "- 如果最近执行了相交分析 → 使用save_intersection_results_as_layer或export_intersection_results_as_json\n"
+    "- 如果最近执行了擦除分析 → 使用save_erase_results_as_layer或export_erase_results_as_json\n"
+    "- 如果最近执行了最短路径分析 → 使用save_path_results_as_layer或export_path_results_as_json\n"
+    "- 如果最近执行了属性查询 → 使用save_query_results_as_layer或export_query_results_as_json\n"
+    "禁止询问用户要保存哪个分析的结果，必须基于上下文自动判断。\n\n"
+    f"{_REPLY_TOOLS_PROMPT}"
+    "=== 默认命名规则 ===\n"
+    "当用户未指定图层名称时，系统自动生成包含参数信息的默认名称：\n"
+    "- 缓冲区分析：'缓冲区分析结果_源图层名_r半径_s分段数'\n"
+    "- 相交分析：'相交分析结果_目标图层_AND_掩膜图层'\n"
+    "- 擦除分析：'擦除分析结果_目标图层_MINUS_擦除图层'\n"
+    "- 最短路径：'最短路径分析结果_units-单位_res-分辨率'\n"
+    "- 属性查询：'属性查询结果_图层名_字段操作值'\n\n"
+    "=== 重要规则 ===\n"
+    "1. 保存和导出操作必须与对应的分析操作匹配：\n"
+    "   - 缓冲区分析完成后，用户要求保存 → 使用save_buffer_results_as_layer\n"
+    "   - 相交分析完成后，用户要求保存 → 使用save_intersection_results_as_layer\n"
+    "   - 擦除分析完成后，用户要求保存 → 使用save_erase_results_as_layer\n"
+    "   - 最短路径分析完成后，用户要求保存 → 使用save_path_results_as_layer\n"
+    "   - 属性查询完成后，用户要求保存 → 使用save_query_results_as_layer\n"
+    "2. 图层名称参数为可选：用户未指定时直接调用工具，系统自动生成默认名称\n"
+    "3. 若用户使用@图层名称，请将@后的文本作为图层名称传递\n"
+    "4. 严禁自行执行这些操作，必须通过工具完成\n\n"
+    "=== 回复规则 ===\n"
+    "当工具执行完成后，必须简洁回复，禁止废话：\n"
+    "- 查询操作：直接说'正在执行请稍后'\n"
+    "- 图层操作：直接说'图层已显示/隐藏'\n"
+    "- 保存操作：直接说'正在执行请稍后'\n"
+    "- 导出操作：直接说'正在执行请稍后'\n"
+    "- 缓冲区分析：直接说'正在执行请稍后'\n"
+    "- 相交分析：直接说'正在执行请稍后'\n"
+    "- 擦除分析：直接说'正在执行请稍后'\n"
+    "- 最短路径分析：直接说'正在执行请稍后'\n"
+    "严禁说'看起来'、'可能'、'如果'、'请确认'等不确定词汇。\n"
+    "严禁解释系统工作原理或引导用户查看界面。\n"
+    "严禁回复具体的要素数量或详细结果。\n"
+    "严禁编造或猜测操作结果。\n"
+    "只回复'正在执行请稍后'或简单的操作状态，一句话结束。"
+)
 
 
-@tool
-def export_buffer_results_as_json(file_name: str) -> Dict[str, Any]:
-    """
-    导出缓冲区分析结果为GeoJSON文件（前端执行）。
-    输入参数：
-      - file_name: string 文件名（不包含扩展名）
-    业务处理：
-      - 后端不直接操作地图，仅返回导出指令供前端执行
-    输出数据格式：
-      - { action: 'buffer.export_json', params: { file_name: string } }
-    """
-    return {"action": "buffer.export_json", "params": {"file_name": file_name}}
+
+@lru_cache(maxsize=4)
+def _compose_system_prompts(preamble: str) -> Tuple[str, str, int]:
+    """提示词文件内容 + 内置提示词，按文件内容缓存（文件未修改时每次请求得到相同的静态前缀）"""
+    prefix = f"{preamble.strip()}\n\n" if preamble.strip() else ""
+    call_prompt = prefix + _CALL_SYSTEM_PROMPT
+    return call_prompt, prefix + _REPLY_SYSTEM_PROMPT, estimate_tokens(call_prompt)
 
 
-@tool
-def save_intersection_results_as_layer(layer_name: str) -> Dict[str, Any]:
+def _system_prompts() -> Tuple[str, str, int]:
     """
-    保存相交分析结果为图层（前端执行）。
-    输入参数：
-      - layer_name: string 新图层名称
-    业务处理：
-      - 后端不直接操作地图，仅返回保存参数供前端执行
+    当前的静态系统提示词。
     输出数据格式：
-      - { action: 'intersection.save_layer', params: { layer_name: string } }
+      - (第一步调用提示词, 第二步调用提示词, 第一步调用提示词token数)；系统提示词文件修改后自动生效
     """
-    return {"action": "intersection.save_layer", "params": {"layer_name": layer_name}}
+    return _compose_system_prompts(load_system_prompt())
 
+# 会话历史压缩：最近 N 条原样保留，其余按分析类型汇总
+_history_compactor = HistoryCompactor(
+    keep_recent=settings.history_keep_recent,
+    max_tokens=settings.history_max_tokens,
+)
 
-@tool
-def export_intersection_results_as_json(file_name: str) -> Dict[str, Any]:
-    """
-    导出相交分析结果为GeoJSON文件（前端执行）。
-    输入参数：
-      - file_name: string 文件名（不包含扩展名）
-    业务处理：
-      - 后端不直接操作地图，仅返回导出指令供前端执行
-    输出数据格式：
-      - { action: 'intersection.export_json', params: { file_name: string } }
-    """
-    return {"action": "intersection.export_json", "params": {"file_name": file_name}}
+# 工具决策缓存：规范化指令 + 会话状态 + 模型 -> 工具调用（跨会话共享，只缓存参数完全取自指令的决策）
+_response_cache = ResponseCache(
+    max_size=settings.response_cache_size,
+    ttl=settings.response_cache_ttl,
+)
+
+# 提示词缓存统计按上游调用计数（合并的相同请求只计一次）
+upstream_limiter.add_listener(prompt_cache_stats.record)
+
+# 已绑定工具的模型缓存：按 (model, temperature, max_tokens) 复用，共享 keep-alive 连接池
+_model_registry = ChatModelRegistry(
+    tools=map_tool_registry.tools,
+    max_size=settings.model_cache_size,
+)
+
+# 模型池：回退链 + 对冲请求；对冲时只采用工具名称均已注册的结果
+_model_pool = ModelPool(
+    _model_registry,
+    fallback_models=settings.fallback_list(),
+    validate=lambda message: all(call.get("name") in map_tool_registry for call in message.tool_calls),
+)
+
+
+def _build_first_messages(req: ToolChatRequest, history_list: List[str]) -> List[Any]:
+    """构建第一步调用的消息：系统提示词（含会话历史）+ 用户问题"""
+    # 会话历史token预算：不超过历史上限，且静态提示词 + 用户问题 + 历史不超过提示词总上限
+    call_prompt, _, call_prompt_tokens = _system_prompts()
+    history_budget = settings.max_prompt_tokens - call_prompt_tokens - estimate_tokens(req.prompt)
+    history = _history_compactor.compact(history_list, max_tokens=history_budget)
+    history_text = history.history_text
+    last_action_text = history.last_action_text
+    dynamic_suffix = (
+        f"历史操作(顺序, 最新在下):\n{history_text}\n"
+        f"最近一次操作: {last_action_text}。若用户问'刚才做了什么'，请直接依据最近几次操作回答。"
+    )
+    return [
+        build_system_message(call_prompt, dynamic_suffix),
+        HumanMessage(content=req.prompt)
+    ]
 
 
-@tool
-def save_erase_results_as_layer(layer_name: str) -> Dict[str, Any]:
+async def _run_tool_call(tool_call: Dict[str, Any]) -> Any:
+    """执行单个工具调用，返回工具结果"""
+    return await map_tool_registry.ainvoke(tool_call.get("name", ""), tool_call.get("args", {}))
+
+
+def _history_entry(tool_result: Any) -> str:
+    """工具结果转换为会话历史条目"""
+    # 记录历史：优先记录action；若保存/导出操作，按分析类型归档
+    if isinstance(tool_result, dict) and "action" in tool_result:
+        return str(tool_result.get("action"))
+    return tool_result if isinstance(tool_result, str) else str(tool_result)
+
+
+async def _execute_tool_calls(conversation_id: str, tool_calls: List[Dict[str, Any]]) -> List[Any]:
     """
-    保存擦除分析结果为图层（前端执行）。
-    输入参数：
-      - layer_name: string 新图层名称
+    执行一轮中的全部工具调用。
     业务处理：
-      - 后端不直接操作地图，仅返回保存参数供前端执行
+      - 各工具调用相互独立，并发执行；单个工具失败不影响其它工具
+      - 结果与会话历史均按模型返回的调用顺序记录
     输出数据格式：
-      - { action: 'erase.save_layer', params: { layer_name: string } }
+      - list: 与 tool_calls 一一对应的工具结果
     """
-    return {"action": "erase.save_layer", "params": {"layer_name": layer_name}}
+    outcomes = await asyncio.gather(*(_run_tool_call(call) for call in tool_calls), return_exceptions=True)
+    tool_results: List[Any] = []
+    for call, outcome in zip(tool_calls, outcomes):
+        if isinstance(outcome, Exception):
+            outcome = f"工具执行失败: {call.get('name', '')}: {outcome}"
+        tool_results.append(outcome)
+    await _history_store.extend(conversation_id, [_history_entry(result) for result in tool_results])
+    return tool_results
+
+
+def _tool_messages(tool_calls: List[Dict[str, Any]], tool_results: List[Any]) -> List[ToolMessage]:
+    """将工具结果转换为回传给模型的 ToolMessage 列表"""
+    return [
+        ToolMessage(content=str(result), tool_call_id=call["id"])
+        for call, result in zip(tool_calls, tool_results)
+    ]
 
 
-@tool
-def export_erase_results_as_json(file_name: str) -> Dict[str, Any]:
+def _tool_chat_data(tool_calls: List[Dict[str, Any]], tool_results: List[Any], final_answer: Any) -> Dict[str, Any]:
     """
-    导出擦除分析结果为GeoJSON文件（前端执行）。
-    输入参数：
-      - file_name: string 文件名（不包含扩展名）
-    业务处理：
-      - 后端不直接操作地图，仅返回导出指令供前端执行
-    输出数据格式：
-      - { action: 'erase.export_json', params: { file_name: string } }
+    组装 tool-chat 响应数据。
+    tool_result 保留第一个工具的结果以兼容旧前端，tool_results 为全部工具结果。
     """
-    return {"action": "erase.export_json", "params": {"file_name": file_name}}
+    return {
+        "first_call": {"tool_calls": tool_calls},
+        "tool_result": tool_results[0] if tool_results else None,
+        "tool_results": tool_results,
+        "final_answer": final_answer,
+    }
+
+
+def _build_final_messages(req: ToolChatRequest, first_ai: AIMessage, tool_messages: List[ToolMessage]) -> List[Any]:
+    """构建第二步调用的消息：回复规则提示词 + 用户问题 + 工具调用与结果"""
+    return [
+        build_system_message(_system_prompts()[1]),
+        HumanMessage(content=req.prompt),
+        first_ai,
+        *tool_messages,
+    ]
 
 
-@tool
-def save_path_results_as_layer(layer_name: str) -> Dict[str, Any]:
+def _local_decision(req: ToolChatRequest, history_list: List[str]) -> Optional[Tuple[List[Dict[str, Any]], str]]:
     """
-    保存最短路径分析结果为图层（前端执行）。
-    输入参数：
-      - layer_name: string 新图层名称
+    无需LLM的工具决策。
     业务处理：
-      - 后端不直接操作地图，仅返回保存参数供前端执行
+      - 本地意图路由：高置信度解析出工具调用时直接采用
+      - 工具决策缓存：相同指令在相同会话状态下复用之前的工具调用（仅缓存参数完全取自指令的决策）
     输出数据格式：
-      - { action: 'path.save_layer', params: { layer_name: string } }
+      - (tool_calls, 决策来源 'intent_router'|'response_cache')；均未命中时返回 None
     """
-    return {"action": "path.save_layer", "params": {"layer_name": layer_name}}
+    if req.summarize:
+        return None
+    if settings.intent_router_enabled:
+        match = route_intent(req.prompt, history_list)
+        if match is not None and match.confidence >= settings.intent_router_min_confidence:
+            return match.tool_calls, "intent_router"
+    if settings.response_cache_enabled:
+        cached = _response_cache.get(req.prompt, _decision_state(history_list), req.model)
+        if cached is not None:
+            return cached, "response_cache"
+    return None
+
+
+def _decision_state(history_list: List[str]) -> str:
+    """影响工具选择的会话状态：最近一次可保存/导出结果的分析类型（按历史条目开头的动作识别，与本地意图路由一致）"""
+    return latest_analysis_type(history_list) or ""
 
 
-@tool
-def export_path_results_as_json(file_name: str) -> Dict[str, Any]:
+def _remember_decision(req: ToolChatRequest, history_list: List[str], tool_calls: List[Dict[str, Any]]) -> None:
+    """缓存可由模板直接回答的工具决策"""
+    if settings.response_cache_enabled and _templated_answer(req, tool_calls) is not None:
+        _response_cache.put(req.prompt, _decision_state(history_list), req.model, tool_calls)
+
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _sse_event(event: str, data: Any) -> str:
+    """编码一条 server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _sse_stream(events: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[str]:
+    """将智能体事件编码为 SSE 流"""
+    async for event, data in events:
+        yield _sse_event(event, data)
+
+
+def _prompt_too_long(req: ToolChatRequest) -> bool:
+    """提示词（静态前缀 + 用户输入）是否超出总上限"""
+    return _system_prompts()[2] + estimate_tokens(req.prompt) > settings.max_prompt_tokens
+
+
+def _tool_actions(tool_calls: List[Dict[str, Any]], tool_results: List[Any]) -> List[Dict[str, Any]]:
     """
-    导出最短路径分析结果为GeoJSON文件（前端执行）。
-    输入参数：
-      - file_name: string 文件名（不包含扩展名）
-    业务处理：
-      - 后端不直接操作地图，仅返回导出指令供前端执行
+    结构化工具动作，前端可直接按参数执行，无需解析 tool_result 字符串。
     输出数据格式：
-      - { action: 'path.export_json', params: { file_name: string } }
-    """
-    return {"action": "path.export_json", "params": {"file_name": file_name}}
+      - [ { tool, args, frontend_executed, result } ]，顺序与工具调用一致
+    """
+    actions: List[Dict[str, Any]] = []
+    for tool_call, result in zip(tool_calls, tool_results):
+        spec = map_tool_registry.get(tool_call.get("name", ""))
+        actions.append({
+            "tool": tool_call.get("name"),
+            "args": tool_call.get("args", {}),
+            "frontend_executed": spec is not None and spec.frontend_executed,
+            "result": result,
+        })
+    return actions
+
+
+def _tool_call_event(tool_calls: List[Dict[str, Any]], tool_results: List[Any]) -> Dict[str, Any]:
+    """tool_call 事件数据：兼容字段 + 结构化工具动作"""
+    return {
+        "first_call": {"tool_calls": tool_calls},
+        "tool_result": tool_results[0] if tool_results else None,
+        "tool_results": tool_results,
+        "actions": _tool_actions(tool_calls, tool_results),
+    }
 
 
-def load_system_prompt() -> str:
-    """加载系统提示词，优先从prompt/tools.md读取"""
-    base = Path(__file__).resolve().parent
-    prompt_path = base / "prompt" / "tools.md"
-    if not prompt_path.exists():
-        prompt_path = base / "tools.md"
+async def _agent_events(req: ToolChatRequest) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    流式工具调用事件（SSE 与 WebSocket 共用）。
+    事件类型：
+      - token: { content: string } 模型回答片段（无工具调用时来自第一步，否则来自第二步）
+      - tool_call: { first_call: { tool_calls }, tool_result, tool_results, actions } 第一步调用完成且工具执行后立即推送
+      - done: 与非流式接口相同的 data 结构（debug=true 时附带 debug 耗时分解）
+      - error: { error: string }
+    """
+    with trace_request("tool_chat_stream") as trace:
+        async for event, data in _agent_event_stream(req):
+            if event == "done" and req.debug:
+                data = {**data, "debug": trace.to_dict()}
+            yield event, data
+
+
+async def _agent_event_stream(req: ToolChatRequest) -> AsyncIterator[Tuple[str, Any]]:
+    """流式工具调用流程（事件定义见 _agent_events），各阶段记录到当前请求的耗时分解"""
+    if _prompt_too_long(req):
+        yield "error", {"error": "输入内容过长，超出提示词长度上限"}
+        return
+    with stage("history_load"):
+        history_list = await _history_store.get(req.conversation_id)
+    with stage("local_decision"):
+        decision = _local_decision(req, history_list)
+    if decision is not None:
+        tool_calls, source = decision
+        with stage("tools"):
+            tool_results = await _execute_tool_calls(req.conversation_id, tool_calls)
+        data = _tool_chat_data(tool_calls, tool_results, _templated_answer(req, tool_calls))
+        data["decision_source"] = source
+        yield "tool_call", _tool_call_event(tool_calls, tool_results)
+        yield "token", {"content": data["final_answer"]}
+        yield "done", data
+        return
+    try:
+        with stage("prompt_assembly"):
+            first_messages = _build_first_messages(req, history_list)
+        first_ai: Optional[AIMessageChunk] = None
+        with stage("llm_first"):
+            async for chunk in _model_pool.astream(req.model, req.temperature, first_messages):
+                first_ai = chunk if first_ai is None else first_ai + chunk
+                if chunk.content:
+                    yield "token", {"content": chunk.content}
+        if first_ai is None or not first_ai.tool_calls:
+            final_answer = first_ai.content if first_ai is not None else ""
+            yield "done", _tool_chat_data([], [], final_answer)
+            return
+        tool_calls = first_ai.tool_calls
+        _remember_decision(req, history_list, tool_calls)
+        with stage("tools"):
+            tool_results = await _execute_tool_calls(req.conversation_id, tool_calls)
+        yield "tool_call", _tool_call_event(tool_calls, tool_results)
+        templated = _templated_answer(req, tool_calls)
+        if templated is not None:
+            yield "token", {"content": templated}
+            yield "done", _tool_chat_data(tool_calls, tool_results, templated)
+            return
+        final_ai: Optional[AIMessageChunk] = None
+        with stage("llm_final"):
+            async for chunk in _model_pool.astream(req.model, req.temperature, _build_final_messages(req, first_ai, _tool_messages(tool_calls, tool_results))):
+                final_ai = chunk if final_ai is None else final_ai + chunk
+                if chunk.content:
+                    yield "token", {"content": chunk.content}
+        yield "done", _tool_chat_data(tool_calls, tool_results, final_ai.content if final_ai is not None else "")
+    except asyncio.TimeoutError:
+        yield "error", {"error": "LLM调用超时"}
+    except Exception as e:
+        # 回退链耗尽、工具注册表异常等：以 error 事件结束流，客户端不会只看到连接中断
+        yield "error", {"error": _upstream_error_message(e)}
+
+
+@router.post("/tool-chat", response_model=ChatResponse)
+async def tool_chat(req: ToolChatRequest, request: Request):
+    """
+    LangChain 工具调用接口（仅保留图层可见性工具）：
+    输入数据格式：
+      - model: LLM 模型名称
+      - temperature: 采样温度
+      - prompt: 用户问题（例如 What's 5 times forty two）
+      - stream: 是否流式（true 时返回 text/event-stream）
+      - summarize: 是否对前端执行工具仍进行第二步调用（默认 false）
+      - debug: 是否返回耗时分解（默认 false）
+    数据处理方法：
+      - 本地意图路由：'打开@图层'、'导出为JSON'、'保存为图层'等固定指令直接解析为工具调用，不请求LLM
+      - 工具决策缓存：重复指令在相同会话状态下复用缓存的工具调用，不请求LLM
+      - 从进程级缓存获取按 (model, temperature) 绑定工具的 OpenAI 兼容模型，经模型池调用（上游报错时按回退链换模型，可选对冲请求）
+      - 第一步调用：发送 HumanMessage(prompt)，获取包含 tool_calls 的 AIMessage
+        （会话历史按token预算压缩后注入；提示词超出总上限时直接拒绝）
+      - 执行工具：通过工具注册表按名称分发，并发执行 AIMessage 中的全部工具调用，按调用顺序得到结果
+      - 第二步调用：将全部工具结果以 ToolMessage 形式一次性回传给模型，生成最终回答
+      - 前端执行工具默认跳过第二步调用，直接返回模板回答（summarize=true 时保留第二步调用）
+      - 两次调用均为异步调用（ainvoke），带超时控制，客户端断开时取消上游请求
+      - 流式模式：第一步调用完成后立即推送 tool_call 事件，随后逐片推送最终回答 token
+    输出数据格式：
+      - { success: true, data: { first_call: AIMessage(JSON), tool_result: string, tool_results: list, final_answer: string } }
+      - debug=true 时 data.debug: { total_ms, spans: [ { stage, start_ms, duration_ms } ], llm_calls, models, input_tokens, output_tokens }
+      - 上游报错（回退链耗尽等）：HTTP 503（限流/不可用）或 502，body 为 { success: false, data, error }
+      - 流式：SSE 事件 token / tool_call / done / error（事件定义见 _agent_events）
+    """
+    if not req.stream:
+        try:
+            return await _tool_chat_once(req, request)
+        except UpstreamFailure as e:
+            return JSONResponse(status_code=e.status_code, content=e.response.model_dump())
+    if _prompt_too_long(req):
+        return ChatResponse(success=False, error="输入内容过长，超出提示词长度上限")
+    return StreamingResponse(_sse_stream(_agent_events(req)), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
+async def _tool_chat_once(req: ToolChatRequest, request: Optional[Request] = None) -> ChatResponse:
+    """非流式执行一条指令：本地路由/决策缓存命中则直接执行工具，否则调用LLM；debug=true 时附带耗时分解"""
+    with trace_request("tool_chat") as trace:
+        response = await _tool_chat_pipeline(req, request)
+    if req.debug:
+        response.data = {**(response.data or {}), "debug": trace.to_dict()}
+    return response
+
+
+async def _tool_chat_pipeline(req: ToolChatRequest, request: Optional[Request] = None) -> ChatResponse:
+    if _prompt_too_long(req):
+        return ChatResponse(success=False, error="输入内容过长，超出提示词长度上限")
+    with stage("history_load"):
+        history_list = await _history_store.get(req.conversation_id)
+    with stage("local_decision"):
+        decision = _local_decision(req, history_list)
+    if decision is not None:
+        tool_calls, source = decision
+        with stage("tools"):
+            tool_results = await _execute_tool_calls(req.conversation_id, tool_calls)
+        data = _tool_chat_data(tool_calls, tool_results, _templated_answer(req, tool_calls))
+        data["decision_source"] = source
+        return ChatResponse(success=True, data=data)
+    return await _run_tool_chat(req, history_list, request)
+
+
+async def _run_tool_chat(req: ToolChatRequest, history_list: List[str], request: Optional[Request] = None) -> ChatResponse:
+    """非流式工具调用流程：第一步调用 -> 执行工具 -> 模板回答或第二步调用"""
+    with stage("prompt_assembly"):
+        first_messages = _build_first_messages(req, history_list)
     try:
-        content = prompt_path.read_text(encoding="utf-8")
-        print(f"✅ 成功加载系统提示词: {prompt_path}")
-        return content
+        with stage("llm_first"):
+            first_ai: AIMessage = await _model_pool.ainvoke(req.model, req.temperature, first_messages, request)
+    except asyncio.TimeoutError:
+        return ChatResponse(success=False, error="LLM调用超时")
+    except ClientDisconnected:
+        return ChatResponse(success=False, error="客户端已断开连接")
     except Exception as e:
-        print(f"⚠️ 加载系统提示词失败: {e}")
-        return "You are a helpful spatial analysis assistant."
-
-def load_tools_prompt() -> str:
-    base = Path(__file__).resolve().parent
-    # 优先使用独立工具提示词文件 agent/tools/tools.md
-    tools_path = base / "tools" / "tools.md"
-    if not tools_path.exists():
-        # 回退到 prompt/tools.md（如果存在）
-        tools_path = base / "prompt" / "tools.md"
+        raise _upstream_failure(e) from e
+    if not first_ai.tool_calls:
+        return ChatResponse(success=True, data=_tool_chat_data([], [], first_ai.content))
+    tool_calls = first_ai.tool_calls
+    _remember_decision(req, history_list, tool_calls)
+    with stage("tools"):
+        tool_results = await _execute_tool_calls(req.conversation_id, tool_calls)
+    templated = _templated_answer(req, tool_calls)
+    if templated is not None:
+        return ChatResponse(success=True, data=_tool_chat_data(tool_calls, tool_results, templated))
     try:
-        return tools_path.read_text(encoding="utf-8")
-    except Exception:
-        return ""
+        with stage("llm_final"):
+            final_ai: AIMessage = await _model_pool.ainvoke(req.model, req.temperature, _build_final_messages(req, first_ai, _tool_messages(tool_calls, tool_results)), request)
+    except asyncio.TimeoutError:
+        return ChatResponse(success=False, data=_tool_chat_data(tool_calls, tool_results, None), error="LLM调用超时")
+    except ClientDisconnected:
+        return ChatResponse(success=False, error="客户端已断开连接")
+    except Exception as e:
+        raise _upstream_failure(e, _tool_chat_data(tool_calls, tool_results, None)) from e
+    return ChatResponse(success=True, data=_tool_chat_data(tool_calls, tool_results, final_ai.content))
 
 
-router = APIRouter(prefix="/agent", tags=["agent"])
+class ToolChatBatchRequest(BaseModel):
+    model: str
+    temperature: float
+    prompts: List[str] = Field(..., min_length=1)
+    conversation_id: str = "default"
+    summarize: bool = False
+    debug: bool = False
+    concurrency: int = Field(1, ge=1, le=16, description="并发数；1 表示按顺序执行，后一条指令可依赖前一条的会话历史")
+    stop_on_error: bool = False
 
-# 会话图层操作历史：conversation_id -> ["action:layer_id", ...]
-_conversation_layer_history: Dict[str, List[str]] = {}
 
+@router.post("/tool-chat/batch", response_model=ChatResponse)
+async def tool_chat_batch(req: ToolChatBatchRequest, request: Request):
+    """
+    批量工具调用接口（脚本化指令回放、回归检查）：
+    输入数据格式：
+      - model / temperature / conversation_id / summarize: 同 /agent/tool-chat
+      - prompts: 指令列表
+      - concurrency: 并发数（默认 1，按顺序执行）
+      - stop_on_error: 某条指令失败后是否跳过剩余指令
+    数据处理方法：
+      - 每条指令走与 /agent/tool-chat 相同的流程（本地路由/缓存/LLM），由信号量控制并发
+    输出数据格式：
+      - { success: 全部成功, data: { results: [ { index, prompt, success, data, error } ] } }，结果顺序与 prompts 一致
+    """
+    if len(req.prompts) > settings.batch_max_prompts:
+        return ChatResponse(success=False, error=f"单次批量指令数不能超过 {settings.batch_max_prompts}")
+    semaphore = asyncio.Semaphore(req.concurrency)
+    failed = asyncio.Event()
+
+    async def run(index: int, prompt: str) -> Dict[str, Any]:
+        async with semaphore:
+            if req.stop_on_error and failed.is_set():
+                return {"index": index, "prompt": prompt, "success": False, "data": None, "error": "已跳过：前序指令执行失败"}
+            single = ToolChatRequest(
+                model=req.model,
+                temperature=req.temperature,
+                prompt=prompt,
+                conversation_id=req.conversation_id,
+                summarize=req.summarize,
+                debug=req.debug,
+            )
+            try:
+                response = await _tool_chat_once(single, request)
+            except UpstreamFailure as e:
+                response = e.response
+            except Exception as e:
+                response = ChatResponse(success=False, error=str(e))
+            if not response.success:
+                failed.set()
+            return {"index": index, "prompt": prompt, "success": response.success, "data": response.data, "error": response.error}
+
+    results = await asyncio.gather(*(run(index, prompt) for index, prompt in enumerate(req.prompts)))
+    return ChatResponse(success=all(result["success"] for result in results), data={"results": results})
+
+
+class _AgentSocket:
+    """
+    单个 WebSocket 会话。
+    读取循环即时处理 ping / cancel，对话指令进入队列按顺序执行（保证同一会话的历史依赖顺序），
+    发送操作加锁串行化。
+    """
+
+    def __init__(self, websocket: WebSocket) -> None:
+        self.websocket = websocket
+        self._send_lock = asyncio.Lock()
+        self._queue: "asyncio.Queue[Tuple[Any, ToolChatRequest]]" = asyncio.Queue()
+        self._current: Optional[Tuple[Any, asyncio.Task]] = None
+        self._cancelled: set = set()
+
+    async def send(self, event: str, message_id: Any, data: Any = None) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps({"type": event, "id": message_id, "data": data}, ensure_ascii=False, default=str))
+
+    async def _run(self, message_id: Any, req: ToolChatRequest) -> None:
+        async for event, data in _agent_events(req):
+            await self.send(event, message_id, data)
+
+    async def _worker(self) -> None:
+        while True:
+            message_id, req = await self._queue.get()
+            if message_id is not None and message_id in self._cancelled:
+                self._cancelled.discard(message_id)
+                await self.send("cancelled", message_id)
+                continue
+            task = asyncio.ensure_future(self._run(message_id, req))
+            self._current = (message_id, task)
+            try:
+                await task
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+                await self.send("cancelled", message_id)
+            except Exception as e:
+                await self.send("error", message_id, {"error": str(e)})
+            finally:
+                self._current = None
+
+    async def _handle(self, message: Dict[str, Any]) -> None:
+        message_type = message.get("type", "chat")
+        message_id = message.get("id")
+        if message_type == "ping":
+            await self.send("pong", message_id)
+        elif message_type == "cancel":
+            if self._current is not None and self._current[0] == message_id:
+                self._current[1].cancel()
+            else:
+                self._cancelled.add(message_id)
+        elif message_type == "chat":
+            try:
+                req = ToolChatRequest(**{key: value for key, value in message.items() if key not in ("type", "id")})
+            except ValidationError as e:
+                await self.send("error", message_id, {"error": e.errors()})
+                return
+            await self._queue.put((message_id, req))
+        else:
+            await self.send("error", message_id, {"error": f"未知消息类型: {message_type}"})
+
+    async def serve(self) -> None:
+        worker = asyncio.ensure_future(self._worker())
+        try:
+            while True:
+                try:
+                    message = json.loads(await self.websocket.receive_text())
+                except json.JSONDecodeError:
+                    await self.send("error", None, {"error": "消息必须是JSON对象"})
+                    continue
+                if not isinstance(message, dict):
+                    await self.send("error", None, {"error": "消息必须是JSON对象"})
+                    continue
+                await self._handle(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            worker.cancel()
+            if self._current is not None:
+                self._current[1].cancel()
+
+
+@router.websocket("/ws")
+async def agent_socket(websocket: WebSocket):
+    """
+    智能体 WebSocket 通道（长连接，避免逐条指令的连接建立与 CORS 预检）：
+    客户端消息：
+      - { type: "chat", id, model, temperature, prompt, conversation_id, summarize } 对话指令，按接收顺序执行
+      - { type: "cancel", id } 取消正在执行或排队中的指令
+      - { type: "ping", id }
+    服务端推送：
+      - { type, id, data }，type 为 token / tool_call / done / error（与流式 SSE 事件一致）、
+        cancelled 或 pong；tool_call.data.actions 为结构化工具动作 [ { tool, args, frontend_executed, result } ]
+    """
+    await websocket.accept()
+    await _AgentSocket(websocket).serve()
+
+
+@router.get("/response-cache/stats", response_model=ChatResponse)
+async def response_cache_statistics():
+    """
+    工具决策缓存统计：
+    输出数据格式：
+      - { success: true, data: { size, max_size, ttl, hits, misses, evictions, rejected, hit_ratio } }
+        rejected: 参数依赖会话上下文、未写入缓存的决策数
+    """
+    return ChatResponse(success=True, data=_response_cache.stats())
 
-class ToolChatRequest(BaseModel):
+
+# 多步智能体循环，在应用生命周期内创建
+_agent_graph: Optional[AgentGraph] = None
+
+
+class AgentRunRequest(BaseModel):
     model: str
     temperature: float
     prompt: str
-    stream: bool = False
     conversation_id: str = "default"
+    run_id: Optional[str] = None
+    max_steps: int = Field(default_factory=lambda: settings.agent_max_steps, ge=1, le=20)
+    debug: bool = False
 
 
-@router.post("/tool-chat", response_model=ChatResponse)
-async def tool_chat(req: ToolChatRequest):
+async def _agent_call_model(messages: List[Any], options: Dict[str, Any]) -> AIMessage:
+    """智能体循环的模型调用：经模型池（限流、回退、对冲）"""
+    with stage("llm"):
+        return await _model_pool.ainvoke(options["model"], options["temperature"], messages)
+
+
+async def _agent_run_tools(tool_calls: List[Dict[str, Any]], options: Dict[str, Any]) -> List[ToolMessage]:
+    """智能体循环的工具执行：与 /agent/tool-chat 相同的分发与会话历史记录"""
+    with stage("tools"):
+        tool_results = await _execute_tool_calls(options["conversation_id"], tool_calls)
+    return _tool_messages(tool_calls, tool_results)
+
+
+def _agent_run_data(run: Dict[str, Any], max_steps: int) -> Dict[str, Any]:
     """
-    LangChain 工具调用接口（仅保留图层可见性工具）：
+    整理一次多步运行的结果。
+    输出数据格式：
+      - 与 tool-chat 相同的 first_call / tool_result / tool_results / final_answer（包含全部步骤的工具调用），
+        以及 run_id、resumed、steps: [ { tool_calls, tool_results } ]、actions
+    """
+    results_by_id = {message.tool_call_id: message.content for message in run["messages"] if isinstance(message, ToolMessage)}
+    steps: List[Dict[str, Any]] = []
+    tool_calls: List[Dict[str, Any]] = []
+    last_ai: Optional[AIMessage] = None
+    for message in run["messages"]:
+        if not isinstance(message, AIMessage):
+            continue
+        last_ai = message
+        if message.tool_calls and all(call["id"] in results_by_id for call in message.tool_calls):
+            step_results = [results_by_id[call["id"]] for call in message.tool_calls]
+            steps.append({"tool_calls": message.tool_calls, "tool_results": step_results})
+            tool_calls.extend(message.tool_calls)
+    tool_results = [result for step in steps for result in step["tool_results"]]
+    if last_ai is None:
+        final_answer = None
+    elif last_ai.tool_calls:
+        final_answer = f"已达到最大步数 {max_steps}，剩余工具调用未执行"
+    else:
+        final_answer = last_ai.content
+    data = _tool_chat_data(tool_calls, tool_results, final_answer)
+    data.update({
+        "run_id": run["run_id"],
+        "resumed": run["resumed"],
+        "steps": steps,
+        "actions": _tool_actions(tool_calls, tool_results),
+    })
+    return data
+
+
+@router.post("/run", response_model=ChatResponse)
+async def agent_run(req: AgentRunRequest):
+    """
+    多步智能体运行接口（例如 缓冲区分析 -> 相交分析 -> 保存为图层 在一次请求内完成）：
     输入数据格式：
-      - model: LLM 模型名称
-      - temperature: 采样温度
-      - prompt: 用户问题（例如 What's 5 times forty two）
-      - stream: 是否流式
+      - model / temperature / prompt / conversation_id: 同 /agent/tool-chat
+      - run_id: 可选；传入上次未完成（超时/报错）的运行编号时从最后一个 checkpoint 继续；
+        已结束的运行编号返回 HTTP 409（新的问题不要携带 run_id）
+      - max_steps: 模型调用步数上限
     数据处理方法：
-      - 创建 OpenAI 兼容模型，并通过 bind_tools 仅绑定 toggle_layer_visibility 工具
-      - 第一步调用：发送 HumanMessage(prompt)，获取包含 tool_calls 的 AIMessage
-      - 执行工具：根据 AIMessage 中的工具与参数，执行 toggle_layer_visibility 并得到结果
-      - 第二步调用：将工具结果以 ToolMessage 形式回传给模型，生成最终回答
+      - LangGraph 循环：模型 -> 执行工具 -> 模型，直到模型不再调用工具或达到步数上限
+      - 每一步的消息状态写入 checkpointer（AGENT_CHECKPOINTER: memory | sqlite | postgres）
     输出数据格式：
-      - { success: true, data: { first_call: AIMessage(JSON), tool_result: string, final_answer: string } }
-    """
-    model = init_chat_model(f"openai:{req.model}")
-    llm_with_tools = model.bind_tools([
-        toggle_layer_visibility, 
-        query_features_by_attribute, 
-        save_query_results_as_layer, 
-        export_query_results_as_json, 
-        execute_buffer_analysis, 
-        execute_intersection_analysis, 
-        execute_erase_analysis, 
-        execute_shortest_path_analysis,
-        save_buffer_results_as_layer,
-        export_buffer_results_as_json,
-        save_intersection_results_as_layer,
-        export_intersection_results_as_json,
-        save_erase_results_as_layer,
-        export_erase_results_as_json,
-        save_path_results_as_layer,
-        export_path_results_as_json
-    ])
-    history_list = _conversation_layer_history.get(req.conversation_id, [])
-    parsed_lines: List[str] = []
-    last_action_text = ""
-    for entry in history_list:
-        if ":" in entry:
-            action, layer = entry.split(":", 1)
-            parsed_line = f"action={action}; layer={layer}"
-            parsed_lines.append(parsed_line)
-            last_action_text = f"action={action}; layer={layer}"
-        else:
-            parsed_lines.append(entry)
-            last_action_text = entry
-    history_text = "\n".join(parsed_lines)
-    first_ai: AIMessage = llm_with_tools.invoke([
-        SystemMessage(content=(
-            "你有十七个工具，分为三组：\n\n"
-            "=== 重要：上下文记忆规则 ===\n"
-            "你必须记住当前对话中最近执行的分析操作类型。当用户说'保存为图层'、'导出为JSON'等操作时：\n"
-            "- 如果最近执行了缓冲区分析 → 使用save_buffer_results_as_layer或export_buffer_results_as_json\n"
-            "- 如果最近执行了相交分析 → 使用save_intersection_results_as_layer或export_intersection_results_as_json\n"
-            "- 如果最近执行了擦除分析 → 使用save_erase_results_as_layer或export_erase_results_as_json\n"
-            "- 如果最近执行了最短路径分析 → 使用save_path_results_as_layer或export_path_results_as_json\n"
-            "- 如果最近执行了属性查询 → 使用save_query_results_as_layer或export_query_results_as_json\n"
-            "禁止询问用户要保存哪个分析的结果，必须基于上下文自动判断。\n\n"
-            "=== 第一组：图层显示与查询 ===\n"
-            "1) toggle_layer_visibility(layer_name:str, action:'show'|'hide'|'toggle')\n"
-            "- 当用户说'打开@图层名称'或'隐藏@图层名称'或'切换@图层名称'时调用。\n"
-            "- 使用图层名称而非图层ID进行操作。\n"
-            "2) query_features_by_attribute(layer_name:str, field:str, operator:str, value:str)\n"
-            "- 当用户说'在@图层名称中查找字段=值'、'查询@图层名称的属性'、'筛选@图层名称'时调用。\n"
-            "- 操作符映射要求: 必须使用前端支持的格式\n"
-            "  * '=' 映射为 'eq'\n"
-            "  * '!=' 映射为 'ne'\n"
-            "  * '>' 映射为 'gt'\n"
-            "  * '>=' 映射为 'gte'\n"
-            "  * '<' 映射为 'lt'\n"
-            "  * '<=' 映射为 'lte'\n"
-            "  * 'like' 保持不变\n"
-            "- 例如: 用户说'查找NAME=学校'时，operator参数必须传递'eq'而不是'='\n"
-            "3) export_query_results_as_json(file_name:str)\n"
-            "- 当用户说'导出为JSON'、'导出为GeoJSON'、'导出查询结果'时调用。\n"
-            "- 需要指定文件名（不包含扩展名）。\n\n"
-            "=== 第二组：空间分析 ===\n"
-            "4) execute_buffer_analysis(layer_name:str, radius:float, unit:str)\n"
-            "- 当用户说'对@图层名称进行缓冲区分析'、'创建@图层名称的缓冲区'、'缓冲区分析'时调用。\n"
-            "- 需要指定图层名称、半径和单位（默认meters）。\n"
-            "5) execute_intersection_analysis(target_layer_name:str, mask_layer_name:str)\n"
-            "- 当用户说'对@图层名称进行相交分析'、'计算@图层名称与@图层名称的相交'、'相交分析'时调用。\n"
-            "- 需要指定目标图层名称和掩膜图层名称。\n"
-            "6) execute_erase_analysis(target_layer_name:str, erase_layer_name:str)\n"
-            "- 当用户说'对@图层名称进行擦除分析'、'从@图层名称中擦除@图层名称'、'擦除分析'时调用。\n"
-            "- 需要指定目标图层名称和擦除图层名称。\n"
-            "7) execute_shortest_path_analysis(start_layer_name:str, end_layer_name:str, obstacle_layer_name:str)\n"
-            "- 当用户说'计算@图层名称到@图层名称的最短路径'、'最短路径分析'时调用。\n"
-            "- 需要指定起点图层名称、终点图层名称，障碍物图层名称可选。\n"
-            "8) export_buffer_results_as_json(file_name:str)\n"
-            "- 当用户说'导出缓冲区分析结果为JSON'、'导出缓冲区结果为GeoJSON'时调用。\n"
-            "- 需要指定文件名（不包含扩展名）。\n"
-            "9) export_intersection_results_as_json(file_name:str)\n"
-            "- 当用户说'导出相交分析结果为JSON'、'导出相交结果为GeoJSON'时调用。\n"
-            "- 需要指定文件名（不包含扩展名）。\n"
-            "10) export_erase_results_as_json(file_name:str)\n"
-            "- 当用户说'导出擦除分析结果为JSON'、'导出擦除结果为GeoJSON'时调用。\n"
-            "- 需要指定文件名（不包含扩展名）。\n"
-            "11) export_path_results_as_json(file_name:str)\n"
-            "- 当用户说'导出最短路径分析结果为JSON'、'导出路径结果为GeoJSON'时调用。\n"
-            "- 需要指定文件名（不包含扩展名）。\n\n"
-            "=== 第三组：保存为图层 ===\n"
-            "12) save_query_results_as_layer(layer_name:str)\n"
-            "- 当用户说'保存查询结果为图层'、'另存为图层'、'保存为新图层'时调用。\n"
-            "- 图层名称可选：未指定时系统自动生成默认名称。\n"
-            "13) save_buffer_results_as_layer(layer_name:str)\n"
-            "- 当用户说'保存缓冲区分析结果为图层'、'另存缓冲区结果为图层'时调用。\n"
-            "- 重要：只有在执行了缓冲区分析(execute_buffer_analysis)后，用户要求保存结果时才调用此工具。\n"
-            "- 图层名称可选：未指定时系统自动生成默认名称。\n"
-            "14) save_intersection_results_as_layer(layer_name:str)\n"
-            "- 当用户说'保存相交分析结果为图层'、'另存相交结果为图层'时调用。\n"
-            "- 重要：只有在执行了相交分析(execute_intersection_analysis)后，用户要求保存结果时才调用此工具。\n"
-            "- 图层名称可选：未指定时系统自动生成默认名称。\n"
-            "15) save_erase_results_as_layer(layer_name:str)\n"
-            "- 当用户说'保存擦除分析结果为图层'、'另存擦除结果为图层'时调用。\n"
-            "- 重要：只有在执行了擦除分析(execute_erase_analysis)后，用户要求保存结果时才调用此工具。\n"
-            "- 图层名称可选：未指定时系统自动生成默认名称。\n"
-            "16) save_path_results_as_layer(layer_name:str)\n"
-            "- 当用户说'保存最短路径分析结果为图层'、'另存路径结果为图层'时调用。\n"
-            "- 重要：只有在执行了最短路径分析(execute_shortest_path_analysis)后，用户要求保存结果时才调用此工具。\n"
-            "- 图层名称可选：未指定时系统自动生成默认名称。\n\n"
-            "=== 默认命名规则 ===\n"
-            "当用户未指定图层名称时，系统自动生成包含参数信息的默认名称：\n"
-            "- 缓冲区分析：'缓冲区分析结果_源图层名_r半径_s分段数'\n"
-            "- 相交分析：'相交分析结果_目标图层_AND_掩膜图层'\n"
-            "- 擦除分析：'擦除分析结果_目标图层_MINUS_擦除图层'\n"
-            "- 最短路径：'最短路径分析结果_units-单位_res-分辨率'\n"
-            "- 属性查询：'属性查询结果_图层名_字段操作值'\n\n"
-            "=== 重要规则 ===\n"
-            "1. 保存和导出操作必须与对应的分析操作匹配：\n"
-            "   - 缓冲区分析完成后，用户要求保存 → 使用save_buffer_results_as_layer\n"
-            "   - 相交分析完成后，用户要求保存 → 使用save_intersection_results_as_layer\n"
-            "   - 擦除分析完成后，用户要求保存 → 使用save_erase_results_as_layer\n"
-            "   - 最短路径分析完成后，用户要求保存 → 使用save_path_results_as_layer\n"
-            "   - 属性查询完成后，用户要求保存 → 使用save_query_results_as_layer\n"
-            "2. 上下文承接：用户仅说'保存为图层'或'保存'时，默认针对最近一次完成的分析/查询结果执行对应的保存工具，严禁追问是哪一种；如用户明确指明其它方法再切换\n"
-            "3. 图层名称参数为可选：用户未指定时直接调用工具，系统自动生成默认名称\n"
-            "4. 若用户使用@图层名称，请将@后的文本作为图层名称传递\n"
-            "5. 严禁自行执行这些操作，必须通过工具完成\n\n"
-            f"历史操作(顺序, 最新在下):\n{history_text}\n"
-            f"最近一次操作: {last_action_text}。若用户问'刚才做了什么'，请直接依据最近几次操作回答。"
-        )),
-        HumanMessage(content=req.prompt)
-    ])
-    if not first_ai.tool_calls:
-        return ChatResponse(success=True, data={"first_call": {"tool_calls": []}, "tool_result": None, "final_answer": first_ai.content})
-    tool_call = first_ai.tool_calls[0]
-    tool_args = tool_call.get("args", {})
-    
-    # 根据工具名称执行相应的工具
-    tool_name = tool_call.get("name", "")
-    if tool_name == "toggle_layer_visibility":
-        tool_result = toggle_layer_visibility.invoke(tool_args)
-    elif tool_name == "query_features_by_attribute":
-        tool_result = query_features_by_attribute.invoke(tool_args)
-    elif tool_name == "save_query_results_as_layer":
-        tool_result = save_query_results_as_layer.invoke(tool_args)
-    elif tool_name == "export_query_results_as_json":
-        tool_result = export_query_results_as_json.invoke(tool_args)
-    elif tool_name == "execute_buffer_analysis":
-        tool_result = execute_buffer_analysis.invoke(tool_args)
-    elif tool_name == "execute_intersection_analysis":
-        tool_result = execute_intersection_analysis.invoke(tool_args)
-    elif tool_name == "execute_erase_analysis":
-        tool_result = execute_erase_analysis.invoke(tool_args)
-    elif tool_name == "execute_shortest_path_analysis":
-        tool_result = execute_shortest_path_analysis.invoke(tool_args)
-    elif tool_name == "save_buffer_results_as_layer":
-        tool_result = save_buffer_results_as_layer.invoke(tool_args)
-    elif tool_name == "export_buffer_results_as_json":
-        tool_result = export_buffer_results_as_json.invoke(tool_args)
-    elif tool_name == "save_intersection_results_as_layer":
-        tool_result = save_intersection_results_as_layer.invoke(tool_args)
-    elif tool_name == "export_intersection_results_as_json":
-        tool_result = export_intersection_results_as_json.invoke(tool_args)
-    elif tool_name == "save_erase_results_as_layer":
-        tool_result = save_erase_results_as_layer.invoke(tool_args)
-    elif tool_name == "export_erase_results_as_json":
-        tool_result = export_erase_results_as_json.invoke(tool_args)
-    elif tool_name == "save_path_results_as_layer":
-        tool_result = save_path_results_as_layer.invoke(tool_args)
-    elif tool_name == "export_path_results_as_json":
-        tool_result = export_path_results_as_json.invoke(tool_args)
-    else:
-        tool_result = f"未知工具: {tool_name}"
-    # 记录历史：优先记录action；若保存/导出操作，按分析类型归档
-    if isinstance(tool_result, dict) and "action" in tool_result:
-        history_entry = tool_result.get("action")
-    else:
-        history_entry = tool_result if isinstance(tool_result, str) else str(tool_result)
-    if req.conversation_id in _conversation_layer_history:
-        _conversation_layer_history[req.conversation_id].append(history_entry)
-    else:
-        _conversation_layer_history[req.conversation_id] = [history_entry]
-    tool_message = ToolMessage(content=str(tool_result), tool_call_id=tool_call["id"])
-    final_ai: AIMessage = llm_with_tools.invoke([
-        SystemMessage(content=(
-            "你有十七个工具，分为三组：\n\n"
-            "=== 重要：上下文记忆规则 ===\n"
-            "你必须记住当前对话中最近执行的分析操作类型。当用户说'保存为图层'、'导出为JSON'等操作时：\n"
-            "- 如果最近执行了缓冲区分析 → 使用save_buffer_results_as_layer或export_buffer_results_as_json\n"
-            "- 如果最近执行了相交分析 → 使用save_intersection_results_as_layer或export_intersection_results_as_json\n"
-            "- 如果最近执行了擦除分析 → 使用save_erase_results_as_layer或export_erase_results_as_json\n"
-            "- 如果最近执行了最短路径分析 → 使用save_path_results_as_layer或export_path_results_as_json\n"
-            "- 如果最近执行了属性查询 → 使用save_query_results_as_layer或export_query_results_as_json\n"
-            "禁止询问用户要保存哪个分析的结果，必须基于上下文自动判断。\n\n"
-            "=== 第一组：图层显示与查询 ===\n"
-            "1) toggle_layer_visibility(layer_name:str, action:'show'|'hide'|'toggle')\n"
-            "- 遇到'打开/隐藏/切换@图层名称'的请求，必须调用该工具。\n"
-            "- 使用图层名称而非图层ID进行操作。\n"
-            "2) query_features_by_attribute(layer_name:str, field:str, operator:str, value:str)\n"
-            "- 遇到'在@图层名称中查找/查询/筛选'的请求，必须调用该工具。\n"
-            "- 操作符映射要求: 必须使用前端支持的格式\n"
-            "  * '=' 映射为 'eq'\n"
-            "  * '!=' 映射为 'ne'\n"
-            "  * '>' 映射为 'gt'\n"
-            "  * '>=' 映射为 'gte'\n"
-            "  * '<' 映射为 'lt'\n"
-            "  * '<=' 映射为 'lte'\n"
-            "  * 'like' 保持不变\n"
-            "- 例如: 用户说'查找NAME=学校'时，operator参数必须传递'eq'而不是'='\n"
-            "3) export_query_results_as_json(file_name:str)\n"
-            "- 遇到'导出为JSON'、'导出为GeoJSON'、'导出查询结果'的请求时调用。\n"
-            "- 需要指定文件名（不包含扩展名）。\n\n"
-            "=== 第二组：空间分析 ===\n"
-            "4) execute_buffer_analysis(layer_name:str, radius:float, unit:str)\n"
-            "- 遇到'对@图层名称进行缓冲区分析'、'创建@图层名称的缓冲区'、'缓冲区分析'的请求时调用。\n"
-            "- 需要指定图层名称、半径和单位（默认meters）。\n"
-            "5) execute_intersection_analysis(target_layer_name:str, mask_layer_name:str)\n"
-            "- 遇到'对@图层名称进行相交分析'、'计算@图层名称与@图层名称的相交'、'相交分析'的请求时调用。\n"
-            "- 需要指定目标图层名称和掩膜图层名称。\n"
-            "6) execute_erase_analysis(target_layer_name:str, erase_layer_name:str)\n"
-            "- 遇到'对@图层名称进行擦除分析'、'从@图层名称中擦除@图层名称'、'擦除分析'的请求时调用。\n"
-            "- 需要指定目标图层名称和擦除图层名称。\n"
-            "7) execute_shortest_path_analysis(start_layer_name:str, end_layer_name:str, obstacle_layer_name:str)\n"
-            "- 遇到'计算@图层名称到@图层名称的最短路径'、'最短路径分析'的请求时调用。\n"
-            "- 需要指定起点图层名称、终点图层名称，障碍物图层名称可选。\n"
-            "8) export_buffer_results_as_json(file_name:str)\n"
-            "- 遇到'导出缓冲区分析结果为JSON'、'导出缓冲区结果为GeoJSON'的请求时调用。\n"
-            "- 需要指定文件名（不包含扩展名）。\n"
-            "9) export_intersection_results_as_json(file_name:str)\n"
-            "- 遇到'导出相交分析结果为JSON'、'导出相交结果为GeoJSON'的请求时调用。\n"
-            "- 需要指定文件名（不包含扩展名）。\n"
-            "10) export_erase_results_as_json(file_name:str)\n"
-            "- 遇到'导出擦除分析结果为JSON'、'导出擦除结果为GeoJSON'的请求时调用。\n"
-            "- 需要指定文件名（不包含扩展名）。\n"
-            "11) export_path_results_as_json(file_name:str)\n"
-            "- 遇到'导出最短路径分析结果为JSON'、'导出路径结果为GeoJSON'的请求时调用。\n"
-            "- 需要指定文件名（不包含扩展名）。\n\n"
-            "=== 第三组：保存为图层 ===\n"
-            "12) save_query_results_as_layer(layer_name:str)\n"
-            "- 遇到'保存查询结果为图层'、'另存为图层'、'保存为新图层'的请求时调用。\n"
-            "- 图层名称可选：未指定时系统自动生成默认名称。\n"
-            "13) save_buffer_results_as_layer(layer_name:str)\n"
-            "- 遇到'保存缓冲区分析结果为图层'、'另存缓冲区结果为图层'的请求时调用。\n"
-            "- 重要：只有在执行了缓冲区分析(execute_buffer_analysis)后，用户要求保存结果时才调用此工具。\n"
-            "- 图层名称可选：未指定时系统自动生成默认名称。\n"
-            "14) save_intersection_results_as_layer(layer_name:str)\n"
-            "- 遇到'保存相交分析结果为图层'、'另存相交结果为图层'的请求时调用。\n"
-            "- 重要：只有在执行了相交分析(execute_intersection_analysis)后，用户要求保存结果时才调用此工具。\n"
-            "- 图层名称可选：未指定时系统自动生成默认名称。\n"
-            "15) save_erase_results_as_layer(layer_name:str)\n"
-            "- 遇到'保存擦除分析结果为图层'、'另存擦除结果为图层'的请求时调用。\n"
-            "- 重要：只有在执行了擦除分析(execute_erase_analysis)后，用户要求保存结果时才调用此工具。\n"
-            "- 图层名称可选：未指定时系统自动生成默认名称。\n"
-            "16) save_path_results_as_layer(layer_name:str)\n"
-            "- 遇到'保存最短路径分析结果为图层'、'另存路径结果为图层'的请求时调用。\n"
-            "- 重要：只有在执行了最短路径分析(execute_shortest_path_analysis)后，用户要求保存结果时才调用此工具。\n"
-            "- 图层名称可选：未指定时系统自动生成默认名称。\n\n"
-            "=== 默认命名规则 ===\n"
-            "当用户未指定图层名称时，系统自动生成包含参数信息的默认名称：\n"
-            "- 缓冲区分析：'缓冲区分析结果_源图层名_r半径_s分段数'\n"
-            "- 相交分析：'相交分析结果_目标图层_AND_掩膜图层'\n"
-            "- 擦除分析：'擦除分析结果_目标图层_MINUS_擦除图层'\n"
-            "- 最短路径：'最短路径分析结果_units-单位_res-分辨率'\n"
-            "- 属性查询：'属性查询结果_图层名_字段操作值'\n\n"
-            "=== 重要规则 ===\n"
-            "1. 保存和导出操作必须与对应的分析操作匹配：\n"
-            "   - 缓冲区分析完成后，用户要求保存 → 使用save_buffer_results_as_layer\n"
-            "   - 相交分析完成后，用户要求保存 → 使用save_intersection_results_as_layer\n"
-            "   - 擦除分析完成后，用户要求保存 → 使用save_erase_results_as_layer\n"
-            "   - 最短路径分析完成后，用户要求保存 → 使用save_path_results_as_layer\n"
-            "   - 属性查询完成后，用户要求保存 → 使用save_query_results_as_layer\n"
-            "2. 图层名称参数为可选：用户未指定时直接调用工具，系统自动生成默认名称\n"
-            "3. 若用户使用@图层名称，请将@后的文本作为图层名称传递\n"
-            "4. 严禁自行执行这些操作，必须通过工具完成\n\n"
-            "=== 回复规则 ===\n"
-            "当工具执行完成后，必须简洁回复，禁止废话：\n"
-            "- 查询操作：直接说'正在执行请稍后'\n"
-            "- 图层操作：直接说'图层已显示/隐藏'\n"
-            "- 保存操作：直接说'正在执行请稍后'\n"
-            "- 导出操作：直接说'正在执行请稍后'\n"
-            "- 缓冲区分析：直接说'正在执行请稍后'\n"
-            "- 相交分析：直接说'正在执行请稍后'\n"
-            "- 擦除分析：直接说'正在执行请稍后'\n"
-            "- 最短路径分析：直接说'正在执行请稍后'\n"
-            "严禁说'看起来'、'可能'、'如果'、'请确认'等不确定词汇。\n"
-            "严禁解释系统工作原理或引导用户查看界面。\n"
-            "严禁回复具体的要素数量或详细结果。\n"
-            "严禁编造或猜测操作结果。\n"
-            "只回复'正在执行请稍后'或简单的操作状态，一句话结束。"
-        )),
-        HumanMessage(content=req.prompt),
-        first_ai,
-        tool_message,
-    ])
-    return ChatResponse(success=True, data={"first_call": {"tool_calls": first_ai.tool_calls}, "tool_result": tool_result, "final_answer": final_ai.content})
+      - { success, data: { run_id, resumed, steps, actions, first_call, tool_result, tool_results, final_answer } }
+        前端按 actions 顺序依次执行各步工具动作
+    """
+    if _agent_graph is None:
+        return ChatResponse(success=False, error="智能体循环未初始化")
+    chat_req = ToolChatRequest(model=req.model, temperature=req.temperature, prompt=req.prompt, conversation_id=req.conversation_id)
+    if _prompt_too_long(chat_req):
+        return ChatResponse(success=False, error="输入内容过长，超出提示词长度上限")
+    history_list = await _history_store.get(req.conversation_id)
+    options = {"model": req.model, "temperature": req.temperature, "conversation_id": req.conversation_id, "max_steps": req.max_steps}
+    # 新运行在此生成编号，超时/报错时返回给客户端用于继续
+    run_id = req.run_id or uuid.uuid4().hex
+    with trace_request("agent_run") as trace:
+        try:
+            run = await asyncio.wait_for(
+                _agent_graph.run(_build_first_messages(chat_req, history_list), options, run_id),
+                timeout=settings.request_timeout * req.max_steps,
+            )
+        except RunFinished as e:
+            return JSONResponse(
+                status_code=409,
+                content=ChatResponse(success=False, data={"run_id": e.run_id}, error=f"{e}，新的问题请不要携带 run_id").model_dump(),
+            )
+        except asyncio.TimeoutError:
+            return ChatResponse(success=False, data={"run_id": run_id}, error="智能体运行超时，可使用 run_id 继续")
+        except Exception as e:
+            return ChatResponse(success=False, data={"run_id": run_id}, error=f"智能体运行失败: {e}")
+    data = _agent_run_data(run, req.max_steps)
+    if req.debug:
+        data["debug"] = trace.to_dict()
+    return ChatResponse(success=True, data=data)
+
+
+@router.get("/run/{run_id}", response_model=ChatResponse)
+async def agent_run_state(run_id: str):
+    """
+    查询多步运行的最新 checkpoint：
+    输出数据格式：
+      - { success: true, data: { run_id, steps, next, finished, messages: [ { type, content, tool_calls } ] } }
+    """
+    if _agent_graph is None:
+        return ChatResponse(success=False, error="智能体循环未初始化")
+    state = await _agent_graph.state(run_id)
+    if state is None:
+        return ChatResponse(success=False, error=f"运行不存在: {run_id}")
+    messages = [
+        {"type": message.type, "content": message.content, "tool_calls": getattr(message, "tool_calls", None) or None}
+        for message in state["messages"]
+        if message.type != "system"
+    ]
+    return ChatResponse(success=True, data={"run_id": run_id, "steps": state["steps"], "next": state["next"], "finished": not state["next"], "messages": messages})
+
+
+@router.get("/model-pool/stats", response_model=ChatResponse)
+async def model_pool_statistics():
+    """
+    模型池统计（回退链、对冲次数与各模型延迟）：
+    输出数据格式：
+      - { success: true, data: { fallback_models, hedge_enabled, hedges, models: { name: { calls, failures, hedged_wins, samples, error_rate, p50_ms, p95_ms } } } }
+    """
+    return ChatResponse(success=True, data=_model_pool.stats())
+
+
+@router.get("/llm-limiter/stats", response_model=ChatResponse)
+async def llm_limiter_statistics():
+    """
+    上游LLM调用限流统计：
+    输出数据格式：
+      - { success: true, data: { calls, active, waiting, retries, coalesced, throttled_seconds, max_concurrency, qps, tpm, inflight_unique } }
+    """
+    return ChatResponse(success=True, data=upstream_limiter.stats())
+
+
+@router.get("/prompt-cache/stats", response_model=ChatResponse)
+async def prompt_cache_statistics():
+    """
+    提示词缓存统计：
+    输出数据格式：
+      - { success: true, data: { mode, calls, prompt_tokens, cached_prompt_tokens, uncached_prompt_tokens, cache_hit_ratio } }
+    """
+    return ChatResponse(success=True, data=prompt_cache_stats.snapshot())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期管理"""
+    # 启动时加载提示词文件，探针与请求路径只读内存
+    load_system_prompt()
+    # 启动时预创建默认模型及回退模型，并在后台建立到LLM端点的 keep-alive 连接，避免首个请求承担冷启动开销
+    warm_up = None
+    if settings.warmup_enabled:
+        _model_pool.preload(settings.model, settings.temperature)
+        warm_up = asyncio.ensure_future(_model_registry.warm_up())
+    # 多步智能体循环：checkpointer 连接随应用生命周期打开/关闭
+    global _agent_graph
+    async with AsyncExitStack() as stack:
+        checkpointer = await stack.enter_async_context(open_checkpointer())
+        _agent_graph = AgentGraph(_agent_call_model, _agent_run_tools, checkpointer)
+        yield
+        _agent_graph = None
+    if warm_up is not None and not warm_up.done():
+        warm_up.cancel()
+    # 关闭时释放共享的LLM HTTP连接池与会话历史存储连接
+    await _model_pool.aclose()
+    await _history_store.close()
+
 
 app = FastAPI(
     title="Agent Service", 
     version="2.0.0",
-    description="LLM Agent服务 - 提供完整的AI助手管理功能"
+    description="LLM Agent服务 - 提供完整的AI助手管理功能",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -662,11 +945,12 @@ app.add_middleware(
 )
 
 app.include_router(router)
+app.include_router(knowledge_router)
 
 
 @app.get("/health")
 async def health():
-    """健康检查接口"""
+    """健康检查接口（存活探针）：只读取内存状态，不访问磁盘与上游"""
     return {
         "status": "ok",
         "service": "Agent Service",
@@ -677,10 +961,33 @@ async def health():
             "Prompt Template Management",
             "Knowledge Base Management"
         ],
-        "prompt_loaded": load_system_prompt() != "You are a helpful spatial analysis assistant."
+        "prompt_loaded": _system_prompt_file.loaded
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 指标：agent_request_seconds / agent_stage_seconds / agent_llm_call_seconds / agent_llm_tokens"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/ready")
+async def ready():
+    """
+    就绪检查接口（就绪探针）：
+    数据处理方法：
+      - 检查上游LLM端点可达（OpenAI 兼容 /models 接口），结果缓存 settings.ready_cache_ttl 秒，并发探测合并为一次
+    输出数据格式：
+      - 200 { status: "ready", upstream: { ok, status_code, latency_ms, error, checked_at } }
+      - 503 { status: "unavailable", upstream: {...} }
+    """
+    upstream = await _model_registry.reachability()
+    return JSONResponse(
+        status_code=200 if upstream["ok"] else 503,
+        content={"status": "ready" if upstream["ok"] else "unavailable", "upstream": upstream},
+    )
+
+
 @app.get("/")
 async def root():
     """根路径信息"""
@@ -688,8 +995,12 @@ async def root():
         "message": "Agent Service API",
         "docs": "/docs",
         "health": "/health",
+        "ready": "/ready",
+        "metrics": "/metrics",
         "endpoints": {
             "tool_chat": "/agent/tool-chat",
+            "tool_chat_batch": "/agent/tool-chat/batch",
+            "websocket": "/agent/ws",
             "api_keys": "/api/v1/api-keys",
             "prompts": "/api/v1/prompts", 
             "knowledge": "/api/v1/knowledge"
@@ -699,4 +1010,6 @@ async def root():
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("agent.app:app", host="0.0.0.0", port=8089, reload=True)
\ No newline at end of file
@@ -0,0 +1 @@
+# Agent Service - 核心基础设施层
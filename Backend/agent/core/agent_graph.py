@@ -0,0 +1,132 @@
+"""
+图结构智能体循环
+基于 LangGraph StateGraph 的"模型 -> 工具 -> 模型"循环，每一步的状态由可插拔的 checkpointer 持久化：
+memory（测试/单进程）| sqlite | postgres（生产，多 worker 共享）
+"""
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Annotated, Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+
+from agent.core.config import settings
+
+# 调用模型：(消息列表, 运行参数) -> AIMessage
+ModelCaller = Callable[[List[BaseMessage], Dict[str, Any]], Awaitable[AIMessage]]
+# 执行工具：(工具调用列表, 运行参数) -> 与调用一一对应的 ToolMessage
+ToolRunner = Callable[[List[Dict[str, Any]], Dict[str, Any]], Awaitable[List[ToolMessage]]]
+
+
+@asynccontextmanager
+async def open_checkpointer(backend: Optional[str] = None) -> AsyncIterator[Any]:
+    """
+    根据配置打开 checkpointer：memory（默认）| sqlite | postgres。
+    SQLite/Postgres 实现分别来自 langgraph-checkpoint-sqlite / langgraph-checkpoint-postgres，按需导入。
+    """
+    backend = (backend or settings.agent_checkpointer).lower()
+    if backend == "memory":
+        from langgraph.checkpoint.memory import MemorySaver
+
+        yield MemorySaver()
+    elif backend == "sqlite":
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        path = Path(settings.agent_checkpoint_sqlite_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        async with AsyncSqliteSaver.from_conn_string(str(path)) as saver:
+            yield saver
+    elif backend == "postgres":
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+        async with AsyncPostgresSaver.from_conn_string(settings.postgres_url) as saver:
+            await saver.setup()
+            yield saver
+    else:
+        raise ValueError(f"不支持的智能体 checkpointer: {backend}")
+
+
+def _add_messages(left: List[BaseMessage], right: List[BaseMessage]) -> List[BaseMessage]:
+    from langgraph.graph.message import add_messages
+
+    return add_messages(left, right)
+
+
+class RunFinished(Exception):
+    """run_id 对应的运行已结束，不能再继续"""
+
+    def __init__(self, run_id: str) -> None:
+        super().__init__(f"运行已结束: {run_id}")
+        self.run_id = run_id
+
+
+class AgentState(TypedDict):
+    messages: Annotated[List[BaseMessage], _add_messages]
+    steps: int
+
+
+class AgentGraph:
+    """
+    多步智能体循环。
+    业务处理：
+      - agent 节点调用模型；返回工具调用且未达到步数上限时进入 tools 节点，否则结束
+      - tools 节点执行本轮全部工具调用并以 ToolMessage 回传，随后回到 agent 节点
+      - 以 thread_id 为键逐步写入 checkpoint；同一 run_id 再次调用且上次未结束时从最后一个 checkpoint 继续，
+        已结束的 run_id 抛出 RunFinished（新的问题需不带 run_id 新建运行）
+    """
+
+    def __init__(self, call_model: ModelCaller, run_tools: ToolRunner, checkpointer: Any) -> None:
+        from langgraph.graph import END, START, StateGraph
+
+        self._call_model = call_model
+        self._run_tools = run_tools
+        builder = StateGraph(AgentState)
+        builder.add_node("agent", self._agent_node)
+        builder.add_node("tools", self._tools_node)
+        builder.add_edge(START, "agent")
+        builder.add_conditional_edges("agent", self._route, {"tools": "tools", "end": END})
+        builder.add_edge("tools", "agent")
+        self.graph = builder.compile(checkpointer=checkpointer)
+
+    async def _agent_node(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+        message = await self._call_model(state["messages"], config["configurable"])
+        return {"messages": [message], "steps": state.get("steps", 0) + 1}
+
+    async def _tools_node(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+        return {"messages": await self._run_tools(state["messages"][-1].tool_calls, config["configurable"])}
+
+    @staticmethod
+    def _route(state: AgentState, config: RunnableConfig) -> str:
+        last = state["messages"][-1]
+        max_steps = config["configurable"].get("max_steps", settings.agent_max_steps)
+        if isinstance(last, AIMessage) and last.tool_calls and state.get("steps", 0) < max_steps:
+            return "tools"
+        return "end"
+
+    async def run(self, messages: List[BaseMessage], options: Dict[str, Any], run_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        执行（或继续）一次多步运行。
+        输入参数：
+          - messages: 新运行的初始消息（系统提示词 + 用户问题）；继续运行时忽略
+          - options: 传给模型调用与工具执行的运行参数（model、temperature、conversation_id、max_steps 等）
+          - run_id: 运行编号；为空时新建，已存在且未结束时从 checkpoint 继续
+        输出数据格式：
+          - { run_id, resumed: bool, messages: 本次运行的全部消息 }
+          - run_id 对应的运行已结束时抛出 RunFinished，避免忽略新的问题而返回旧结果
+        """
+        run_id = run_id or uuid.uuid4().hex
+        config = {"configurable": {**options, "thread_id": run_id}}
+        snapshot = await self.graph.aget_state(config)
+        resumed = bool(snapshot.next)
+        if snapshot.values and not resumed:
+            raise RunFinished(run_id)
+        state = await self.graph.ainvoke(None if resumed else {"messages": messages, "steps": 0}, config)
+        return {"run_id": run_id, "resumed": resumed, "messages": state["messages"]}
+
+    async def state(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """读取运行的最新 checkpoint：{ messages, steps, next }，不存在时返回 None"""
+        snapshot = await self.graph.aget_state({"configurable": {"thread_id": run_id}})
+        if not snapshot.values:
+            return None
+        return {"messages": snapshot.values["messages"], "steps": snapshot.values.get("steps", 0), "next": list(snapshot.next)}
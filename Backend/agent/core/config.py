@@ -0,0 +1,169 @@
+"""
+Agent服务配置管理
+从 Backend/.env 与环境变量读取 LLM 及运行参数
+"""
+import os
+from pathlib import Path
+from typing import List
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+
+
+class LLMSettings(BaseModel):
+    api_key: str = Field(default_factory=lambda: os.getenv("DASHSCOPE_API_KEY", ""))
+    base_url: str = Field(default_factory=lambda: os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"))
+    model: str = Field(default_factory=lambda: os.getenv("DASHSCOPE_MODEL", "qwen-max"))
+    temperature: float = Field(default_factory=lambda: float(os.getenv("DASHSCOPE_TEMPERATURE", "0.7")))
+    max_tokens: int = Field(default_factory=lambda: int(os.getenv("DASHSCOPE_MAX_TOKENS", "3000")))
+    request_timeout: float = Field(default_factory=lambda: float(os.getenv("DASHSCOPE_REQUEST_TIMEOUT", "60")))
+    cors_origins: str = Field(default_factory=lambda: os.getenv("CORS_ORIGINS", "*"))
+
+    # 已绑定工具的模型缓存与HTTP连接池
+    model_cache_size: int = Field(default_factory=lambda: int(os.getenv("AGENT_MODEL_CACHE_SIZE", "8")))
+    http_max_connections: int = Field(default_factory=lambda: int(os.getenv("AGENT_HTTP_MAX_CONNECTIONS", "100")))
+    http_max_keepalive: int = Field(default_factory=lambda: int(os.getenv("AGENT_HTTP_MAX_KEEPALIVE", "20")))
+    http_keepalive_expiry: float = Field(default_factory=lambda: float(os.getenv("AGENT_HTTP_KEEPALIVE_EXPIRY", "60")))
+
+    # 上游LLM调用限流：并发上限、每秒请求数、每分钟token数（<=0 不限），重试次数与抖动退避参数，相同进行中请求合并
+    llm_max_concurrency: int = Field(default_factory=lambda: int(os.getenv("AGENT_LLM_MAX_CONCURRENCY", "16")))
+    llm_qps: float = Field(default_factory=lambda: float(os.getenv("AGENT_LLM_QPS", "10")))
+    llm_tpm: float = Field(default_factory=lambda: float(os.getenv("AGENT_LLM_TPM", "1000000")))
+    llm_max_retries: int = Field(default_factory=lambda: int(os.getenv("AGENT_LLM_MAX_RETRIES", "3")))
+    llm_retry_base_delay: float = Field(default_factory=lambda: float(os.getenv("AGENT_LLM_RETRY_BASE_DELAY", "0.5")))
+    llm_retry_max_delay: float = Field(default_factory=lambda: float(os.getenv("AGENT_LLM_RETRY_MAX_DELAY", "8")))
+    llm_coalesce: bool = Field(default_factory=lambda: os.getenv("AGENT_LLM_COALESCE", "true").lower() in ("1", "true", "yes"))
+
+    # 模型池：回退模型链（逗号分隔，依次尝试）、单个模型的调用超时（0 表示把 request_timeout 平分给链上各模型）、
+    # 路由统计窗口与降级错误率、对冲请求（首选模型超过其 p95 延迟仍未返回时请求下一个模型）
+    fallback_models: str = Field(default_factory=lambda: os.getenv("AGENT_FALLBACK_MODELS", ""))
+    model_attempt_timeout: float = Field(default_factory=lambda: float(os.getenv("AGENT_MODEL_ATTEMPT_TIMEOUT", "0")))
+    model_stats_window: int = Field(default_factory=lambda: int(os.getenv("AGENT_MODEL_STATS_WINDOW", "200")))
+    model_max_error_rate: float = Field(default_factory=lambda: float(os.getenv("AGENT_MODEL_MAX_ERROR_RATE", "0.5")))
+    hedge_enabled: bool = Field(default_factory=lambda: os.getenv("AGENT_HEDGE", "false").lower() in ("1", "true", "yes"))
+    hedge_percentile: float = Field(default_factory=lambda: float(os.getenv("AGENT_HEDGE_PERCENTILE", "0.95")))
+    hedge_min_samples: int = Field(default_factory=lambda: int(os.getenv("AGENT_HEDGE_MIN_SAMPLES", "20")))
+    hedge_min_delay: float = Field(default_factory=lambda: float(os.getenv("AGENT_HEDGE_MIN_DELAY", "0.5")))
+
+    # 启动预热：预创建默认模型并建立到LLM端点的连接
+    warmup_enabled: bool = Field(default_factory=lambda: os.getenv("AGENT_WARMUP", "true").lower() in ("1", "true", "yes"))
+    warmup_timeout: float = Field(default_factory=lambda: float(os.getenv("AGENT_WARMUP_TIMEOUT", "5")))
+
+    # 提示词文件 mtime 检查最小间隔（秒）；就绪探针上游可达性结果缓存时间（秒）
+    prompt_reload_interval: float = Field(default_factory=lambda: float(os.getenv("AGENT_PROMPT_RELOAD_INTERVAL", "5")))
+    ready_cache_ttl: float = Field(default_factory=lambda: float(os.getenv("AGENT_READY_CACHE_TTL", "10")))
+
+    # 多步智能体循环：checkpointer（memory | sqlite | postgres）与默认步数上限
+    agent_checkpointer: str = Field(default_factory=lambda: os.getenv("AGENT_CHECKPOINTER", "memory"))
+    agent_checkpoint_sqlite_path: str = Field(default_factory=lambda: os.getenv("AGENT_CHECKPOINT_SQLITE_PATH", str(Path(__file__).resolve().parents[1] / "data" / "checkpoints.sqlite3")))
+    agent_max_steps: int = Field(default_factory=lambda: int(os.getenv("AGENT_MAX_STEPS", "6")))
+
+    # 知识库向量索引：有效向量数达到阈值后使用 IVF 近似检索，nprobe 为每次检索扫描的聚类数
+    knowledge_ann_threshold: int = Field(default_factory=lambda: int(os.getenv("AGENT_KNOWLEDGE_ANN_THRESHOLD", "20000")))
+    knowledge_ann_nprobe: int = Field(default_factory=lambda: int(os.getenv("AGENT_KNOWLEDGE_ANN_NPROBE", "16")))
+
+    # 知识库检索模式：hybrid（BM25 + 向量，倒数排名融合）| dense | bm25；rrf_k 为融合平滑常数
+    knowledge_retrieval_mode: str = Field(default_factory=lambda: os.getenv("AGENT_KNOWLEDGE_RETRIEVAL_MODE", "hybrid"))
+    knowledge_rrf_k: int = Field(default_factory=lambda: int(os.getenv("AGENT_KNOWLEDGE_RRF_K", "60")))
+
+    # 知识库向量检索的默认余弦相似度阈值（请求未指定 score_threshold 时）：远程向量化模型取该值；
+    # 本地哈希向量化的相似度普遍远低于语义模型，只过滤非正相关的结果（阈值 0）
+    knowledge_score_threshold: float = Field(default_factory=lambda: float(os.getenv("AGENT_KNOWLEDGE_SCORE_THRESHOLD", "0.7")))
+
+    # 知识库远程向量化：开启后 hashing 以外的模型名调用 OpenAI 兼容 /embeddings 接口（地址与密钥默认同 DASHSCOPE_*）；
+    # 每次请求的文本数、并发请求数、每秒请求数、重试次数、向量维度（0 表示按模型推断）与磁盘缓存路径（空表示不缓存）
+    embedding_remote: bool = Field(default_factory=lambda: os.getenv("AGENT_EMBEDDING_REMOTE", "false").lower() in ("1", "true", "yes"))
+    embedding_base_url: str = Field(default_factory=lambda: os.getenv("AGENT_EMBEDDING_BASE_URL", ""))
+    embedding_api_key: str = Field(default_factory=lambda: os.getenv("AGENT_EMBEDDING_API_KEY", ""))
+    embedding_batch_size: int = Field(default_factory=lambda: int(os.getenv("AGENT_EMBEDDING_BATCH_SIZE", "10")))
+    embedding_concurrency: int = Field(default_factory=lambda: int(os.getenv("AGENT_EMBEDDING_CONCURRENCY", "4")))
+    embedding_qps: float = Field(default_factory=lambda: float(os.getenv("AGENT_EMBEDDING_QPS", "20")))
+    embedding_max_retries: int = Field(default_factory=lambda: int(os.getenv("AGENT_EMBEDDING_MAX_RETRIES", "3")))
+    embedding_dimension: int = Field(default_factory=lambda: int(os.getenv("AGENT_EMBEDDING_DIMENSION", "0")))
+    embedding_cache_path: str = Field(default_factory=lambda: os.getenv("AGENT_EMBEDDING_CACHE_PATH", str(Path(__file__).resolve().parents[1] / "data" / "embeddings.sqlite3")))
+
+    # 提示词缓存模式：off | auto | explicit
+    prompt_cache_mode: str = Field(default_factory=lambda: os.getenv("AGENT_PROMPT_CACHE", "auto"))
+
+    # 会话历史存储：memory | redis | sqlite（多 worker 部署需使用 redis 或 sqlite）
+    history_backend: str = Field(default_factory=lambda: os.getenv("AGENT_HISTORY_BACKEND", "memory"))
+    history_max_entries: int = Field(default_factory=lambda: int(os.getenv("AGENT_HISTORY_MAX_ENTRIES", "50")))
+    history_idle_ttl: float = Field(default_factory=lambda: float(os.getenv("AGENT_HISTORY_IDLE_TTL", "3600")))
+    history_max_total_bytes: int = Field(default_factory=lambda: int(os.getenv("AGENT_HISTORY_MAX_TOTAL_BYTES", str(16 * 1024 * 1024))))
+    history_sqlite_path: str = Field(default_factory=lambda: os.getenv("AGENT_HISTORY_SQLITE_PATH", str(Path(__file__).resolve().parents[1] / "data" / "history.sqlite3")))
+
+    # 会话历史注入提示词的token预算：最近 N 条原样保留，其余汇总；提示词总长度硬上限
+    history_keep_recent: int = Field(default_factory=lambda: int(os.getenv("AGENT_HISTORY_KEEP_RECENT", "10")))
+    history_max_tokens: int = Field(default_factory=lambda: int(os.getenv("AGENT_HISTORY_MAX_TOKENS", "1000")))
+    max_prompt_tokens: int = Field(default_factory=lambda: int(os.getenv("AGENT_MAX_PROMPT_TOKENS", "6000")))
+
+    # 本地意图路由：格式固定的指令不经LLM直接解析为工具调用
+    intent_router_enabled: bool = Field(default_factory=lambda: os.getenv("AGENT_INTENT_ROUTER", "true").lower() in ("1", "true", "yes"))
+    intent_router_min_confidence: float = Field(default_factory=lambda: float(os.getenv("AGENT_INTENT_ROUTER_MIN_CONFIDENCE", "0.9")))
+
+    # 批量指令接口单次最多指令数
+    batch_max_prompts: int = Field(default_factory=lambda: int(os.getenv("AGENT_BATCH_MAX_PROMPTS", "100")))
+
+    # 工具决策响应缓存
+    response_cache_enabled: bool = Field(default_factory=lambda: os.getenv("AGENT_RESPONSE_CACHE", "true").lower() in ("1", "true", "yes"))
+    response_cache_size: int = Field(default_factory=lambda: int(os.getenv("AGENT_RESPONSE_CACHE_SIZE", "1024")))
+    response_cache_ttl: float = Field(default_factory=lambda: float(os.getenv("AGENT_RESPONSE_CACHE_TTL", "600")))
+
+    # Redis 配置（与用户服务共用 Backend/.env 中的 REDIS_*）
+    redis_host: str = Field(default_factory=lambda: os.getenv("REDIS_HOST", "localhost"))
+    redis_port: int = Field(default_factory=lambda: int(os.getenv("REDIS_PORT", "6379")))
+    redis_password: str = Field(default_factory=lambda: os.getenv("REDIS_PASSWORD", ""))
+    redis_db: int = Field(default_factory=lambda: int(os.getenv("REDIS_DB", "0")))
+
+    # PostgreSQL 配置（智能体 checkpointer 使用，与用户服务共用 Backend/.env 中的 POSTGRES_*）
+    postgres_host: str = Field(default_factory=lambda: os.getenv("POSTGRES_HOST", "localhost"))
+    postgres_port: int = Field(default_factory=lambda: int(os.getenv("POSTGRES_PORT", "5432")))
+    postgres_user: str = Field(default_factory=lambda: os.getenv("POSTGRES_USER", "postgres"))
+    postgres_password: str = Field(default_factory=lambda: os.getenv("POSTGRES_PASSWORD", ""))
+    postgres_db: str = Field(default_factory=lambda: os.getenv("POSTGRES_DB", "supermap"))
+
+    # RAG PostgreSQL 配置（SQL 导出文件导入目标，与用户服务共用 Backend/.env 中的 RAG_POSTGRES_*），导入批大小
+    rag_postgres_host: str = Field(default_factory=lambda: os.getenv("RAG_POSTGRES_HOST", "localhost"))
+    rag_postgres_port: int = Field(default_factory=lambda: int(os.getenv("RAG_POSTGRES_PORT", "5432")))
+    rag_postgres_user: str = Field(default_factory=lambda: os.getenv("RAG_POSTGRES_USER", "postgres"))
+    rag_postgres_password: str = Field(default_factory=lambda: os.getenv("RAG_POSTGRES_PASSWORD", ""))
+    rag_postgres_db: str = Field(default_factory=lambda: os.getenv("RAG_POSTGRES_DB", "postgres"))
+    rag_postgres_schema: str = Field(default_factory=lambda: os.getenv("RAG_POSTGRES_SCHEMA", "public"))
+    rag_ingest_batch_size: int = Field(default_factory=lambda: int(os.getenv("AGENT_RAG_INGEST_BATCH_SIZE", "500")))
+
+    @property
+    def postgres_url(self) -> str:
+        return f"postgresql://{self.postgres_user}:{self.postgres_password}@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
+
+    @property
+    def rag_postgres_url(self) -> str:
+        return f"postgresql://{self.rag_postgres_user}:{self.rag_postgres_password}@{self.rag_postgres_host}:{self.rag_postgres_port}/{self.rag_postgres_db}"
+
+    @property
+    def redis_url(self) -> str:
+        if self.redis_password:
+            return f"redis://:{self.redis_password}@{self.redis_host}:{self.redis_port}/{self.redis_db}"
+        return f"redis://{self.redis_host}:{self.redis_port}/{self.redis_db}"
+
+    def fallback_list(self) -> List[str]:
+        return [m.strip() for m in self.fallback_models.split(",") if m.strip()]
+
+    def configured_models(self) -> List[str]:
+        """配置的模型：默认模型 + 回退模型链"""
+        return [self.model] + [m for m in self.fallback_list() if m != self.model]
+
+    def cors_list(self) -> List[str]:
+        raw = self.cors_origins or "*"
+        if raw == "*":
+            return ["*"]
+        return [o.strip() for o in raw.split(",")]
+
+
+# 加载后端环境变量文件 Backend/.env
+_ROOT = Path(__file__).resolve().parents[2]
+_ENV_PATH = _ROOT / ".env"
+if _ENV_PATH.exists():
+    load_dotenv(dotenv_path=str(_ENV_PATH))
+
+settings = LLMSettings()
+os.environ.setdefault("OPENAI_API_KEY", settings.api_key)
+os.environ.setdefault("OPENAI_BASE_URL", settings.base_url)
@@ -0,0 +1,167 @@
+"""
+会话历史压缩
+在token预算内组装注入系统提示词的会话历史：
+最近 N 条操作原样保留，更早的操作按分析类型汇总为一行摘要，超出预算时继续把最旧的原样条目并入摘要
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+# 结构化动作前缀 -> 分析类型：工具返回的 action（如 buffer.save_layer）或 "动作:图层" 格式（如 query:学校:…、show:学校）
+_ACTION_TYPES: Dict[str, str] = {
+    "buffer": "缓冲区分析",
+    "intersection": "相交分析",
+    "erase": "擦除分析",
+    "path": "最短路径分析",
+    "query": "属性查询",
+    "show": "图层显示",
+    "hide": "图层显示",
+    "toggle": "图层显示",
+}
+_ACTION_PREFIX = re.compile(r"^([a-z]+)[.:]")
+# 工具回执开头的动作短语（如 "相交分析操作已发送到前端"、"保存缓冲区分析结果为图层"），正文中的图层名称不参与识别
+_PHRASE_TYPES: Dict[str, str] = {"缓冲区": "缓冲区分析", "相交": "相交分析", "擦除": "擦除分析", "最短路径": "最短路径分析"}
+_LEADING_PHRASE = re.compile(r"^(?:(?:保存|导出)\s*)?(缓冲区|相交|擦除|最短路径)分析(?:操作|结果)")
+# 属性查询结果的保存/导出回执
+_QUERY_RECEIPT = re.compile(r"^(?:保存|导出)操作")
+_OTHER_TYPE = "其他操作"
+_CJK_PATTERN = re.compile(r"[　-〿一-鿿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本token数（不依赖分词器）。
+    中文字符及全角符号按每字 1 token，其余字符按每 4 个字符 1 token。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def format_entry(entry: str) -> str:
+    """历史条目格式化为提示词中的一行"""
+    if ":" in entry:
+        action, layer = entry.split(":", 1)
+        return f"action={action}; layer={layer}"
+    return entry
+
+
+def classify_entry(entry: str) -> str:
+    """
+    识别历史条目的分析类型。
+    业务处理：
+      - 只看条目开头的结构化动作前缀或动作短语，不扫描正文：
+        图层名称可能包含其它分析的关键字（如相交分析的目标图层 "缓冲区分析结果_学校_r500_s8"）
+    """
+    entry = entry.strip()
+    action = _ACTION_PREFIX.match(entry)
+    if action:
+        return _ACTION_TYPES.get(action.group(1), _OTHER_TYPE)
+    phrase = _LEADING_PHRASE.match(entry)
+    if phrase:
+        return _PHRASE_TYPES[phrase.group(1)]
+    if _QUERY_RECEIPT.match(entry):
+        return "属性查询"
+    return _OTHER_TYPE
+
+
+def latest_analysis_type(entries: Sequence[str]) -> Optional[str]:
+    """最近一次可保存/导出结果的分析类型（图层显示等操作不计入）"""
+    for entry in reversed(entries):
+        analysis_type = classify_entry(entry)
+        if analysis_type not in (_OTHER_TYPE, "图层显示"):
+            return analysis_type
+    return None
+
+
+@dataclass(frozen=True)
+class CompactHistory:
+    """压缩后的会话历史"""
+    history_text: str
+    last_action_text: str
+    summarized_count: int
+    tokens: int
+
+
+class HistoryCompactor:
+    """
+    按token预算压缩会话历史。
+    输入参数：
+      - keep_recent: 原样保留的最近操作条数
+      - max_tokens: 会话历史部分的token上限（硬上限）
+    """
+
+    def __init__(self, keep_recent: int = 10, max_tokens: int = 1000):
+        self._keep_recent = max(0, keep_recent)
+        self._max_tokens = max(0, max_tokens)
+
+    def compact(self, entries: Sequence[str], max_tokens: Optional[int] = None) -> CompactHistory:
+        """
+        压缩会话历史。
+        输入参数：
+          - entries: 会话历史条目（顺序，最新在后）
+          - max_tokens: 本次可用的token上限，默认使用构造参数，取两者较小值
+        输出数据格式：
+          - CompactHistory: history_text 为摘要行 + 原样保留的最近操作，last_action_text 为最近一次操作
+        """
+        budget = self._max_tokens if max_tokens is None else max(0, min(max_tokens, self._max_tokens))
+        if not entries:
+            return CompactHistory("", "", 0, 0)
+        last_action_text = format_entry(entries[-1])
+        split = max(0, len(entries) - self._keep_recent)
+        older = list(entries[:split])
+        recent = [format_entry(entry) for entry in entries[split:]]
+        recent_tokens = [estimate_tokens(line) + 1 for line in recent]
+
+        summary = self._summarize(older)
+        total = estimate_tokens(summary) + sum(recent_tokens)
+        # 超出预算：把最旧的原样条目并入摘要，直到满足预算或仅剩最近一条
+        while total > budget and len(recent) > 1:
+            older.append(entries[split])
+            split += 1
+            recent.pop(0)
+            recent_tokens.pop(0)
+            summary = self._summarize(older)
+            total = estimate_tokens(summary) + sum(recent_tokens)
+        if total > budget and older:
+            # 仍超出预算：摘要去掉"最近一次"明细，仅保留类型与次数
+            summary = self._summarize(older, detailed=False)
+            total = estimate_tokens(summary) + sum(recent_tokens)
+        lines = ([summary] if summary else []) + recent
+        history_text = "\n".join(lines)
+        if total > budget:
+            history_text = _truncate_to_tokens(history_text, budget)
+            total = estimate_tokens(history_text)
+        return CompactHistory(history_text, last_action_text, len(older), total)
+
+    @staticmethod
+    def _summarize(entries: Sequence[str], detailed: bool = True) -> str:
+        """较早操作按分析类型汇总：类型×次数（detailed 时附带该类型最近一次操作）"""
+        if not entries:
+            return ""
+        counts: Dict[str, int] = {}
+        latest: Dict[str, str] = {}
+        for entry in entries:
+            analysis_type = classify_entry(entry)
+            counts[analysis_type] = counts.get(analysis_type, 0) + 1
+            latest[analysis_type] = entry
+        parts: List[str] = [
+            f"{analysis_type}×{count}(最近: {format_entry(latest[analysis_type])})" if detailed else f"{analysis_type}×{count}"
+            for analysis_type, count in counts.items()
+        ]
+        return f"较早操作摘要({len(entries)}条): " + "；".join(parts)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """保留文本末尾（最新内容）使其不超过token上限"""
+    if max_tokens <= 0:
+        return ""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high) // 2
+        if estimate_tokens(text[mid:]) <= max_tokens:
+            high = mid
+        else:
+            low = mid + 1
+    return text[low:]
@@ -0,0 +1,342 @@
+"""
+会话历史存储
+按会话保存图层/分析操作历史，提供以下实现：
+  - InMemoryHistoryStore: 每个会话一个环形缓冲区，空闲超时淘汰，并受全局内存预算约束（仅适用于单 worker）
+  - RedisHistoryStore: 历史保存在 Redis 列表中，服务重启后保留，可被多台主机上的多个 uvicorn worker 共享
+  - SQLiteHistoryStore: 历史保存在本地 SQLite 文件中，同一主机的多个 worker 共享，也可作为测试用的本地替身
+每次请求都从存储读取会话历史，不依赖粘性会话
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+from agent.core.config import settings
+
+
+class ConversationHistoryStore(ABC):
+    """会话历史存储接口：子类须实现 get / extend / clear"""
+
+    @abstractmethod
+    async def get(self, conversation_id: str) -> List[str]:
+        """获取会话历史（顺序，最新在后）"""
+
+    @abstractmethod
+    async def extend(self, conversation_id: str, entries: Sequence[str]) -> None:
+        """按顺序追加多条历史"""
+
+    async def append(self, conversation_id: str, entry: str) -> None:
+        """追加一条历史"""
+        await self.extend(conversation_id, [entry])
+
+    @abstractmethod
+    async def clear(self, conversation_id: str) -> None:
+        """清除会话历史"""
+
+    async def close(self) -> None:
+        """释放底层连接"""
+
+
+class _Conversation:
+    __slots__ = ("entries", "size", "touched_at")
+
+    def __init__(self, max_entries: int):
+        self.entries: Deque[str] = deque(maxlen=max_entries)
+        self.size = 0
+        self.touched_at = time.monotonic()
+
+
+class InMemoryHistoryStore(ConversationHistoryStore):
+    """
+    进程内会话历史存储。
+    输入参数：
+      - max_entries: 每个会话保留的最大历史条数（环形缓冲区）
+      - idle_ttl: 会话空闲超过该秒数后淘汰，<=0 表示不按空闲时间淘汰
+      - max_total_bytes: 全部会话历史的内存预算（按 UTF-8 字节数估算），超出时淘汰最久未访问的会话
+    """
+
+    def __init__(self, max_entries: int = 50, idle_ttl: float = 3600, max_total_bytes: int = 16 * 1024 * 1024):
+        self._max_entries = max(1, max_entries)
+        self._idle_ttl = idle_ttl
+        self._max_total_bytes = max_total_bytes
+        self._conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    async def get(self, conversation_id: str) -> List[str]:
+        with self._lock:
+            self._evict_idle()
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return []
+            self._touch(conversation_id, conversation)
+            return list(conversation.entries)
+
+    async def extend(self, conversation_id: str, entries: Sequence[str]) -> None:
+        with self._lock:
+            self._evict_idle()
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                conversation = _Conversation(self._max_entries)
+                self._conversations[conversation_id] = conversation
+            for entry in entries:
+                if len(conversation.entries) == conversation.entries.maxlen:
+                    dropped = _entry_size(conversation.entries[0])
+                    conversation.size -= dropped
+                    self._total_bytes -= dropped
+                conversation.entries.append(entry)
+                added = _entry_size(entry)
+                conversation.size += added
+                self._total_bytes += added
+            self._touch(conversation_id, conversation)
+            self._enforce_budget(keep=conversation_id)
+
+    async def clear(self, conversation_id: str) -> None:
+        with self._lock:
+            self._remove(conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "conversations": len(self._conversations),
+                "total_bytes": self._total_bytes,
+                "max_total_bytes": self._max_total_bytes,
+            }
+
+    def _touch(self, conversation_id: str, conversation: _Conversation) -> None:
+        conversation.touched_at = time.monotonic()
+        self._conversations.move_to_end(conversation_id)
+
+    def _remove(self, conversation_id: str) -> None:
+        conversation = self._conversations.pop(conversation_id, None)
+        if conversation is not None:
+            self._total_bytes -= conversation.size
+
+    def _evict_idle(self) -> None:
+        """按访问顺序从最旧的会话开始淘汰空闲超时的会话"""
+        if self._idle_ttl <= 0:
+            return
+        deadline = time.monotonic() - self._idle_ttl
+        while self._conversations:
+            conversation_id, conversation = next(iter(self._conversations.items()))
+            if conversation.touched_at > deadline:
+                break
+            self._remove(conversation_id)
+
+    def _enforce_budget(self, keep: str) -> None:
+        """超出内存预算时淘汰最久未访问的会话，当前会话最后淘汰"""
+        while self._total_bytes > self._max_total_bytes and len(self._conversations) > 1:
+            conversation_id = next(iter(self._conversations))
+            if conversation_id == keep:
+                self._conversations.move_to_end(keep)
+                continue
+            self._remove(conversation_id)
+
+
+def _entry_size(entry: str) -> int:
+    return len(entry.encode("utf-8"))
+
+
+class RedisHistoryStore(ConversationHistoryStore):
+    """
+    Redis 会话历史存储。
+    业务处理：
+      - 每个会话对应一个 Redis 列表，RPUSH 追加后 LTRIM 保留最近 max_entries 条
+      - 每次读写刷新过期时间，空闲超过 idle_ttl 秒的会话由 Redis 自动淘汰
+    """
+
+    def __init__(self, url: str, max_entries: int = 50, idle_ttl: float = 3600, key_prefix: str = "agent:history:"):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url, encoding="utf-8", decode_responses=True, max_connections=20)
+        self._max_entries = max(1, max_entries)
+        self._idle_ttl = int(idle_ttl)
+        self._key_prefix = key_prefix
+
+    def _key(self, conversation_id: str) -> str:
+        return f"{self._key_prefix}{conversation_id}"
+
+    async def get(self, conversation_id: str) -> List[str]:
+        key = self._key(conversation_id)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.lrange(key, 0, -1)
+            if self._idle_ttl > 0:
+                pipe.expire(key, self._idle_ttl)
+            results = await pipe.execute()
+        return list(results[0] or [])
+
+    async def extend(self, conversation_id: str, entries: Sequence[str]) -> None:
+        if not entries:
+            return
+        key = self._key(conversation_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *entries)
+            pipe.ltrim(key, -self._max_entries, -1)
+            if self._idle_ttl > 0:
+                pipe.expire(key, self._idle_ttl)
+            await pipe.execute()
+
+    async def clear(self, conversation_id: str) -> None:
+        await self._redis.delete(self._key(conversation_id))
+
+    async def close(self) -> None:
+        await self._redis.close()
+
+
+class SQLiteHistoryStore(ConversationHistoryStore):
+    """
+    SQLite 会话历史存储。
+    输入参数：
+      - path: 数据库文件路径，':memory:' 表示进程内临时库（测试用）
+      - max_entries: 每个会话保留的最大历史条数
+      - idle_ttl: 会话空闲超过该秒数后淘汰，<=0 表示不淘汰
+    业务处理：
+      - WAL 模式 + busy_timeout，多个 worker 进程可并发读写同一文件；
+        读取为普通读事务（不加写锁），只有追加/裁剪/清除使用 BEGIN IMMEDIATE
+      - 阻塞的数据库操作在线程池中执行，不阻塞事件循环
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS conversation_history ("
+        " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " conversation_id TEXT NOT NULL,"
+        " entry TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_conversation_history_cid ON conversation_history (conversation_id, seq)",
+        "CREATE TABLE IF NOT EXISTS conversation_touch ("
+        " conversation_id TEXT PRIMARY KEY,"
+        " touched_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_conversation_touch_at ON conversation_touch (touched_at)",
+    )
+
+    def __init__(self, path: str = ":memory:", max_entries: int = 50, idle_ttl: float = 3600):
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._max_entries = max(1, max_entries)
+        self._idle_ttl = idle_ttl
+        self._touch_interval = min(60.0, idle_ttl / 10)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self._SCHEMA:
+            self._conn.execute(statement)
+
+    async def get(self, conversation_id: str) -> List[str]:
+        return await asyncio.to_thread(self._get, conversation_id)
+
+    async def extend(self, conversation_id: str, entries: Sequence[str]) -> None:
+        if entries:
+            await asyncio.to_thread(self._extend, conversation_id, list(entries))
+
+    async def clear(self, conversation_id: str) -> None:
+        await asyncio.to_thread(self._clear, conversation_id)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _get(self, conversation_id: str) -> List[str]:
+        # 读取使用普通（DEFERRED）事务，WAL 模式下多个读者互不阻塞；
+        # 已空闲超时的会话视为不存在，由下一次写入统一删除
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                touched = self._conn.execute(
+                    "SELECT touched_at FROM conversation_touch WHERE conversation_id = ?",
+                    (conversation_id,),
+                ).fetchone()
+                rows = self._conn.execute(
+                    "SELECT entry FROM conversation_history WHERE conversation_id = ? ORDER BY seq",
+                    (conversation_id,),
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+            now = time.time()
+            touched_at = touched[0] if touched is not None else None
+            if touched_at is not None and self._idle_ttl > 0 and touched_at < now - self._idle_ttl:
+                return []
+            # 访问时间只在超过刷新间隔后更新，读多写少时大部分读取不产生写入
+            if rows and self._idle_ttl > 0 and (touched_at is None or now - touched_at > self._touch_interval):
+                self._touch(conversation_id)
+        return [row[0] for row in rows]
+
+    def _extend(self, conversation_id: str, entries: List[str]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._evict_idle()
+                self._conn.executemany(
+                    "INSERT INTO conversation_history (conversation_id, entry) VALUES (?, ?)",
+                    [(conversation_id, entry) for entry in entries],
+                )
+                self._conn.execute(
+                    "DELETE FROM conversation_history WHERE conversation_id = ? AND seq <= ("
+                    " SELECT seq FROM conversation_history WHERE conversation_id = ?"
+                    " ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                    (conversation_id, conversation_id, self._max_entries),
+                )
+                self._touch(conversation_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _clear(self, conversation_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM conversation_history WHERE conversation_id = ?", (conversation_id,))
+                self._conn.execute("DELETE FROM conversation_touch WHERE conversation_id = ?", (conversation_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _touch(self, conversation_id: str) -> None:
+        self._conn.execute(
+            "INSERT INTO conversation_touch (conversation_id, touched_at) VALUES (?, ?)"
+            " ON CONFLICT(conversation_id) DO UPDATE SET touched_at = excluded.touched_at",
+            (conversation_id, time.time()),
+        )
+
+    def _evict_idle(self) -> None:
+        if self._idle_ttl <= 0:
+            return
+        deadline = time.time() - self._idle_ttl
+        self._conn.execute(
+            "DELETE FROM conversation_history WHERE conversation_id IN ("
+            " SELECT conversation_id FROM conversation_touch WHERE touched_at < ?)",
+            (deadline,),
+        )
+        self._conn.execute("DELETE FROM conversation_touch WHERE touched_at < ?", (deadline,))
+
+
+def create_history_store(backend: Optional[str] = None) -> ConversationHistoryStore:
+    """根据配置创建会话历史存储：memory（默认）| redis | sqlite"""
+    backend = (backend or settings.history_backend).lower()
+    if backend == "redis":
+        return RedisHistoryStore(
+            settings.redis_url,
+            max_entries=settings.history_max_entries,
+            idle_ttl=settings.history_idle_ttl,
+        )
+    if backend == "sqlite":
+        return SQLiteHistoryStore(
+            settings.history_sqlite_path,
+            max_entries=settings.history_max_entries,
+            idle_ttl=settings.history_idle_ttl,
+        )
+    if backend != "memory":
+        raise ValueError(f"不支持的会话历史存储: {backend}")
+    return InMemoryHistoryStore(
+        max_entries=settings.history_max_entries,
+        idle_ttl=settings.history_idle_ttl,
+        max_total_bytes=settings.history_max_total_bytes,
+    )
@@ -0,0 +1,243 @@
+"""
+LLM调用基础设施
+提供异步调用/流式调用（超时与断开取消）以及按模型参数缓存的已绑定工具模型
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from fastapi import Request
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from agent.core.config import settings
+from agent.core.rate_limiter import is_retryable, message_tokens, upstream_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class ClientDisconnected(Exception):
+    """客户端在LLM调用完成前断开连接"""
+
+
+async def _wait_for_disconnect(request: Request, interval: float = 0.5) -> None:
+    """轮询客户端连接状态，断开时返回"""
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+
+
+async def ainvoke_llm(
+    llm: Any,
+    messages: List[Any],
+    request: Optional[Request] = None,
+    timeout: Optional[float] = None,
+    model_key: Optional[Tuple[str, float, int]] = None,
+) -> AIMessage:
+    """
+    异步调用LLM，不阻塞事件循环。
+    输入参数：
+      - llm: 已绑定工具的聊天模型
+      - messages: 消息列表
+      - request: 当前HTTP请求，用于检测客户端断开
+      - timeout: 超时时间（秒），默认使用 settings.request_timeout
+      - model_key: 模型注册表的键（ChatModelRegistry.model_key），提供时相同请求合并为一次上游调用
+    业务处理：
+      - 通过全局限流调度器发起 ainvoke 调用（排队、重试、相同请求合并），与断开检测任务并发等待
+      - 超时抛出 asyncio.TimeoutError，客户端断开抛出 ClientDisconnected，两种情况均取消上游调用
+    输出数据格式：
+      - AIMessage
+    """
+    llm_task = asyncio.ensure_future(upstream_limiter.ainvoke(llm, messages, model_key))
+    waiters = {llm_task}
+    watcher = None
+    if request is not None:
+        watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+        waiters.add(watcher)
+    try:
+        done, _ = await asyncio.wait(
+            waiters,
+            timeout=timeout if timeout is not None else settings.request_timeout,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if llm_task in done:
+            return llm_task.result()
+        if watcher is not None and watcher in done:
+            raise ClientDisconnected()
+        raise asyncio.TimeoutError()
+    finally:
+        for task in waiters:
+            if not task.done():
+                task.cancel()
+
+
+async def astream_llm(llm: Any, messages: List[Any], timeout: Optional[float] = None) -> AsyncIterator[AIMessageChunk]:
+    """
+    流式调用LLM，逐片产出 AIMessageChunk。
+    输入参数：
+      - llm: 已绑定工具的聊天模型
+      - messages: 消息列表
+      - timeout: 整次流式调用的超时时间（秒），默认使用 settings.request_timeout
+    业务处理：
+      - 以整次调用为截止时间，等待每个分片时仅使用剩余时间，超时抛出 asyncio.TimeoutError
+      - 整个流式调用占用一个全局并发名额；首个分片到达前的可重试错误按退避重试，之后不再重试
+      - 客户端断开时由 StreamingResponse 取消生成器，上游流随之关闭
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (timeout if timeout is not None else settings.request_timeout)
+
+    async def next_chunk(stream: Any) -> AIMessageChunk:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        return await asyncio.wait_for(stream.__anext__(), timeout=remaining)
+
+    estimated = message_tokens(messages)
+    attempt = 0
+    while True:
+        async with upstream_limiter.slot(estimated):
+            stream = llm.astream(messages)
+            try:
+                try:
+                    chunk = await next_chunk(stream)
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    if attempt >= upstream_limiter.max_retries or not is_retryable(e):
+                        raise
+                    error = e
+                else:
+                    aggregate = chunk
+                    yield chunk
+                    while True:
+                        try:
+                            chunk = await next_chunk(stream)
+                        except StopAsyncIteration:
+                            break
+                        aggregate = aggregate + chunk
+                        yield chunk
+                    upstream_limiter.settle(estimated, aggregate)
+                    return
+            finally:
+                await stream.aclose()
+        await upstream_limiter.backoff(attempt, error)
+        attempt += 1
+
+
+class ChatModelRegistry:
+    """
+    进程级已绑定工具模型缓存。
+    业务处理：
+      - 以 (模型名称, 采样温度, 最大token数) 为键缓存 bind_tools 后的模型，LRU 淘汰
+      - 所有模型共享同一组 keep-alive HTTP 连接池，复用到LLM端点的TLS连接（首次创建模型或探测时建立，不计入导入耗时）
+      - 关闭客户端内置重试，重试统一由 upstream_limiter 调度
+    """
+
+    def __init__(self, tools: Sequence[Any], max_size: int = 8):
+        self._tools = list(tools)
+        self._max_size = max(1, max_size)
+        self._models: "OrderedDict[Tuple[str, float, int], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._http_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None
+        self._probe_lock: Optional[asyncio.Lock] = None
+        self._last_probe: Optional[Dict[str, Any]] = None
+
+    def _clients(self) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """共享的同步/异步HTTP客户端（创建传输层会导入 httpcore，延迟到首次使用）"""
+        with self._lock:
+            if self._http_clients is None:
+                limits = httpx.Limits(
+                    max_connections=settings.http_max_connections,
+                    max_keepalive_connections=settings.http_max_keepalive,
+                    keepalive_expiry=settings.http_keepalive_expiry,
+                )
+                self._http_clients = (
+                    httpx.Client(limits=limits, timeout=settings.request_timeout),
+                    httpx.AsyncClient(limits=limits, timeout=settings.request_timeout),
+                )
+            return self._http_clients
+
+    @staticmethod
+    def model_key(model: str, temperature: float, max_tokens: Optional[int] = None) -> Tuple[str, float, int]:
+        """模型缓存键 (模型名称, 采样温度, 最大token数)，同时作为上游请求合并键的一部分"""
+        return model, round(float(temperature), 3), int(max_tokens or settings.max_tokens)
+
+    def get(self, model: str, temperature: float, max_tokens: Optional[int] = None) -> Any:
+        """获取（必要时创建）已绑定工具的模型"""
+        key = self.model_key(model, temperature, max_tokens)
+        with self._lock:
+            bound = self._models.get(key)
+            if bound is not None:
+                self._models.move_to_end(key)
+                return bound
+        # 延迟导入：langchain 及 OpenAI 集成仅在首次创建模型时加载
+        from langchain.chat_models import init_chat_model
+
+        http_client, http_async_client = self._clients()
+        chat_model = init_chat_model(
+            f"openai:{model}",
+            temperature=key[1],
+            max_tokens=key[2],
+            stream_usage=True,
+            max_retries=0,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
+        bound = chat_model.bind_tools(self._tools)
+        with self._lock:
+            bound = self._models.setdefault(key, bound)
+            self._models.move_to_end(key)
+            while len(self._models) > self._max_size:
+                self._models.popitem(last=False)
+        return bound
+
+    async def _probe(self) -> Dict[str, Any]:
+        """请求 OpenAI 兼容的 /models 接口，检查LLM端点可达；请求同时使 TLS 连接进入共享连接池"""
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"ok": False, "status_code": None, "latency_ms": None, "error": None, "checked_at": time.time()}
+        try:
+            response = await self._clients()[1].get(
+                f"{settings.base_url.rstrip('/')}/models",
+                headers={"Authorization": f"Bearer {settings.api_key}"},
+                timeout=settings.warmup_timeout,
+            )
+            result["status_code"] = response.status_code
+            result["ok"] = response.status_code < 500 and response.status_code not in (401, 403)
+        except httpx.HTTPError as e:
+            result["error"] = repr(e)
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000)
+        return result
+
+    async def reachability(self) -> Dict[str, Any]:
+        """上游可达性（缓存 settings.ready_cache_ttl 秒，并发探测合并为一次）"""
+        if self._probe_lock is None:
+            self._probe_lock = asyncio.Lock()
+        async with self._probe_lock:
+            cached = self._last_probe
+            if cached is None or time.time() - cached["checked_at"] >= settings.ready_cache_ttl:
+                self._last_probe = cached = await self._probe()
+            return cached
+
+    async def warm_up(self) -> None:
+        """预热到LLM端点的连接，失败只记录警告，不影响服务启动"""
+        result = await self.reachability()
+        if result["ok"]:
+            logger.info("LLM连接预热完成: HTTP %s", result["status_code"])
+        else:
+            logger.warning("LLM连接预热失败: %s", result["error"] or result["status_code"])
+
+    def clear(self) -> None:
+        """清空模型缓存"""
+        with self._lock:
+            self._models.clear()
+
+    async def aclose(self) -> None:
+        """关闭共享HTTP连接池"""
+        self.clear()
+        with self._lock:
+            clients, self._http_clients = self._http_clients, None
+        if clients is not None:
+            clients[0].close()
+            await clients[1].aclose()
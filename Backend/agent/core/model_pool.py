@@ -0,0 +1,264 @@
+"""
+模型池
+按回退链（例如 qwen-max -> qwen-turbo）调用模型，按各模型的延迟统计决定路由与对冲请求
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import Request
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from agent.core.config import settings
+from agent.core.llm import ChatModelRegistry, ClientDisconnected, ainvoke_llm, astream_llm
+from agent.core.tracing import current_trace
+
+# 不触发回退的错误：客户端断开（单个模型超时按上游错误处理，换下一个模型）
+_NO_FALLBACK = (ClientDisconnected,)
+
+
+class ModelLatencyStats:
+    """单个模型最近若干次调用的延迟与成败统计"""
+
+    def __init__(self, window: int) -> None:
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self.hedged_wins = 0
+
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        self.calls += 1
+        self._outcomes.append(ok)
+        if ok and latency is not None:
+            self._latencies.append(latency)
+        if not ok:
+            self.failures += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """最近成功调用延迟的分位数（秒），无样本时返回 None"""
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    @property
+    def error_rate(self) -> float:
+        return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "hedged_wins": self.hedged_wins,
+            "samples": self.samples,
+            "error_rate": round(self.error_rate, 4),
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+        }
+
+
+class ModelPool:
+    """
+    带回退链与对冲请求的模型池。
+    业务处理：
+      - 路由：请求模型在前，配置的回退模型按顺序在后；近期错误率超过阈值的模型移到链尾
+      - 回退：上游报错或单个模型超时时依次尝试链上的下一个模型（客户端断开不回退）；
+        每个模型有独立的超时（attempt_timeout），慢的首选模型不会耗尽整次调用的时间
+      - 对冲：首选模型在其 p95 延迟内未返回时，并发请求链上的下一个模型，采用先返回的有效结果并取消另一个
+      - 流式调用仅在首个分片到达前回退，不做对冲
+      - 延迟统计：配置的模型（默认模型与回退模型链）始终保留，请求中的其它模型按 LRU 最多保留 settings.model_cache_size 个
+    """
+
+    def __init__(
+        self,
+        registry: ChatModelRegistry,
+        fallback_models: List[str],
+        validate: Optional[Callable[[AIMessage], bool]] = None,
+    ) -> None:
+        self.registry = registry
+        self.fallback_models = [model for model in fallback_models if model]
+        self._validate = validate or (lambda message: True)
+        self._stats: "OrderedDict[str, ModelLatencyStats]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hedges = 0
+
+    def _model_stats(self, model: str) -> ModelLatencyStats:
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = self._stats[model] = ModelLatencyStats(settings.model_stats_window)
+                self._evict()
+            self._stats.move_to_end(model)
+            return stats
+
+    def _evict(self) -> None:
+        """模型名称来自请求：淘汰最久未使用的未配置模型统计，使其数量不超过 settings.model_cache_size（调用方持有锁）"""
+        pinned = set(settings.configured_models()) | set(self.fallback_models)
+        unpinned = [name for name in self._stats if name not in pinned]
+        for name in unpinned[:max(0, len(unpinned) - max(1, settings.model_cache_size))]:
+            del self._stats[name]
+
+    def route(self, model: str) -> List[str]:
+        """本次调用的模型顺序"""
+        chain = [model] + [fallback for fallback in self.fallback_models if fallback != model]
+        healthy = [name for name in chain if self._model_stats(name).error_rate <= settings.model_max_error_rate]
+        return healthy + [name for name in chain if name not in healthy]
+
+    def preload(self, model: str, temperature: float) -> None:
+        """预创建模型及其回退模型"""
+        for name in self.route(model):
+            self.registry.get(name, temperature)
+
+    def attempt_timeout(self, chain_length: int) -> float:
+        """单个模型的调用超时：配置了 AGENT_MODEL_ATTEMPT_TIMEOUT 时使用该值，否则把 request_timeout 平分给链上各模型"""
+        if settings.model_attempt_timeout > 0:
+            return settings.model_attempt_timeout
+        return settings.request_timeout / max(1, chain_length)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """对冲等待时间：样本足够时取 p95 延迟（不低于配置下限），否则不对冲"""
+        if not settings.hedge_enabled:
+            return None
+        stats = self._model_stats(model)
+        if stats.samples < settings.hedge_min_samples:
+            return None
+        return max(settings.hedge_min_delay, stats.percentile(settings.hedge_percentile) or 0.0)
+
+    async def _timed_invoke(self, model: str, temperature: float, messages: List[Any], request: Optional[Request], timeout: float) -> AIMessage:
+        llm = self.registry.get(model, temperature)
+        started = time.perf_counter()
+        try:
+            result = await ainvoke_llm(llm, messages, request, timeout, model_key=self.registry.model_key(model, temperature))
+        except (asyncio.CancelledError, ClientDisconnected):
+            raise
+        except Exception as e:
+            self._model_stats(model).record(None, False)
+            self._trace(model, None, started, e)
+            raise
+        self._model_stats(model).record(time.perf_counter() - started, True)
+        self._trace(model, result, started)
+        return result
+
+    @staticmethod
+    def _trace(model: str, message: Any, started: float, error: Optional[BaseException] = None) -> None:
+        """记录到当前请求的耗时分解"""
+        trace = current_trace()
+        if trace is not None:
+            trace.record_llm(model, message, time.perf_counter() - started, error)
+
+    async def _hedged_invoke(
+        self,
+        chain: List[str],
+        temperature: float,
+        messages: List[Any],
+        request: Optional[Request],
+        tried: Set[str],
+        timeout: float,
+    ) -> Tuple[str, AIMessage]:
+        """调用 chain[0]，超过其 p95 延迟仍未返回时对冲 chain[1]；已发起调用的模型加入 tried，每个调用各自超时"""
+        tried.add(chain[0])
+        tasks: Dict[asyncio.Future, str] = {asyncio.ensure_future(self._timed_invoke(chain[0], temperature, messages, request, timeout)): chain[0]}
+        try:
+            delay = self.hedge_delay(chain[0]) if len(chain) > 1 else None
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self.hedges += 1
+                    tried.add(chain[1])
+                    tasks[asyncio.ensure_future(self._timed_invoke(chain[1], temperature, messages, request, timeout))] = chain[1]
+            pending: Set[asyncio.Future] = set(tasks)
+            fallback: Optional[Tuple[str, AIMessage]] = None
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error if isinstance(error, _NO_FALLBACK) else task.exception()
+                        continue
+                    model = tasks[task]
+                    if self._validate(task.result()):
+                        if len(tasks) > 1 and model != chain[0]:
+                            self._model_stats(model).hedged_wins += 1
+                        return model, task.result()
+                    fallback = fallback or (model, task.result())
+            if fallback is not None:
+                return fallback
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def ainvoke(self, model: str, temperature: float, messages: List[Any], request: Optional[Request] = None) -> AIMessage:
+        """
+        按回退链（含对冲）调用模型。
+        输出数据格式：
+          - AIMessage；所有模型均失败（或超时）时抛出最后一个错误
+        """
+        chain = self.route(model)
+        timeout = self.attempt_timeout(len(chain))
+        tried: Set[str] = set()
+        error: Optional[BaseException] = None
+        while True:
+            remaining = [name for name in chain if name not in tried]
+            if not remaining:
+                raise error
+            try:
+                _, result = await self._hedged_invoke(remaining, temperature, messages, request, tried, timeout)
+                return result
+            except _NO_FALLBACK:
+                raise
+            except Exception as e:
+                error = e
+
+    async def astream(self, model: str, temperature: float, messages: List[Any]) -> AsyncIterator[AIMessageChunk]:
+        """
+        按回退链流式调用模型：首个分片到达前报错（含超时）则换下一个模型，之后的错误直接抛出。
+        每个模型的整段流与非流式调用一样使用 attempt_timeout，整次调用不超过链上各模型超时之和。
+        流式调用只记录成败，不计入延迟样本（整段流耗时与非流式调用延迟不可比）。
+        """
+        chain = self.route(model)
+        timeout = self.attempt_timeout(len(chain))
+        for index, name in enumerate(chain):
+            llm = self.registry.get(name, temperature)
+            started = time.perf_counter()
+            aggregate: Optional[AIMessageChunk] = None
+            try:
+                async for chunk in astream_llm(llm, messages, timeout):
+                    aggregate = chunk if aggregate is None else aggregate + chunk
+                    yield chunk
+            except _NO_FALLBACK as e:
+                self._model_stats(name).record(None, False)
+                self._trace(name, aggregate, started, e)
+                raise
+            except Exception as e:
+                self._model_stats(name).record(None, False)
+                self._trace(name, aggregate, started, e)
+                if aggregate is not None or index == len(chain) - 1:
+                    raise
+                continue
+            self._model_stats(name).record(None, True)
+            self._trace(name, aggregate, started)
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {name: stats.snapshot() for name, stats in self._stats.items()}
+        return {
+            "fallback_models": self.fallback_models,
+            "hedge_enabled": settings.hedge_enabled,
+            "hedges": self.hedges,
+            "models": models,
+        }
+
+    async def aclose(self) -> None:
+        await self.registry.aclose()
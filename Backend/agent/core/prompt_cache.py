@@ -0,0 +1,86 @@
+"""
+提示词缓存
+系统提示词按"静态前缀 + 动态尾部"组装，使上游服务的前缀缓存可以命中；
+并统计缓存命中/未命中的提示词token数
+"""
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.messages import SystemMessage
+
+from agent.core.config import settings
+
+# off: 不做处理；auto: 依赖服务端隐式前缀缓存；explicit: 为静态前缀附加 cache_control 标记
+PROMPT_CACHE_MODES = ("off", "auto", "explicit")
+
+
+def build_system_message(static_prefix: str, dynamic_suffix: str = "", mode: Optional[str] = None) -> SystemMessage:
+    """
+    组装系统消息。
+    输入参数：
+      - static_prefix: 启动时预先构建的静态提示词，跨请求保持不变
+      - dynamic_suffix: 会话相关的动态内容，始终追加在末尾
+      - mode: 提示词缓存模式，默认使用 settings.prompt_cache_mode
+    输出数据格式：
+      - SystemMessage: explicit 模式下为内容块列表，静态块带 cache_control 标记；其它模式为纯文本
+    """
+    mode = mode or settings.prompt_cache_mode
+    if mode != "explicit":
+        return SystemMessage(content=static_prefix + dynamic_suffix)
+    blocks = [{"type": "text", "text": static_prefix, "cache_control": {"type": "ephemeral"}}]
+    if dynamic_suffix:
+        blocks.append({"type": "text", "text": dynamic_suffix})
+    return SystemMessage(content=blocks)
+
+
+def prompt_token_usage(message: Any) -> Tuple[int, int]:
+    """
+    读取一次调用的提示词token数与其中命中缓存的token数。
+    优先使用 LangChain usage_metadata，回退到 OpenAI 兼容的 token_usage.prompt_tokens_details。
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return int(usage.get("input_tokens") or 0), int(details.get("cache_read") or 0)
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    details = token_usage.get("prompt_tokens_details") or {}
+    return int(token_usage.get("prompt_tokens") or 0), int(details.get("cached_tokens") or 0)
+
+
+class PromptCacheStats:
+    """进程级提示词缓存统计"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._prompt_tokens = 0
+        self._cached_tokens = 0
+
+    def record(self, message: Any) -> None:
+        """记录一次LLM调用的提示词token使用情况"""
+        prompt_tokens, cached_tokens = prompt_token_usage(message)
+        with self._lock:
+            self._calls += 1
+            self._prompt_tokens += prompt_tokens
+            self._cached_tokens += cached_tokens
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            uncached = self._prompt_tokens - self._cached_tokens
+            return {
+                "mode": settings.prompt_cache_mode,
+                "calls": self._calls,
+                "prompt_tokens": self._prompt_tokens,
+                "cached_prompt_tokens": self._cached_tokens,
+                "uncached_prompt_tokens": uncached,
+                "cache_hit_ratio": round(self._cached_tokens / self._prompt_tokens, 4) if self._prompt_tokens else 0.0,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls = 0
+            self._prompt_tokens = 0
+            self._cached_tokens = 0
+
+
+prompt_cache_stats = PromptCacheStats()
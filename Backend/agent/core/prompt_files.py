@@ -0,0 +1,72 @@
+"""
+提示词文件缓存
+提示词文件只在首次访问时读取，之后按修改时间（mtime）热重载；mtime 检查有最小间隔，避免每次访问都访问磁盘
+"""
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class PromptFile:
+    """
+    按候选路径加载的提示词文件。
+    业务处理：
+      - 依次使用第一个存在的候选路径，全部不存在或读取失败时返回 fallback
+      - 距上次检查超过 check_interval 秒才重新 stat，mtime 或路径变化时重新读取
+    """
+
+    def __init__(self, candidates: Sequence[Path], fallback: str = "", check_interval: float = 5.0) -> None:
+        self.candidates = [Path(path) for path in candidates]
+        self.fallback = fallback
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._content: Optional[str] = None
+        self._path: Optional[Path] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self.loaded = False
+
+    def _resolve(self) -> Optional[Path]:
+        for path in self.candidates:
+            if path.exists():
+                return path
+        return None
+
+    def _reload_if_changed(self) -> None:
+        path = self._resolve()
+        try:
+            mtime = path.stat().st_mtime if path is not None else None
+        except OSError:
+            path, mtime = None, None
+        if self._content is not None and path == self._path and mtime == self._mtime:
+            return
+        if path is None:
+            logger.info("未找到提示词文件: %s", ", ".join(str(p) for p in self.candidates))
+            self._content, self.loaded = self.fallback, False
+        else:
+            try:
+                self._content = path.read_text(encoding="utf-8")
+                self.loaded = True
+                logger.info("成功加载提示词: %s", path)
+            except Exception as e:
+                logger.warning("加载提示词失败: %s: %s", path, e)
+                self._content, self.loaded = self.fallback, False
+        self._path, self._mtime = path, mtime
+
+    def read(self) -> str:
+        """返回提示词内容（必要时检查文件变化并重新加载）"""
+        now = time.monotonic()
+        with self._lock:
+            if self._content is None or now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                self._reload_if_changed()
+            return self._content
+
+    @property
+    def path(self) -> Optional[Path]:
+        """当前加载的文件路径（尚未加载或未找到时为 None）"""
+        return self._path
@@ -0,0 +1,283 @@
+"""
+上游LLM调用限流
+全局并发上限 + 请求数/token数令牌桶，失败按抖动指数退避重试，相同的进行中请求合并为一次上游调用
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import httpx
+
+from agent.core.config import settings
+from agent.core.history_compactor import estimate_tokens
+
+# 可重试的上游HTTP状态码
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    异步令牌桶。
+    业务处理：
+      - 按 rate（每秒）持续补充，最多累积 capacity
+      - 获取时令牌不足则按缺口等待；等待者按到达顺序（FIFO）排队
+      - rate <= 0 表示不限流
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self, now: float) -> None:
+        if self._updated is not None:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """获取令牌，返回等待秒数；单次获取量不超过桶容量"""
+        if not self.enabled:
+            return 0.0
+        amount = min(float(amount), self.capacity)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill(loop.time())
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def adjust(self, delta: float) -> None:
+        """按实际用量修正预扣的令牌（delta > 0 追加扣除，< 0 归还），最多透支一个桶容量"""
+        if not self.enabled:
+            return
+        self._tokens = max(-self.capacity, min(self.capacity, self._tokens - delta))
+
+
+def message_tokens(messages: List[Any]) -> int:
+    """估算消息列表的提示词token数"""
+    total = 0
+    for message in messages:
+        content = getattr(message, "content", "")
+        if isinstance(content, list):
+            content = "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+        total += estimate_tokens(str(content))
+    return total
+
+
+def usage_tokens(message: Any) -> Optional[int]:
+    """读取一次调用的实际token用量（输入 + 输出），无用量信息时返回 None"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage.get("total_tokens"):
+        return int(usage["total_tokens"])
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    if token_usage.get("total_tokens"):
+        return int(token_usage["total_tokens"])
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """限流、超时、连接错误与服务端 5xx 可重试"""
+    import openai  # 随 OpenAI 集成延迟加载，首次创建模型后已在 sys.modules 中
+
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError, httpx.TransportError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status in RETRYABLE_STATUS
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """读取上游返回的 Retry-After（秒）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def messages_key(model_key: Hashable, messages: List[Any]) -> str:
+    """
+    相同模型参数与相同消息列表的合并键。
+    model_key 为模型注册表的键 (模型名称, 采样温度, 最大token数)，不使用实例 id：
+    实例被淘汰后 id 可能被新实例复用
+    """
+    payload = [
+        (type(message).__name__, message.content, getattr(message, "tool_calls", None), getattr(message, "tool_call_id", None))
+        for message in messages
+    ]
+    raw = json.dumps([model_key, payload], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class UpstreamLimiter:
+    """
+    进程级上游调用调度器。
+    业务处理：
+      - 并发上限：asyncio 信号量，超出的调用排队
+      - 请求速率：QPS 令牌桶（容量为 1 秒的请求数，允许小突发）
+      - token 速率：TPM 令牌桶，调用前按提示词估算预扣，完成后按实际用量修正
+      - 重试：可重试错误按全抖动指数退避（优先遵循 Retry-After），避免重试风暴
+      - 合并：相同模型参数、相同消息的进行中非流式调用共享同一次上游请求，全部等待者取消时才取消上游请求
+      - 用量：每次成功的上游调用（含流式）通知一次 listeners，合并的等待者不重复计数
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        qps: float,
+        tpm: float,
+        max_retries: int,
+        base_delay: float,
+        max_delay: float,
+        coalesce: bool = True,
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.coalesce = coalesce
+        self._requests = TokenBucket(qps, max(1.0, qps))
+        self._tokens = TokenBucket(tpm / 60.0, tpm)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, List[Any]] = {}
+        self._listeners: List[Callable[[Any], None]] = []
+        self._stats_lock = threading.Lock()
+        self._stats = {"calls": 0, "active": 0, "waiting": 0, "retries": 0, "coalesced": 0, "throttled_seconds": 0.0}
+
+    def _count(self, key: str, value: float = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += value
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int) -> AsyncIterator[None]:
+        """占用一个并发名额并通过速率限制后执行上游调用"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._count("waiting")
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._count("waiting", -1)
+        try:
+            waited = await self._requests.acquire(1)
+            waited += await self._tokens.acquire(estimated_tokens)
+            self._count("throttled_seconds", waited)
+            self._count("calls")
+            self._count("active")
+            try:
+                yield
+            finally:
+                self._count("active", -1)
+        finally:
+            self._semaphore.release()
+
+    def add_listener(self, listener: Callable[[Any], None]) -> None:
+        """注册上游调用完成回调（参数为该次调用的 AIMessage，用于按上游调用统计用量）"""
+        self._listeners.append(listener)
+
+    def settle(self, estimated_tokens: int, message: Any) -> None:
+        """一次上游调用完成：按实际token用量修正 TPM 令牌桶，并通知 listeners"""
+        actual = usage_tokens(message)
+        if actual is not None:
+            self._tokens.adjust(actual - estimated_tokens)
+        for listener in self._listeners:
+            listener(message)
+
+    async def backoff(self, attempt: int, error: BaseException) -> None:
+        """第 attempt 次重试前等待：全抖动指数退避，上游给出 Retry-After 时以其为下限"""
+        self._count("retries")
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        hinted = retry_after(error)
+        if hinted is not None:
+            delay = max(delay, min(hinted, self.max_delay))
+        await asyncio.sleep(delay)
+
+    async def _invoke_with_retry(self, call: Callable[[], Awaitable[Any]], estimated_tokens: int) -> Any:
+        attempt = 0
+        while True:
+            async with self.slot(estimated_tokens):
+                try:
+                    result = await call()
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    error = e
+                else:
+                    self.settle(estimated_tokens, result)
+                    return result
+            await self.backoff(attempt, error)
+            attempt += 1
+
+    async def ainvoke(self, llm: Any, messages: List[Any], model_key: Optional[Hashable] = None) -> Any:
+        """
+        受限流控制的 llm.ainvoke。
+        输入参数：
+          - model_key: 模型注册表的键，用于合并相同请求；为空时不合并
+        输出数据格式：
+          - AIMessage；合并的调用共享同一个结果对象
+        """
+        estimated = message_tokens(messages)
+        if not self.coalesce or model_key is None:
+            return await self._invoke_with_retry(lambda: llm.ainvoke(messages), estimated)
+        key = messages_key(model_key, messages)
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(self._invoke_with_retry(lambda: llm.ainvoke(messages), estimated))
+            entry = [task, 0]
+            self._inflight[key] = entry
+            task.add_done_callback(lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is entry else None)
+        else:
+            self._count("coalesced")
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["throttled_seconds"] = round(snapshot["throttled_seconds"], 3)
+        snapshot.update({
+            "max_concurrency": self.max_concurrency,
+            "qps": self._requests.rate,
+            "tpm": round(self._tokens.rate * 60),
+            "inflight_unique": len(self._inflight),
+        })
+        return snapshot
+
+
+upstream_limiter = UpstreamLimiter(
+    max_concurrency=settings.llm_max_concurrency,
+    qps=settings.llm_qps,
+    tpm=settings.llm_tpm,
+    max_retries=settings.llm_max_retries,
+    base_delay=settings.llm_retry_base_delay,
+    max_delay=settings.llm_retry_max_delay,
+    coalesce=settings.llm_coalesce,
+)
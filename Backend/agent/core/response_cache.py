@@ -0,0 +1,135 @@
+"""
+工具决策响应缓存
+以"规范化后的用户输入 + 影响工具选择的会话状态 + 模型"为键缓存第一步调用返回的工具调用，
+重复的指令直接复用缓存的工具决策，无需请求LLM。
+缓存在进程内跨会话共享，因此只缓存参数完全取自用户输入的决策：
+"隐藏刚才打开的图层"这类依赖上下文的指令，参数来自会话历史，不同会话不能复用
+"""
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = "。.!！?？~ "
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+# 取值为固定枚举、由指令措辞映射而来的参数（如 打开->show、米->meters、=->eq），不要求原文出现在输入中
+_ENUM_ARGS = frozenset({"action", "operator", "unit"})
+
+
+def normalize_prompt(prompt: str) -> str:
+    """规范化用户输入：全角转半角、小写、合并空白、去除末尾标点"""
+    text = unicodedata.normalize("NFKC", prompt).lower()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+def prompt_derived(prompt: str, tool_calls: List[Dict[str, Any]]) -> bool:
+    """
+    工具调用的参数是否完全取自用户输入。
+    业务处理：
+      - 字符串参数须出现在规范化后的输入中；数值参数须与输入中的某个数字相等
+      - 枚举参数（action / operator / unit）与空值不做要求，其它类型的参数视为依赖上下文
+    """
+    text = normalize_prompt(prompt)
+    numbers = {float(number) for number in _NUMBER.findall(text)}
+    for call in tool_calls:
+        for key, value in (call.get("args") or {}).items():
+            if value is None or value == "" or key in _ENUM_ARGS or isinstance(value, bool):
+                continue
+            if isinstance(value, (int, float)):
+                if float(value) not in numbers:
+                    return False
+            elif not isinstance(value, str) or normalize_prompt(value) not in text:
+                return False
+    return True
+
+
+@dataclass
+class _CacheEntry:
+    tool_calls: List[Dict[str, Any]]
+    expires_at: float
+
+
+class ResponseCache:
+    """
+    工具决策缓存，TTL 过期 + LRU 淘汰。
+    输入参数：
+      - max_size: 最大缓存条数
+      - ttl: 缓存有效期（秒）
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 600):
+        self._max_size = max(1, max_size)
+        self._ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str, str], _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._rejected = 0
+
+    def get(self, prompt: str, state: str, model: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        查找缓存的工具调用。
+        输出数据格式：
+          - list: 工具调用（每次命中重新生成调用ID）；未命中返回 None
+        """
+        key = (model, state, normalize_prompt(prompt))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return _fresh_ids(entry.tool_calls)
+
+    def put(self, prompt: str, state: str, model: str, tool_calls: List[Dict[str, Any]]) -> bool:
+        """缓存一次工具决策；参数依赖上下文（不完全取自输入）的决策不缓存，返回是否已缓存"""
+        if not tool_calls or not prompt_derived(prompt, tool_calls):
+            with self._lock:
+                self._rejected += 1
+            return False
+        key = (model, state, normalize_prompt(prompt))
+        stored = [{"name": call.get("name", ""), "args": dict(call.get("args", {}))} for call in tool_calls]
+        with self._lock:
+            self._entries[key] = _CacheEntry(stored, time.monotonic() + self._ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self._max_size,
+                "ttl": self._ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "rejected": self._rejected,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _fresh_ids(tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"name": call["name"], "args": dict(call["args"]), "id": f"call_cached_{uuid.uuid4().hex[:16]}", "type": "tool_call"}
+        for call in tool_calls
+    ]
@@ -0,0 +1,147 @@
+"""
+请求耗时分解
+按阶段（提示词组装、本地决策、LLM调用、工具执行）记录耗时，并记录每次LLM调用的模型名称与token数；
+结果可作为响应中的 debug 字段返回，并导出为 Prometheus 直方图（未安装 prometheus_client 时仅保留 debug 字段）
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from agent.core.config import settings
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+except ImportError:  # prometheus_client 为可选依赖
+    Histogram = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    generate_latest = None
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384)
+# 模型名称来自请求，未配置的模型统一记为该标签值，避免客户端制造无限多的指标序列
+_OTHER_MODEL_LABEL = "other"
+
+if Histogram is not None:
+    _REQUEST_SECONDS = Histogram("agent_request_seconds", "Agent 请求总耗时", ["endpoint"], buckets=_LATENCY_BUCKETS)
+    _STAGE_SECONDS = Histogram("agent_stage_seconds", "Agent 请求各阶段耗时", ["endpoint", "stage"], buckets=_LATENCY_BUCKETS)
+    _LLM_SECONDS = Histogram("agent_llm_call_seconds", "单次LLM调用耗时", ["model", "outcome"], buckets=_LATENCY_BUCKETS)
+    _LLM_TOKENS = Histogram("agent_llm_tokens", "单次LLM调用token数", ["model", "kind"], buckets=_TOKEN_BUCKETS)
+
+
+def render_metrics() -> bytes:
+    """Prometheus 文本格式的指标数据"""
+    if generate_latest is None:
+        return b"# prometheus_client not installed\n"
+    return generate_latest()
+
+
+def model_label(model: str) -> str:
+    """指标中的模型标签：配置的模型（默认模型与回退模型链）保留名称，其它模型记为 other"""
+    return model if model in settings.configured_models() else _OTHER_MODEL_LABEL
+
+
+class RequestTrace:
+    """单个请求的耗时分解"""
+
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+        self._started = time.perf_counter()
+        self.total: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self.llm_calls: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            self.spans.append({
+                "stage": stage,
+                "start_ms": round((started - self._started) * 1000, 2),
+                "duration_ms": round(duration * 1000, 2),
+            })
+            if Histogram is not None:
+                _STAGE_SECONDS.labels(self.endpoint, stage).observe(duration)
+
+    def record_llm(self, model: str, message: Any, latency: float, error: Optional[BaseException] = None) -> None:
+        """记录一次LLM调用：模型名称、耗时、输入/输出token数（来自 usage_metadata）；指标中的模型标签见 model_label"""
+        usage = (getattr(message, "usage_metadata", None) or {}) if message is not None else {}
+        call = {
+            "model": model,
+            "latency_ms": round(latency * 1000, 2),
+            "input_tokens": int(usage.get("input_tokens") or 0),
+            "output_tokens": int(usage.get("output_tokens") or 0),
+        }
+        if error is not None:
+            call["error"] = repr(error)
+        self.llm_calls.append(call)
+        if Histogram is not None:
+            label = model_label(model)
+            _LLM_SECONDS.labels(label, "error" if error is not None else "ok").observe(latency)
+            if error is None:
+                _LLM_TOKENS.labels(label, "input").observe(call["input_tokens"])
+                _LLM_TOKENS.labels(label, "output").observe(call["output_tokens"])
+
+    def finish(self) -> None:
+        if self.total is not None:
+            return
+        self.total = time.perf_counter() - self._started
+        if Histogram is not None:
+            _REQUEST_SECONDS.labels(self.endpoint).observe(self.total)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        输出数据格式：
+          - { total_ms, spans: [ { stage, start_ms, duration_ms } ], llm_calls: [ { model, latency_ms, input_tokens, output_tokens, error? } ],
+              models, input_tokens, output_tokens }
+        """
+        total = self.total if self.total is not None else time.perf_counter() - self._started
+        models: List[str] = []
+        for call in self.llm_calls:
+            if call["model"] not in models:
+                models.append(call["model"])
+        return {
+            "total_ms": round(total * 1000, 2),
+            "spans": list(self.spans),
+            "llm_calls": list(self.llm_calls),
+            "models": models,
+            "input_tokens": sum(call["input_tokens"] for call in self.llm_calls),
+            "output_tokens": sum(call["output_tokens"] for call in self.llm_calls),
+        }
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("agent_request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_request(endpoint: str) -> Iterator[RequestTrace]:
+    """为当前请求开启耗时分解，退出时记录总耗时"""
+    trace = RequestTrace(endpoint)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # 流式响应的生成器可能在其它上下文中被关闭
+            pass
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """记录当前请求的一个阶段；无进行中的请求时不做任何处理"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
@@ -0,0 +1,27 @@
+"""
+Agent服务知识库：文档分块、向量化（本地 / 远程批处理缓存）、向量索引、BM25 索引与混合检索
+"""
+from agent.knowledge.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from agent.knowledge.chunking import split_text
+from agent.knowledge.embedding_service import EmbeddingCache, EmbeddingService, RemoteEmbedder, RequestLimiter
+from agent.knowledge.embeddings import HashingEmbedder, create_embedder
+from agent.knowledge.engine import KnowledgeBase, KnowledgeBaseManager, ReindexStats, knowledge_bases
+from agent.knowledge.index import VectorIndex
+
+__all__ = [
+    "BM25Index",
+    "EmbeddingCache",
+    "EmbeddingService",
+    "HashingEmbedder",
+    "KnowledgeBase",
+    "KnowledgeBaseManager",
+    "RemoteEmbedder",
+    "ReindexStats",
+    "RequestLimiter",
+    "VectorIndex",
+    "create_embedder",
+    "knowledge_bases",
+    "reciprocal_rank_fusion",
+    "split_text",
+    "tokenize",
+]
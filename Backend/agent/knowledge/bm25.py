@@ -0,0 +1,178 @@
+"""
+BM25 倒排索引
+jieba 分词（搜索引擎模式，地名/机构名同时产出整词与子词），词频以 COO 数组增量存储，
+检索时使用按列压缩的 BM25 权重稀疏矩阵，内存随非零项线性增长
+"""
+import logging
+import re
+import threading
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"[0-9a-z一-鿿]")
+_jieba = None
+
+
+def tokenize(text: str) -> List[str]:
+    """jieba 搜索引擎模式分词，去除空白与纯标点词"""
+    global _jieba
+    if _jieba is None:
+        import jieba
+
+        jieba.setLogLevel(logging.WARNING)
+        _jieba = jieba
+    return [token for token in _jieba.lcut_for_search(text.lower()) if _TOKEN_PATTERN.search(token)]
+
+
+class BM25Index:
+    """
+    BM25 检索索引。
+    业务处理：
+      - 写入：分词后把 (文档行, 词项列, 词频) 追加到 COO 数组，词表按需扩展
+      - 删除：标记失效行（墓碑），失效行过多时压缩
+      - 检索：写入后首次检索时按当前文档长度与文档频率重建 BM25 权重矩阵（CSC），
+        查询只取查询词对应的列做稀疏矩阵-向量乘
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._vocabulary: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._doc_lengths = array("i")
+        self._alive = array("b")
+        self._coo_rows = array("i")
+        self._coo_cols = array("i")
+        self._coo_tf = array("f")
+        self._weights: Optional[Any] = None
+        self._idf: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]) -> None:
+        """添加（或覆盖同 ID 的）文档"""
+        tokenized = [tokenize(text) for text in texts]
+        with self._lock:
+            self.remove([item_id for item_id in ids if item_id in self._rows])
+            for item_id, tokens in zip(ids, tokenized):
+                row = len(self._ids)
+                counts: Dict[int, int] = {}
+                for token in tokens:
+                    column = self._vocabulary.setdefault(token, len(self._vocabulary))
+                    counts[column] = counts.get(column, 0) + 1
+                self._ids.append(item_id)
+                self._rows[item_id] = row
+                self._doc_lengths.append(len(tokens))
+                self._alive.append(1)
+                self._coo_rows.extend([row] * len(counts))
+                self._coo_cols.extend(counts.keys())
+                self._coo_tf.extend(counts.values())
+            self._weights = None
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """删除文档（标记失效），返回删除数量"""
+        removed = 0
+        with self._lock:
+            for item_id in ids:
+                row = self._rows.pop(item_id, None)
+                if row is None:
+                    continue
+                self._alive[row] = 0
+                self._ids[row] = None
+                removed += 1
+            if removed:
+                self._weights = None
+                if len(self._ids) > 1024 and len(self._rows) < len(self._ids) // 2:
+                    self._compact()
+        return removed
+
+    def _compact(self) -> None:
+        """丢弃失效行并重新编号"""
+        alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+        rows = np.frombuffer(self._coo_rows, dtype=np.int32)
+        keep = alive[rows]
+        remap = np.cumsum(alive) - 1
+        self._coo_rows = array("i", remap[rows[keep]].astype(np.int32).tobytes())
+        self._coo_cols = array("i", np.frombuffer(self._coo_cols, dtype=np.int32)[keep].tobytes())
+        self._coo_tf = array("f", np.frombuffer(self._coo_tf, dtype=np.float32)[keep].tobytes())
+        self._doc_lengths = array("i", np.frombuffer(self._doc_lengths, dtype=np.int32)[alive].tobytes())
+        self._ids = [item_id for item_id in self._ids if item_id is not None]
+        self._rows = {item_id: row for row, item_id in enumerate(self._ids)}
+        self._alive = array("b", [1] * len(self._ids))
+
+    def _build(self) -> None:
+        """按当前语料重建 BM25 权重矩阵与 idf"""
+        # 延迟导入：scipy.sparse 导入耗时约 200ms，仅在首次检索时加载
+        from scipy import sparse
+
+        n_rows, n_terms = len(self._ids), len(self._vocabulary)
+        rows = np.frombuffer(self._coo_rows, dtype=np.int32)
+        cols = np.frombuffer(self._coo_cols, dtype=np.int32)
+        tf = np.frombuffer(self._coo_tf, dtype=np.float32)
+        alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+        keep = alive[rows]
+        rows, cols, tf = rows[keep], cols[keep], tf[keep]
+        lengths = np.frombuffer(self._doc_lengths, dtype=np.int32).astype(np.float32)
+        avg_length = float(lengths[alive].mean()) if alive.any() else 1.0
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / max(avg_length, 1e-6))
+        weights = tf * (self.k1 + 1.0) / (tf + norm[rows])
+        df = np.bincount(cols, minlength=n_terms).astype(np.float32)
+        n_docs = float(len(self._rows))
+        self._idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self._weights = sparse.csc_matrix((weights, (rows, cols)), shape=(n_rows, n_terms), dtype=np.float32)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """
+        BM25 检索。
+        输出数据格式：
+          - [(id, BM25 分数)]，只包含至少命中一个查询词的文档，按分数降序
+        """
+        tokens = tokenize(query)
+        with self._lock:
+            columns: Dict[int, int] = {}
+            for token in tokens:
+                column = self._vocabulary.get(token)
+                if column is not None:
+                    columns[column] = columns.get(column, 0) + 1
+            if not columns or not self._rows or top_k <= 0:
+                return []
+            if self._weights is None:
+                self._build()
+            selected = np.fromiter(columns.keys(), dtype=np.int64)
+            query_weights = self._idf[selected] * np.fromiter(columns.values(), dtype=np.float32)
+            scores = np.asarray(self._weights[:, selected] @ query_weights).ravel()
+            matched = np.flatnonzero(scores > 0)
+            if len(matched) == 0:
+                return []
+            k = min(top_k, len(matched))
+            best = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+            best = best[np.argsort(-scores[best])]
+            return [(self._ids[row], float(scores[row])) for row in best]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"documents": len(self._rows), "rows": len(self._ids), "terms": len(self._vocabulary), "postings": len(self._coo_tf)}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Tuple[str, float]]], k: int = 60, weights: Optional[Sequence[float]] = None) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合（RRF）。
+    输入参数：
+      - rankings: 多个检索结果列表 [(id, 分数)]，各自按相关度降序
+      - k: 平滑常数
+      - weights: 各列表权重，默认均为 1
+    输出数据格式：
+      - [(id, 融合分数)]，融合分数归一化到 [0, 1]（在所有列表中都排第一时为 1），按分数降序
+    """
+    weights = list(weights) if weights is not None else [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, (item_id, _) in enumerate(ranking):
+            fused[item_id] = fused.get(item_id, 0.0) + weight / (k + rank + 1)
+    best = sum(weights) / (k + 1)
+    return sorted(((item_id, score / best) for item_id, score in fused.items()), key=lambda item: item[1], reverse=True)
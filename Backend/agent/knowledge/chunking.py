@@ -0,0 +1,51 @@
+"""
+文档分块
+按 chunk_size / chunk_overlap 滑动切分，切分点优先落在段落、句子、分句边界上
+"""
+from typing import List
+
+# 切分点优先级：段落 > 换行 > 句末 > 分句 > 空格
+_SEPARATORS = ("\n\n", "\n", "。", "！", "？", "!", "?", "；", ";", "，", ",", " ")
+
+
+def _break_point(text: str, start: int, end: int, min_end: int) -> int:
+    """在 [min_end, end) 内按优先级寻找最靠后的切分点，返回切分后的结束位置"""
+    for separator in _SEPARATORS:
+        position = text.rfind(separator, min_end, end)
+        if position != -1:
+            return position + len(separator)
+    return end
+
+
+def split_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+    """
+    文档分块。
+    输入参数：
+      - text: 文档内容
+      - chunk_size: 分块最大字符数
+      - chunk_overlap: 相邻分块重叠字符数（须小于 chunk_size）
+    业务处理：
+      - 每块不超过 chunk_size 个字符；切分点在块的后半段内按优先级寻找自然边界，找不到时硬切
+      - 下一块从上一块结束位置回退 chunk_overlap 个字符开始
+    输出数据格式：
+      - list[str]: 去除首尾空白后的非空分块，按原文顺序
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size 必须大于 0")
+    if chunk_overlap < 0 or chunk_overlap >= chunk_size:
+        raise ValueError("chunk_overlap 必须在 [0, chunk_size) 范围内")
+    text = text.replace("\r\n", "\n")
+    length = len(text)
+    chunks: List[str] = []
+    start = 0
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            end = _break_point(text, start, end, start + chunk_size // 2)
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= length:
+            break
+        start = max(end - chunk_overlap, start + 1)
+    return chunks
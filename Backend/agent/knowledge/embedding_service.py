@@ -0,0 +1,278 @@
+"""
+向量化服务
+远程 OpenAI 兼容 /embeddings 接口 + 批处理 + 并发与速率限制 + 按（模型, 文本哈希）的磁盘缓存
+"""
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Protocol, Sequence
+
+import httpx
+import numpy as np
+
+from agent.core.rate_limiter import RETRYABLE_STATUS, retry_after
+
+# 常见向量化模型的默认维度，未列出的模型首次使用时调用一次接口探测
+_KNOWN_DIMENSIONS = {
+    "text-embedding-v1": 1536,
+    "text-embedding-v2": 1536,
+    "text-embedding-v3": 1024,
+    "text-embedding-v4": 1024,
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+
+class TextEmbedder(Protocol):
+    """向量化器接口：model 名称、向量维度与批量向量化"""
+    model: str
+
+    @property
+    def dimension(self) -> int: ...
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray: ...
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RemoteEmbedder:
+    """
+    OpenAI 兼容向量化接口（DashScope 兼容模式、OpenAI 等）。
+    业务处理：
+      - POST {base_url}/embeddings，一次请求一批文本，按返回的 index 还原顺序
+      - dimensions > 0 时随请求下发（支持可变维度的模型），否则按已知模型表或探测得到维度
+      - transport 为空时使用默认 HTTP 传输（可传入 httpx.MockTransport 离线测试）
+    """
+
+    def __init__(
+        self,
+        model: str,
+        base_url: str,
+        api_key: str,
+        dimensions: int = 0,
+        timeout: float = 30.0,
+        transport: Optional[httpx.BaseTransport] = None,
+    ) -> None:
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self._requested_dimensions = dimensions
+        self._dimension = dimensions or _KNOWN_DIMENSIONS.get(model, 0)
+        self._client = httpx.Client(
+            timeout=timeout,
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+            transport=transport,
+        )
+
+    @property
+    def dimension(self) -> int:
+        if not self._dimension:
+            self._dimension = int(self.embed(["dimension"]).shape[1])
+        return self._dimension
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """批量向量化，HTTP 错误以 httpx.HTTPStatusError 抛出"""
+        payload = {"model": self.model, "input": list(texts), "encoding_format": "float"}
+        if self._requested_dimensions:
+            payload["dimensions"] = self._requested_dimensions
+        response = self._client.post(f"{self.base_url}/embeddings", json=payload)
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return np.asarray([item["embedding"] for item in data], dtype=np.float32)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class EmbeddingCache:
+    """
+    向量磁盘缓存（SQLite）。
+    业务处理：
+      - 键为（模型:维度, 文本 SHA-256），值为 float32 向量字节；WAL 模式，多线程共用一个连接（加锁）
+    """
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            # SQLite 单条语句参数上限 999，分段查询
+            for start in range(0, len(hashes), 500):
+                part = list(hashes[start:start + 500])
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, np.ndarray]) -> None:
+        if not items:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, digest, np.asarray(vector, dtype=np.float32).tobytes()) for digest, vector in items.items()],
+            )
+            self._conn.commit()
+
+    def count(self, model: Optional[str] = None) -> int:
+        with self._lock:
+            if model is None:
+                return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RequestLimiter:
+    """
+    线程安全的请求调度：并发上限 + 每秒请求数（按时间片预约，rate <= 0 不限速）。
+    同一提供方的多个向量化服务共用一个实例。
+    """
+
+    def __init__(self, max_concurrency: int, qps: float) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.qps = qps
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def __enter__(self) -> float:
+        self._semaphore.acquire()
+        if self.qps <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.qps
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._semaphore.release()
+
+
+class EmbeddingService:
+    """
+    批处理 + 缓存的向量化服务，可直接作为知识库的向量化器。
+    输入参数：
+      - embedder: 底层向量化器（RemoteEmbedder 或本地 HashingEmbedder）
+      - cache: EmbeddingCache，为空时不缓存
+      - batch_size: 每次请求的最大文本数（提供方限制，如 DashScope text-embedding-v3 为 10）
+      - limiter: 请求调度（并发 + QPS），为空时不限制
+      - max_retries: 429 / 5xx / 网络错误的重试次数（全抖动指数退避，优先遵循 Retry-After）
+    业务处理：
+      - 同一次调用内相同文本只计算一次；先查缓存，未命中的文本按 batch_size 分批，多批在线程池中并发请求
+      - 结果写回缓存并按输入顺序组装为 (len(texts), dimension) 的 float32 矩阵
+    """
+
+    def __init__(
+        self,
+        embedder: TextEmbedder,
+        cache: Optional[EmbeddingCache] = None,
+        batch_size: int = 10,
+        limiter: Optional[RequestLimiter] = None,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+    ) -> None:
+        self.embedder = embedder
+        self.model = embedder.model
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.limiter = limiter
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._stats_lock = threading.Lock()
+        self._stats = {"texts": 0, "cache_hits": 0, "embedded": 0, "requests": 0, "retries": 0, "throttled_seconds": 0.0}
+
+    @property
+    def dimension(self) -> int:
+        return self.embedder.dimension
+
+    def _count(self, key: str, value: float = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        attempt = 0
+        while True:
+            try:
+                if self.limiter is None:
+                    vectors = self.embedder.embed(texts)
+                else:
+                    with self.limiter as waited:
+                        self._count("throttled_seconds", waited)
+                        vectors = self.embedder.embed(texts)
+                self._count("requests")
+                return vectors
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                if attempt >= self.max_retries or (status is not None and status not in RETRYABLE_STATUS):
+                    raise
+                self._count("retries")
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                hinted = retry_after(e)
+                if hinted is not None:
+                    delay = max(delay, min(hinted, self.max_delay))
+                time.sleep(delay)
+                attempt += 1
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """批量向量化，输出形状 (len(texts), dimension) 的 float32 矩阵"""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        hashes = [text_hash(text) for text in texts]
+        unique: Dict[str, str] = dict(zip(hashes, texts))
+        # 同一模型不同维度（可变维度模型）的向量分开缓存
+        cache_key = f"{self.model}:{self.dimension}"
+        vectors = self.cache.get_many(cache_key, list(unique)) if self.cache is not None else {}
+        missing = [digest for digest in unique if digest not in vectors]
+        self._count("texts", len(texts))
+        self._count("cache_hits", len(unique) - len(missing))
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            workers = min(len(batches), self.limiter.max_concurrency if self.limiter is not None else 1)
+            if workers <= 1:
+                results = [self._embed_batch([unique[digest] for digest in batch]) for batch in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding") as pool:
+                    results = list(pool.map(lambda batch: self._embed_batch([unique[digest] for digest in batch]), batches))
+            fresh = {digest: vector for batch, matrix in zip(batches, results) for digest, vector in zip(batch, matrix)}
+            if self.cache is not None:
+                self.cache.put_many(cache_key, fresh)
+            vectors.update(fresh)
+            self._count("embedded", len(missing))
+        return np.vstack([vectors[digest] for digest in hashes]).astype(np.float32, copy=False)
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["throttled_seconds"] = round(snapshot["throttled_seconds"], 3)
+        snapshot.update({"model": self.model, "batch_size": self.batch_size})
+        return snapshot
@@ -0,0 +1,126 @@
+"""
+文本向量化
+本地确定性哈希向量化：不依赖网络与模型文件，相同文本在任意进程中得到相同向量；
+远程模型经 embedding_service 批处理、限流与缓存
+"""
+import logging
+import math
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from agent.knowledge.embedding_service import EmbeddingService, TextEmbedder
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_CJK_PATTERN = re.compile(r"[一-鿿]+")
+
+
+def _features(text: str) -> List[str]:
+    """中文按单字与相邻二字切分，英文/数字按词切分"""
+    text = text.lower()
+    features: List[str] = _WORD_PATTERN.findall(text)
+    for run in _CJK_PATTERN.findall(text):
+        features.extend(run)
+        features.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return features
+
+
+class HashingEmbedder:
+    """
+    哈希向量化。
+    业务处理：
+      - 特征经 CRC32 哈希映射到 dimension 维，哈希值最高位决定符号以抵消碰撞
+      - 词频取 1 + log(tf)，结果做 L2 归一化，可直接用内积计算余弦相似度
+    """
+
+    def __init__(self, dimension: int = 512) -> None:
+        self.dimension = dimension
+        self.model = f"hashing-{dimension}"
+
+    def embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature, count in Counter(_features(text)).items():
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = -1.0 if digest & 0x80000000 else 1.0
+            vector[digest % self.dimension] += sign * (1.0 + math.log(count))
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """批量向量化，输出形状 (len(texts), dimension) 的 float32 矩阵"""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.vstack([self.embed_one(text) for text in texts])
+
+
+def default_score_threshold(embedder: "TextEmbedder") -> float:
+    """向量检索的默认余弦相似度阈值：本地哈希向量化为 0（只过滤非正相关），其它模型取 settings.knowledge_score_threshold"""
+    from agent.core.config import settings
+
+    if isinstance(getattr(embedder, "embedder", embedder), HashingEmbedder):
+        return 0.0
+    return settings.knowledge_score_threshold
+
+
+_services: Dict[str, Any] = {}
+_services_lock = threading.Lock()
+
+
+def _remote_service(model: str) -> "EmbeddingService":
+    """按模型复用远程向量化服务；同一提供方的服务共用请求调度与磁盘缓存"""
+    from agent.core.config import settings
+    from agent.knowledge.embedding_service import EmbeddingCache, EmbeddingService, RemoteEmbedder, RequestLimiter
+
+    with _services_lock:
+        service = _services.get(model)
+        if service is None:
+            shared = _services.get("")
+            if shared is None:
+                cache = EmbeddingCache(settings.embedding_cache_path) if settings.embedding_cache_path else None
+                shared = _services[""] = (RequestLimiter(settings.embedding_concurrency, settings.embedding_qps), cache)
+            limiter, cache = shared
+            embedder = RemoteEmbedder(
+                model,
+                base_url=settings.embedding_base_url or settings.base_url,
+                api_key=settings.embedding_api_key or settings.api_key,
+                dimensions=settings.embedding_dimension,
+                timeout=settings.request_timeout,
+            )
+            service = _services[model] = EmbeddingService(
+                embedder,
+                cache=cache,
+                batch_size=settings.embedding_batch_size,
+                limiter=limiter,
+                max_retries=settings.embedding_max_retries,
+                base_delay=settings.llm_retry_base_delay,
+                max_delay=settings.llm_retry_max_delay,
+            )
+        return service
+
+
+def create_embedder(model: str = "") -> "TextEmbedder":
+    """
+    按模型名称创建向量化器。
+    'hashing' / 'hashing-<维度>' 使用本地哈希向量化；其它名称在开启 AGENT_EMBEDDING_REMOTE 时使用远程向量化服务
+    （批处理、限流、磁盘缓存，同一模型复用同一服务），未开启时回退为本地哈希向量化并记录警告；
+    实际使用的模型以返回值的 model 为准。
+    """
+    from agent.core.config import settings
+
+    name = (model or "").strip().lower()
+    if name.startswith("hashing-") and name[len("hashing-"):].isdigit():
+        return HashingEmbedder(int(name[len("hashing-"):]))
+    if name in ("", "hashing"):
+        return HashingEmbedder()
+    if settings.embedding_remote:
+        return _remote_service(model.strip())
+    embedder = HashingEmbedder()
+    logger.warning("未开启远程向量化（AGENT_EMBEDDING_REMOTE），模型 %s 回退为本地哈希向量化 %s", model, embedder.model)
+    return embedder
@@ -0,0 +1,333 @@
+"""
+知识库检索引擎
+文档分块 -> 向量索引 + BM25 倒排索引；查询按检索模式（混合 / 向量 / BM25）返回 top_k 个 KnowledgeResult
+文档与分块按内容哈希增量更新：重复导入时只向量化、索引新增或变化的分块
+"""
+import hashlib
+import threading
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from agent.core.config import settings
+from agent.knowledge.bm25 import BM25Index, reciprocal_rank_fusion
+from agent.knowledge.chunking import split_text
+from agent.knowledge.embedding_service import TextEmbedder
+from agent.knowledge.embeddings import create_embedder, default_score_threshold
+from agent.knowledge.index import VectorIndex
+from agent.models.schemas import DocumentUpload, KnowledgeBaseCreate, KnowledgeQuery, KnowledgeResult
+
+RETRIEVAL_MODES = ("hybrid", "dense", "bm25")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Chunk:
+    chunk_id: str
+    document_id: str
+    chunk_index: int
+    content: str
+    metadata: Dict[str, Any]
+    content_hash: str = ""
+
+
+@dataclass
+class Document:
+    document_id: str
+    filename: str
+    file_type: str
+    file_size: int
+    metadata: Dict[str, Any]
+    content_hash: str = ""
+    chunk_ids: List[str] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.now)
+    updated_at: datetime = field(default_factory=datetime.now)
+
+    def to_response(self) -> Dict[str, Any]:
+        """DocumentResponse 字段"""
+        return {
+            "id": self.document_id,
+            "filename": self.filename,
+            "file_type": self.file_type,
+            "file_size": self.file_size,
+            "chunk_count": len(self.chunk_ids),
+            "processed": True,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+@dataclass
+class ReindexStats:
+    """增量索引统计：文档新增 / 更新 / 未变化 / 删除数，分块向量化 / 复用 / 删除数"""
+    documents_added: int = 0
+    documents_updated: int = 0
+    documents_unchanged: int = 0
+    documents_removed: int = 0
+    chunks_embedded: int = 0
+    chunks_reused: int = 0
+    chunks_removed: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class KnowledgeBase:
+    """
+    单个知识库。
+    业务处理：
+      - 添加文档：按 chunk_size / chunk_overlap 分块，批量向量化后写入向量索引，同时写入 BM25 倒排索引
+      - 增量更新：同一 document_id 重复添加时先比较文档内容哈希，未变化只更新元数据；
+        变化时分块 ID 取「文档ID:分块内容哈希」，内容未变的分块直接复用，只向量化新增分块，消失的分块从索引中删除（墓碑）
+      - 查询：
+        - dense：向量检索，过滤余弦相似度低于 score_threshold 的结果（未指定时按向量化模型取默认值，见 default_score_threshold）
+        - bm25：BM25 检索，返回至少命中一个查询词的结果（BM25 分数无上界，不应用 score_threshold）
+        - hybrid：两路各取候选（向量候选同样按 score_threshold 过滤），按倒数排名融合，分数归一化到 [0, 1]
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: Optional[str] = None,
+        embedding_model: str = "hashing",
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        kb_id: Optional[str] = None,
+        embedder: Optional[TextEmbedder] = None,
+    ) -> None:
+        self.kb_id = kb_id or uuid.uuid4().hex
+        self.name = name
+        self.description = description
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embedder = embedder or create_embedder(embedding_model)
+        # 记录实际使用的向量化模型（未开启远程向量化时请求的模型会回退为本地哈希向量化）
+        self.embedding_model = self.embedder.model
+        self.index = VectorIndex(self.embedder.dimension, ann_threshold=settings.knowledge_ann_threshold, nprobe=settings.knowledge_ann_nprobe)
+        self.bm25 = BM25Index()
+        self.documents: Dict[str, Document] = {}
+        self.chunks: Dict[str, Chunk] = {}
+        self.is_active = True
+        self.created_at = datetime.now()
+        self.updated_at = self.created_at
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_request(cls, request: KnowledgeBaseCreate) -> "KnowledgeBase":
+        return cls(
+            name=request.name,
+            description=request.description,
+            embedding_model=request.embedding_model or "hashing",
+            chunk_size=request.chunk_size or 1000,
+            chunk_overlap=request.chunk_overlap if request.chunk_overlap is not None else 200,
+        )
+
+    def add_document(self, upload: DocumentUpload, document_id: Optional[str] = None, stats: Optional[ReindexStats] = None) -> Document:
+        """分块、向量化并索引一个文档（同 ID 文档增量更新），stats 不为空时累计增量统计"""
+        document_id = document_id or upload.document_id or uuid.uuid4().hex
+        stats = stats if stats is not None else ReindexStats()
+        digest = content_hash(upload.content)
+        metadata = dict(upload.metadata or {})
+        chunk_metadata = {**metadata, "filename": upload.filename}
+        with self._lock:
+            previous = self.documents.get(document_id)
+            if previous is not None and previous.content_hash == digest:
+                previous.filename, previous.file_type, previous.metadata = upload.filename, upload.file_type, metadata
+                previous.updated_at = datetime.now()
+                for chunk_id in previous.chunk_ids:
+                    self.chunks[chunk_id].metadata = dict(chunk_metadata)
+                stats.documents_unchanged += 1
+                return previous
+            # 分块 ID 以文档 ID 为前缀，只可能与该文档的旧分块重合
+            existing = set(previous.chunk_ids) if previous is not None else set()
+
+        pieces = split_text(upload.content, self.chunk_size, self.chunk_overlap)
+        chunks: List[Chunk] = []
+        seen: Dict[str, int] = {}
+        for index, piece in enumerate(pieces):
+            piece_hash = content_hash(piece)
+            chunk_id = f"{document_id}:{piece_hash[:16]}"
+            # 同一文档内重复出现的相同分块按出现次序区分
+            seen[chunk_id] = seen.get(chunk_id, 0) + 1
+            if seen[chunk_id] > 1:
+                chunk_id = f"{chunk_id}~{seen[chunk_id] - 1}"
+            chunks.append(Chunk(chunk_id, document_id, index, piece, dict(chunk_metadata), piece_hash))
+        fresh = [chunk for chunk in chunks if chunk.chunk_id not in existing]
+        vectors = self.embedder.embed([chunk.content for chunk in fresh])
+
+        document = Document(
+            document_id=document_id,
+            filename=upload.filename,
+            file_type=upload.file_type,
+            file_size=len(upload.content.encode("utf-8")),
+            metadata=metadata,
+            content_hash=digest,
+            chunk_ids=[chunk.chunk_id for chunk in chunks],
+        )
+        with self._lock:
+            previous = self.documents.get(document_id)
+            if previous is not None:
+                document.created_at = previous.created_at
+                stale = set(previous.chunk_ids) - set(document.chunk_ids)
+                self._drop_chunks(stale)
+                stats.chunks_removed += len(stale)
+            # 向量化期间被并发删除的复用分块需要补算
+            missing = [chunk for chunk in chunks if chunk.chunk_id not in self.chunks and chunk.chunk_id in existing]
+            if missing:
+                fresh = fresh + missing
+                vectors = self.embedder.embed([chunk.content for chunk in fresh])
+            ids = [chunk.chunk_id for chunk in fresh]
+            self.index.add(ids, vectors)
+            self.bm25.add(ids, [chunk.content for chunk in fresh])
+            for chunk in chunks:
+                self.chunks[chunk.chunk_id] = chunk
+            self.documents[document_id] = document
+            self.updated_at = datetime.now()
+        stats.chunks_embedded += len(fresh)
+        stats.chunks_reused += len(chunks) - len(fresh)
+        if previous is None:
+            stats.documents_added += 1
+        else:
+            stats.documents_updated += 1
+        return document
+
+    def _drop_chunks(self, chunk_ids: Iterable[str]) -> None:
+        chunk_ids = list(chunk_ids)
+        self.index.remove(chunk_ids)
+        self.bm25.remove(chunk_ids)
+        for chunk_id in chunk_ids:
+            self.chunks.pop(chunk_id, None)
+
+    def remove_document(self, document_id: str) -> bool:
+        with self._lock:
+            document = self.documents.pop(document_id, None)
+            if document is None:
+                return False
+            self._drop_chunks(document.chunk_ids)
+            self.updated_at = datetime.now()
+            return True
+
+    def prune(self, keep: Iterable[str], metadata: Optional[Dict[str, Any]] = None, stats: Optional[ReindexStats] = None) -> List[str]:
+        """
+        删除不在 keep 中的文档（用于重新导入后清理源数据中已消失的文档）。
+        输入参数：
+          - keep: 保留的文档 ID
+          - metadata: 只清理元数据包含这些键值的文档（如 {"table": "学校"}），为空时清理全部
+        输出数据格式：
+          - 被删除的文档 ID 列表
+        """
+        keep = set(keep)
+        metadata = metadata or {}
+        with self._lock:
+            removed = [
+                document_id
+                for document_id, document in self.documents.items()
+                if document_id not in keep and all(document.metadata.get(key) == value for key, value in metadata.items())
+            ]
+            for document_id in removed:
+                document = self.documents.pop(document_id)
+                self._drop_chunks(document.chunk_ids)
+                if stats is not None:
+                    stats.documents_removed += 1
+                    stats.chunks_removed += len(document.chunk_ids)
+            if removed:
+                self.updated_at = datetime.now()
+        return removed
+
+    def manifest(self) -> Dict[str, Dict[str, Any]]:
+        """
+        索引清单。
+        输出数据格式：
+          - { document_id: { filename, content_hash, chunks: [分块内容哈希，按分块顺序], updated_at } }
+        """
+        with self._lock:
+            return {
+                document_id: {
+                    "filename": document.filename,
+                    "content_hash": document.content_hash,
+                    "chunks": [self.chunks[chunk_id].content_hash for chunk_id in document.chunk_ids],
+                    "updated_at": document.updated_at.isoformat(),
+                }
+                for document_id, document in self.documents.items()
+            }
+
+    def query(self, query: KnowledgeQuery) -> List[KnowledgeResult]:
+        """
+        知识库检索。
+        输出数据格式：
+          - list[KnowledgeResult]: 按分数降序，最多 top_k 个；score 为余弦相似度（dense）、BM25 分数（bm25）或归一化融合分数（hybrid）
+        """
+        mode = (query.mode or settings.knowledge_retrieval_mode).strip().lower()
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"不支持的检索模式: {mode}，可选 {' / '.join(RETRIEVAL_MODES)}")
+        top_k = query.top_k if query.top_k is not None else 5
+        threshold = query.score_threshold if query.score_threshold is not None else default_score_threshold(self.embedder)
+        # 混合检索时每路多取候选，使只在一路中排名靠前的分块也能进入融合
+        depth = top_k if mode != "hybrid" else max(top_k * 4, 20)
+        vector = self.embedder.embed([query.query])[0] if mode != "bm25" else None
+        with self._lock:
+            rankings = []
+            if vector is not None:
+                rankings.append([hit for hit in self.index.search(vector, depth) if hit[1] >= threshold])
+            if mode != "dense":
+                rankings.append(self.bm25.search(query.query, depth))
+            hits = rankings[0] if len(rankings) == 1 else reciprocal_rank_fusion(rankings, k=settings.knowledge_rrf_k)
+            results: List[KnowledgeResult] = []
+            for chunk_id, score in hits[:top_k]:
+                chunk = self.chunks[chunk_id]
+                results.append(KnowledgeResult(
+                    content=chunk.content,
+                    score=round(score, 6),
+                    metadata=chunk.metadata,
+                    document_id=chunk.document_id,
+                    chunk_index=chunk.chunk_index,
+                ))
+        return results
+
+    def to_response(self) -> Dict[str, Any]:
+        """KnowledgeBaseResponse 字段"""
+        return {
+            "id": self.kb_id,
+            "name": self.name,
+            "description": self.description,
+            "embedding_model": self.embedding_model,
+            "vector_dimension": self.embedder.dimension,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "document_count": len(self.documents),
+            "is_active": self.is_active,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class KnowledgeBaseManager:
+    """进程内知识库注册表"""
+
+    def __init__(self) -> None:
+        self._bases: Dict[str, KnowledgeBase] = {}
+        self._lock = threading.Lock()
+
+    def create(self, request: KnowledgeBaseCreate) -> KnowledgeBase:
+        base = KnowledgeBase.from_request(request)
+        with self._lock:
+            self._bases[base.kb_id] = base
+        return base
+
+    def get(self, kb_id: str) -> Optional[KnowledgeBase]:
+        return self._bases.get(kb_id)
+
+    def list(self) -> List[KnowledgeBase]:
+        with self._lock:
+            return list(self._bases.values())
+
+    def delete(self, kb_id: str) -> bool:
+        with self._lock:
+            return self._bases.pop(kb_id, None) is not None
+
+
+knowledge_bases = KnowledgeBaseManager()
@@ -0,0 +1,201 @@
+"""
+向量索引
+进程内余弦相似度索引：规模较小时精确检索，超过阈值后使用 IVF（倒排文件）近似检索，均基于 NumPy
+"""
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """分数最高的 k 个位置（降序）"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    part = np.argpartition(-scores, k)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+class VectorIndex:
+    """
+    向量索引。
+    业务处理：
+      - 向量 L2 归一化后按行存入预分配矩阵（容量按倍数扩展），内积即余弦相似度
+      - 删除只标记失效行（墓碑），失效行过多时压缩
+      - 有效向量数达到 ann_threshold 后训练 IVF：在采样向量上做球面 k-means 得到 nlist≈2·√N 个聚类中心，
+        检索时只扫描与查询最相近的 nprobe 个聚类；数据量增长到训练时的 2 倍后重新训练（训练在写入时进行，检索路径不训练）
+    """
+
+    def __init__(self, dimension: int, ann_threshold: int = 20000, nprobe: int = 16, max_train_samples: int = 8192, seed: int = 0) -> None:
+        self.dimension = dimension
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self.max_train_samples = max_train_samples
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._lists: Optional[List[np.ndarray]] = None
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._rows
+
+    @property
+    def is_ann(self) -> bool:
+        return self._centroids is not None
+
+    def _reserve(self, extra: int) -> None:
+        needed = self._size + extra
+        capacity = len(self._vectors)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        vectors = np.zeros((capacity, self.dimension), dtype=np.float32)
+        vectors[: self._size] = self._vectors[: self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: self._size] = self._alive[: self._size]
+        assign = np.zeros(capacity, dtype=np.int32)
+        assign[: self._size] = self._assign[: self._size]
+        self._vectors, self._alive, self._assign = vectors, alive, assign
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """添加（或覆盖同 ID 的）向量"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        if len(ids) != len(vectors):
+            raise ValueError("ids 与 vectors 数量不一致")
+        with self._lock:
+            self.remove([item_id for item_id in ids if item_id in self._rows])
+            self._reserve(len(ids))
+            start, end = self._size, self._size + len(ids)
+            self._vectors[start:end] = _normalize(vectors)
+            self._alive[start:end] = True
+            for offset, item_id in enumerate(ids):
+                self._ids.append(item_id)
+                self._rows[item_id] = start + offset
+            if self._centroids is not None:
+                self._assign[start:end] = np.argmax(self._vectors[start:end] @ self._centroids.T, axis=1)
+            self._size = end
+            self._lists = None
+            self._maybe_train()
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """删除向量（标记失效），返回删除数量"""
+        removed = 0
+        with self._lock:
+            for item_id in ids:
+                row = self._rows.pop(item_id, None)
+                if row is None:
+                    continue
+                self._alive[row] = False
+                self._ids[row] = None
+                removed += 1
+            if removed:
+                self._lists = None
+                if self._size > 1024 and len(self._rows) < self._size // 2:
+                    self._compact()
+                self._maybe_train()
+        return removed
+
+    def _compact(self) -> None:
+        """丢弃失效行"""
+        rows = np.flatnonzero(self._alive[: self._size])
+        self._vectors = self._vectors[rows].copy()
+        self._assign = self._assign[rows].copy()
+        self._alive = np.ones(len(rows), dtype=bool)
+        self._ids = [self._ids[row] for row in rows]
+        self._rows = {item_id: row for row, item_id in enumerate(self._ids)}
+        self._size = len(rows)
+        self._lists = None
+
+    def _train(self) -> None:
+        """球面 k-means 训练 IVF 聚类中心（采样最多 max_train_samples 个向量）"""
+        rows = np.flatnonzero(self._alive[: self._size])
+        nlist = max(1, min(len(rows), int(2 * math.sqrt(len(rows))), 4096))
+        sample_size = min(len(rows), max(nlist * 16, self.max_train_samples))
+        sample = self._vectors[self._rng.choice(rows, size=sample_size, replace=False)]
+        centroids = sample[self._rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(6):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=nlist)
+            filled = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+            centroids[filled] = _normalize(np.add.reduceat(sample[order], starts, axis=0))
+        self._centroids = centroids
+        # 分块分配，避免 N×nlist 的大矩阵
+        for start in range(0, self._size, 8192):
+            end = min(start + 8192, self._size)
+            self._assign[start:end] = np.argmax(self._vectors[start:end] @ centroids.T, axis=1)
+        self._trained_size = len(rows)
+        self._lists = None
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            rows = np.flatnonzero(self._alive[: self._size])
+            order = rows[np.argsort(self._assign[rows], kind="stable")]
+            bounds = np.searchsorted(self._assign[order], np.arange(len(self._centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+        return self._lists
+
+    def _maybe_train(self) -> None:
+        count = len(self._rows)
+        if count < self.ann_threshold:
+            self._centroids = None
+            return
+        if self._centroids is None or count >= 2 * self._trained_size:
+            self._train()
+
+    def search(self, query: np.ndarray, top_k: int = 5, exact: bool = False) -> List[Tuple[str, float]]:
+        """
+        检索与查询向量最相似的 top_k 个向量。
+        输出数据格式：
+          - [(id, 余弦相似度)]，按相似度降序
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(self.dimension)
+        norm = float(np.linalg.norm(query))
+        if norm == 0 or top_k <= 0:
+            return []
+        query = query / norm
+        with self._lock:
+            if not self._rows:
+                return []
+            if self._centroids is None or exact:
+                scores = self._vectors[: self._size] @ query
+                scores[~self._alive[: self._size]] = -np.inf
+                rows = _top_k(scores, min(top_k, len(self._rows)))
+                return [(self._ids[row], float(scores[row])) for row in rows]
+            lists = self._inverted_lists()
+            probes = _top_k(self._centroids @ query, min(self.nprobe, len(lists)))
+            candidates = np.concatenate([lists[probe] for probe in probes])
+            if len(candidates) == 0:
+                return []
+            scores = self._vectors[candidates] @ query
+            best = _top_k(scores, min(top_k, len(candidates)))
+            return [(self._ids[candidates[i]], float(scores[i])) for i in best]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "vectors": len(self._rows),
+                "rows": self._size,
+                "dimension": self.dimension,
+                "ann": int(self._centroids is not None),
+                "nlist": 0 if self._centroids is None else len(self._centroids),
+                "nprobe": self.nprobe,
+            }
@@ -0,0 +1,295 @@
+"""
+RAG 源表导入
+流式解析 Backend/rag/源表/*.sql 导出文件，按批写入 RAG PostgreSQL（COPY / executemany），同时按批生成知识库文档
+"""
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple, Union
+
+from agent.core.config import settings
+from agent.knowledge.sql_dump import InsertStatement, iter_inserts
+from agent.models.schemas import DocumentUpload
+
+RAG_SOURCE_DIR = Path(__file__).resolve().parents[2] / "rag" / "源表"
+# SuperMap 系统字段（SmID、SmGeometry 等）不参与知识库文档内容
+_SYSTEM_COLUMN_PREFIX = "Sm"
+
+
+def default_dump_paths() -> List[Path]:
+    """Backend/rag/源表 下的全部 .sql 导出文件"""
+    return sorted(RAG_SOURCE_DIR.glob("*.sql"))
+
+
+def render_row(table: str, columns: Sequence[str], row: Sequence[Any]) -> str:
+    """数据行转为一行检索文本：表名｜列：值，…（跳过空值与 SuperMap 系统字段）"""
+    fields = [
+        f"{column}：{value}"
+        for column, value in zip(columns, row)
+        if value is not None and value != "" and not column.startswith(_SYSTEM_COLUMN_PREFIX)
+    ]
+    return f"{table}｜" + "，".join(fields)
+
+
+def _insert_columns(insert: InsertStatement) -> Tuple[str, ...]:
+    """INSERT 语句的列名；未写列名时按位置命名为 column_1、column_2 …"""
+    return tuple(insert.columns) or tuple(f"column_{i + 1}" for i in range(len(insert.rows[0]) if insert.rows else 0))
+
+
+def _column_type(kinds: Set[type]) -> str:
+    """按导出文件中一列全部非空字面量的类型推断列类型：全为未加引号的数字时为 NUMERIC，全为布尔时为 BOOLEAN，其余（含全空）为 TEXT"""
+    if kinds == {bool}:
+        return "BOOLEAN"
+    if kinds and kinds <= {int, float}:
+        return "NUMERIC"
+    return "TEXT"
+
+
+def infer_column_types(path: Union[str, Path]) -> Dict[str, Dict[str, str]]:
+    """
+    流式预扫描导出文件，按整张表的数据推断列类型（只保留每列出现过的字面量类型，内存与行数无关）。
+    输出数据格式：
+      - { 表名: { 列名: NUMERIC / BOOLEAN / TEXT } }
+    """
+    kinds: Dict[str, Dict[str, Set[type]]] = {}
+    for insert in iter_inserts(path):
+        table_kinds = kinds.setdefault(insert.table, {})
+        columns = _insert_columns(insert)
+        for row in insert.rows:
+            for column, value in zip(columns, row):
+                if value is not None:
+                    table_kinds.setdefault(column, set()).add(type(value))
+    return {table: {column: _column_type(column_kinds) for column, column_kinds in table_kinds.items()} for table, table_kinds in kinds.items()}
+
+
+class PostgresSink:
+    """
+    RAG PostgreSQL 写入。
+    业务处理：
+      - 每张表首次写入时建表（CREATE TABLE IF NOT EXISTS），列类型取 declare() 登记的整表推断结果，未登记的列为 TEXT；
+        replace=True 时先清空表，重复导入结果一致
+      - method=copy 使用 COPY FROM STDIN；method=executemany 使用批量 INSERT
+      - 同一张表的清空与连续写入的各批在一个事务中，切换到其它表、commit() 或正常退出时提交，异常退出时回滚：
+        导入中途失败不会留下被清空或只写入一半的表
+    """
+
+    def __init__(self, dsn: Optional[str] = None, schema: Optional[str] = None, method: str = "copy", replace: bool = True) -> None:
+        if method not in ("copy", "executemany"):
+            raise ValueError(f"不支持的写入方式: {method}，可选 copy / executemany")
+        self.dsn = dsn or settings.rag_postgres_url
+        self.schema = schema or settings.rag_postgres_schema
+        self.method = method
+        self.replace = replace
+        self._conn = None
+        self._prepared: Dict[str, set] = {}
+        self._types: Dict[str, Dict[str, str]] = {}
+        self._open_table: Optional[str] = None
+
+    def __enter__(self) -> "PostgresSink":
+        import psycopg
+
+        self._conn = psycopg.connect(self.dsn)
+        return self
+
+    def __exit__(self, exc_type: Any, *exc_info: Any) -> None:
+        if self._conn is not None:
+            try:
+                if exc_type is None:
+                    self.commit()
+                else:
+                    self._conn.rollback()
+            finally:
+                self._conn.close()
+                self._conn = None
+                self._open_table = None
+
+    def declare(self, types: Mapping[str, Mapping[str, str]]) -> None:
+        """登记各表的列类型（infer_column_types 的结果），建表与新增列时使用"""
+        for table, columns in types.items():
+            self._types.setdefault(table, {}).update(columns)
+
+    def commit(self) -> None:
+        """提交当前表的事务"""
+        if self._open_table is not None:
+            self._conn.commit()
+            self._open_table = None
+
+    def _prepare(self, cursor: Any, table: str, columns: Sequence[str]) -> None:
+        from psycopg import sql
+
+        known = self._prepared.get(table)
+        target = sql.Identifier(self.schema, table)
+        types = self._types.get(table, {})
+        if known is None:
+            definitions = sql.SQL(", ").join(
+                sql.SQL("{} {}").format(sql.Identifier(column), sql.SQL(types.get(column, "TEXT")))
+                for column in columns
+            )
+            cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} ({})").format(target, definitions))
+            if self.replace:
+                cursor.execute(sql.SQL("TRUNCATE {}").format(target))
+            known = self._prepared[table] = set(columns)
+        for column in columns:
+            if column not in known:
+                cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} {}").format(
+                    target, sql.Identifier(column), sql.SQL(types.get(column, "TEXT"))))
+                known.add(column)
+
+    def write(self, table: str, columns: Sequence[str], rows: Sequence[Tuple[Any, ...]]) -> None:
+        """写入一批数据行（在该表的事务中，不单独提交）"""
+        from psycopg import sql
+
+        if self._open_table != table:
+            self.commit()
+        target = sql.Identifier(self.schema, table)
+        column_list = sql.SQL(", ").join(sql.Identifier(column) for column in columns)
+        with self._conn.cursor() as cursor:
+            self._open_table = table
+            self._prepare(cursor, table, columns)
+            if self.method == "copy":
+                with cursor.copy(sql.SQL("COPY {} ({}) FROM STDIN").format(target, column_list)) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:
+                placeholders = sql.SQL(", ").join(sql.Placeholder() for _ in columns)
+                cursor.executemany(sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(target, column_list, placeholders), rows)
+
+
+@dataclass
+class IngestStats:
+    """导入统计：行数、文档数与耗时（数据库写入与文档生成单独计时）"""
+    files: int = 0
+    rows: int = 0
+    batches: int = 0
+    documents: int = 0
+    seconds: float = 0.0
+    db_seconds: float = 0.0
+    document_seconds: float = 0.0
+    tables: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "rows": self.rows,
+            "batches": self.batches,
+            "documents": self.documents,
+            "seconds": round(self.seconds, 3),
+            "db_seconds": round(self.db_seconds, 3),
+            "document_seconds": round(self.document_seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "tables": dict(self.tables),
+        }
+
+
+class SqlDumpIngester:
+    """
+    SQL 导出文件导入。
+    输入参数：
+      - sink: PostgresSink（为空时不写数据库）
+      - on_document: 回调 (document_id, DocumentUpload)，每批数据行生成一个知识库文档（为空时不生成）
+      - batch_size: 平均每批行数，默认取 AGENT_RAG_INGEST_BATCH_SIZE
+    业务处理：
+      - 逐条解析 INSERT 语句，同一表、同一列集合的数据行按内容定义的边界分批：
+        批内行数达到 batch_size/4 后，行内容哈希命中边界条件即切批（最多 4·batch_size 行），
+        源表中插入或删除一行只改变其所在批次，其它批次内容与文档 ID 不变，增量索引时直接跳过
+      - 文档 ID 为「表名:批次首行内容哈希」，emitted 记录本次导入产出的各表文档 ID，用于清理已消失的文档
+      - 写数据库时先流式预扫描一遍文件，按整表数据推断列类型（infer_column_types）；文件导入完成后提交数据库事务
+    """
+
+    def __init__(
+        self,
+        sink: Optional[PostgresSink] = None,
+        on_document: Optional[Callable[[str, DocumentUpload], Any]] = None,
+        batch_size: Optional[int] = None,
+    ) -> None:
+        self.sink = sink
+        self.on_document = on_document
+        self.batch_size = max(1, batch_size or settings.rag_ingest_batch_size)
+        self.min_batch = max(1, self.batch_size // 4)
+        self.max_batch = self.batch_size * 4
+        self._boundary = max(1, self.batch_size - self.min_batch)
+        self.emitted: Dict[str, List[str]] = {}
+        self._id_counts: Dict[str, int] = {}
+
+    def _flush(self, path: Path, table: str, columns: List[str], rows: List[Tuple[Any, ...]], first_hash: int, stats: IngestStats) -> None:
+        if not rows:
+            return
+        if self.sink is not None:
+            started = time.perf_counter()
+            self.sink.write(table, columns, rows)
+            stats.db_seconds += time.perf_counter() - started
+        if self.on_document is not None:
+            started = time.perf_counter()
+            document_id = f"{table}:{first_hash:08x}"
+            # 首行内容完全相同的批次按出现次序区分
+            duplicates = self._id_counts.get(document_id, 0)
+            self._id_counts[document_id] = duplicates + 1
+            if duplicates:
+                document_id = f"{document_id}~{duplicates}"
+            first_row = stats.tables.get(table, 0)
+            upload = DocumentUpload(
+                filename=f"{table}.sql",
+                file_type="sql",
+                content="\n".join(render_row(table, columns, row) for row in rows),
+                metadata={"loader": "sql_dump", "table": table, "source": path.name, "rows": [first_row, first_row + len(rows)]},
+                document_id=document_id,
+            )
+            self.on_document(document_id, upload)
+            self.emitted.setdefault(table, []).append(document_id)
+            stats.documents += 1
+            stats.document_seconds += time.perf_counter() - started
+        stats.batches += 1
+        stats.rows += len(rows)
+        stats.tables[table] = stats.tables.get(table, 0) + len(rows)
+
+    def ingest_file(self, path: Union[str, Path], stats: Optional[IngestStats] = None) -> IngestStats:
+        """导入单个导出文件"""
+        path = Path(path)
+        stats = stats or IngestStats()
+        started = time.perf_counter()
+        if self.sink is not None:
+            self.sink.declare(infer_column_types(path))
+            stats.db_seconds += time.perf_counter() - started
+        key: Optional[Tuple[str, Tuple[str, ...]]] = None
+        rows: List[Tuple[Any, ...]] = []
+        first_hash = 0
+        for insert in iter_inserts(path):
+            columns = _insert_columns(insert)
+            if key != (insert.table, columns):
+                if key is not None:
+                    self._flush(path, key[0], list(key[1]), rows, first_hash, stats)
+                key, rows = (insert.table, columns), []
+            for row in insert.rows:
+                row_hash = zlib.crc32(repr(row).encode("utf-8"))
+                if not rows:
+                    first_hash = row_hash
+                rows.append(row)
+                if len(rows) >= self.max_batch or (len(rows) >= self.min_batch and row_hash % self._boundary == 0):
+                    self._flush(path, key[0], list(key[1]), rows, first_hash, stats)
+                    rows = []
+        if key is not None:
+            self._flush(path, key[0], list(key[1]), rows, first_hash, stats)
+        if self.sink is not None:
+            committed = time.perf_counter()
+            self.sink.commit()
+            stats.db_seconds += time.perf_counter() - committed
+        stats.files += 1
+        stats.seconds += time.perf_counter() - started
+        return stats
+
+    def ingest(self, paths: Optional[Iterable[Union[str, Path]]] = None) -> IngestStats:
+        """
+        导入多个导出文件（默认 Backend/rag/源表/*.sql）。
+        输出数据格式：
+          - IngestStats：总行数、批数、文档数、耗时与 rows_per_second，按表统计行数
+        """
+        stats = IngestStats()
+        self.emitted, self._id_counts = {}, {}
+        for path in (paths if paths is not None else default_dump_paths()):
+            self.ingest_file(path, stats)
+        return stats
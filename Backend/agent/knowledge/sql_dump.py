@@ -0,0 +1,157 @@
+"""
+SQL 导出文件流式解析
+逐行读取 INSERT 语句导出文件（Navicat / pg_dump --inserts 格式），按语句切分并解析出数据行，内存占用与单条语句大小相关，与文件大小无关
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Union
+
+# 引号与语句结束符，用于在单行内推进引号状态
+_QUOTE_OR_END = re.compile(r"['\";]")
+# 单条语句内的词法单元：字符串、带引号标识符、数字、括号逗号、关键字
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<string>[EeNn]?'(?:[^']|'')*')
+      | (?P<ident>"(?:[^"]|"")*")
+      | (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+      | (?P<punct>[(),.;])
+      | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    )""",
+    re.VERBOSE,
+)
+# VALUES 关键字（表头与数据部分的分界）
+_VALUES = re.compile(r"\bvalues\b", re.IGNORECASE)
+_KEYWORDS = {"null": None, "true": True, "false": False}
+
+
+@dataclass
+class InsertStatement:
+    """一条 INSERT 语句：目标表、列名与数据行"""
+    table: str
+    columns: List[str]
+    rows: List[Tuple[Any, ...]]
+
+
+def iter_statements(lines: Iterable[str]) -> Iterator[str]:
+    """
+    按分号切分 SQL 语句（跳过引号内的分号与语句外的 -- 注释行）。
+    输入参数：
+      - lines: 逐行文本（如打开的文件对象）
+    输出数据格式：
+      - 逐条产出语句文本（含结尾分号）
+    """
+    buffer: List[str] = []
+    quote: Optional[str] = None
+    for line in lines:
+        if not buffer and quote is None and line.lstrip().startswith("--"):
+            continue
+        start = 0
+        for match in _QUOTE_OR_END.finditer(line):
+            char = match.group()
+            if quote is not None:
+                # 引号内：遇到同类引号即关闭（'' 转义会先关闭再打开，状态不变）
+                if char == quote:
+                    quote = None
+            elif char == ";":
+                buffer.append(line[start:match.end()])
+                statement = "".join(buffer).strip()
+                buffer = []
+                start = match.end()
+                if statement != ";":
+                    yield statement
+            else:
+                quote = char
+        rest = line[start:]
+        if rest.strip() or quote is not None:
+            buffer.append(rest)
+    tail = "".join(buffer).strip()
+    if tail:
+        yield tail
+
+
+def _tokens(statement: str) -> Iterator[Tuple[str, str]]:
+    position = 0
+    for match in _TOKEN.finditer(statement):
+        if match.start() != position:
+            break
+        kind = match.lastgroup
+        yield kind, match.group(kind)
+        position = match.end()
+    if statement[position:].strip():
+        raise ValueError(f"无法解析的 SQL 片段: {statement[position:position + 40]!r}")
+
+
+def _identifier(text: str) -> str:
+    return text[1:-1].replace('""', '"') if text.startswith('"') else text
+
+
+def _value(kind: str, text: str) -> Any:
+    if kind == "string":
+        if text[0] in "EeNn":
+            text = text[1:]
+        return text[1:-1].replace("''", "'")
+    if kind == "number":
+        return float(text) if any(char in text for char in ".eE") else int(text)
+    if kind == "word" and text.lower() in _KEYWORDS:
+        return _KEYWORDS[text.lower()]
+    raise ValueError(f"不支持的取值: {text}")
+
+
+@lru_cache(maxsize=256)
+def _parse_header(header: str) -> Optional[Tuple[str, Tuple[str, ...]]]:
+    """解析 VALUES 之前的部分：INSERT INTO 表 (列, ...)；导出文件中每条语句的表头相同，按文本缓存"""
+    tokens = _tokens(header)
+    head = [next(tokens, ("", "")) for _ in range(2)]
+    if [text.lower() for _, text in head] != ["insert", "into"]:
+        return None
+    table = ""
+    columns: List[str] = []
+    text = "."
+    while text == ".":
+        table = _identifier(next(tokens)[1])
+        text = next(tokens, ("", ""))[1]
+    if text == "(":
+        for _, text in tokens:
+            if text == ")":
+                break
+            if text != ",":
+                columns.append(_identifier(text))
+    return table, tuple(columns)
+
+
+def parse_insert(statement: str) -> Optional[InsertStatement]:
+    """
+    解析 INSERT INTO 表 (列, ...) VALUES (...), (...) 语句。
+    输出数据格式：
+      - InsertStatement；非 INSERT 语句返回 None
+      - 字符串取值为 str，未加引号的数字为 int / float，NULL 为 None；表名只保留最后一段（去掉 schema 前缀）
+    """
+    if statement[:6].lower() != "insert":
+        return None
+    match = _VALUES.search(statement)
+    if match is None:
+        raise ValueError(f"仅支持 INSERT ... VALUES 语句: {statement[:80]!r}")
+    header = _parse_header(statement[:match.start()])
+    if header is None:
+        return None
+    rows: List[Tuple[Any, ...]] = []
+    row: List[Any] = []
+    for kind, text in _tokens(statement[match.end():]):
+        if text == "(":
+            row = []
+        elif text == ")":
+            rows.append(tuple(row))
+        elif text not in (",", ";"):
+            row.append(_value(kind, text))
+    return InsertStatement(table=header[0], columns=list(header[1]), rows=rows)
+
+
+def iter_inserts(path: Union[str, Path], encoding: str = "utf-8") -> Iterator[InsertStatement]:
+    """流式读取 SQL 导出文件，逐条产出 INSERT 语句（其它语句跳过）"""
+    with open(path, "r", encoding=encoding, newline="") as stream:
+        for statement in iter_statements(stream):
+            insert = parse_insert(statement)
+            if insert is not None:
+                yield insert
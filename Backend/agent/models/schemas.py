@@ -3,26 +3,30 @@ Agent服务数据模型定义
 """
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from uuid import UUID
 
 
 # API密钥管理相关模型
 class APIKeyCreate(BaseModel):
     """创建API密钥请求"""
+    model_config = ConfigDict(populate_by_name=True)
+
     name: str = Field(..., description="密钥名称")
     provider: str = Field(..., description="服务商：openai, qwen, baidu, claude等")
     api_key: str = Field(..., description="API密钥")
     base_url: Optional[str] = Field(None, description="API基础URL")
-    model_config: Optional[Dict[str, Any]] = Field(None, description="模型配置参数")
+    llm_config: Optional[Dict[str, Any]] = Field(None, alias="model_config", description="模型配置参数")
 
 
 class APIKeyUpdate(BaseModel):
     """更新API密钥请求"""
+    model_config = ConfigDict(populate_by_name=True)
+
     name: Optional[str] = None
     api_key: Optional[str] = None
     base_url: Optional[str] = None
-    model_config: Optional[Dict[str, Any]] = None
+    llm_config: Optional[Dict[str, Any]] = Field(None, alias="model_config")
     is_active: Optional[bool] = None
 
 
@@ -32,13 +36,12 @@ class APIKeyResponse(BaseModel):
     name: str
     provider: str
     base_url: Optional[str] = None
-    model_config: Optional[Dict[str, Any]] = None
+    llm_config: Optional[Dict[str, Any]] = Field(None, alias="model_config")
     is_active: bool
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
 
 
 # 提示词管理相关模型
@@ -123,6 +126,7 @@ class DocumentUpload(BaseModel):
     content: str = Field(..., description="文档内容")
     file_type: str = Field(..., description="文件类型")
     metadata: Optional[Dict[str, Any]] = Field(None, description="文档元数据")
+    document_id: Optional[str] = Field(None, description="文档ID，已存在时按内容哈希增量更新")
 
 
 class DocumentResponse(BaseModel):
@@ -144,7 +148,8 @@ class KnowledgeQuery(BaseModel):
     """知识库查询请求"""
     query: str = Field(..., description="查询内容")
     top_k: Optional[int] = Field(5, description="返回结果数量")
-    score_threshold: Optional[float] = Field(0.7, description="相似度阈值")
+    score_threshold: Optional[float] = Field(None, description="相似度阈值，默认按向量化模型取值：本地哈希向量化为 0，远程模型为 AGENT_KNOWLEDGE_SCORE_THRESHOLD")
+    mode: Optional[str] = Field(None, description="检索模式：hybrid / dense / bm25，默认取服务配置")
 
 
 class KnowledgeResult(BaseModel):
@@ -156,27 +161,52 @@ class KnowledgeResult(BaseModel):
     chunk_index: int
 
 
+class SqlDumpIngestRequest(BaseModel):
+    """RAG 源表 SQL 导出文件导入请求"""
+    files: Optional[List[str]] = Field(None, description="Backend/rag/源表 下的文件名，为空时导入全部 .sql 文件")
+    load_database: bool = Field(False, description="是否同时写入 RAG PostgreSQL")
+    batch_size: Optional[int] = Field(None, ge=1, le=100000, description="每批行数（每批生成一个知识库文档）")
+
+
+class SqlDumpIngestResponse(BaseModel):
+    """RAG 源表导入统计"""
+    files: int
+    rows: int
+    batches: int
+    documents: int
+    seconds: float
+    db_seconds: float
+    document_seconds: float
+    rows_per_second: float
+    tables: Dict[str, int]
+    knowledge: Optional[Dict[str, int]] = None
+
+
 # Agent管理相关模型
 class AgentCreate(BaseModel):
     """创建Agent请求"""
+    model_config = ConfigDict(populate_by_name=True)
+
     name: str = Field(..., description="Agent名称")
     description: Optional[str] = Field(None, description="Agent描述")
     api_key_id: str = Field(..., description="API密钥ID")
     prompt_template_id: Optional[str] = Field(None, description="提示词模板ID")
     knowledge_base_id: Optional[str] = Field(None, description="知识库ID")
     tools_config: Optional[Dict[str, Any]] = Field(None, description="工具配置")
-    model_config: Optional[Dict[str, Any]] = Field(None, description="模型配置")
+    llm_config: Optional[Dict[str, Any]] = Field(None, alias="model_config", description="模型配置")
 
 
 class AgentUpdate(BaseModel):
     """更新Agent请求"""
+    model_config = ConfigDict(populate_by_name=True)
+
     name: Optional[str] = None
     description: Optional[str] = None
     api_key_id: Optional[str] = None
     prompt_template_id: Optional[str] = None
     knowledge_base_id: Optional[str] = None
     tools_config: Optional[Dict[str, Any]] = None
-    model_config: Optional[Dict[str, Any]] = None
+    llm_config: Optional[Dict[str, Any]] = Field(None, alias="model_config")
     is_active: Optional[bool] = None
 
 
@@ -189,13 +219,12 @@ class AgentResponse(BaseModel):
     prompt_template_id: Optional[str] = None
     knowledge_base_id: Optional[str] = None
     tools_config: Optional[Dict[str, Any]] = None
-    model_config: Optional[Dict[str, Any]] = None
+    llm_config: Optional[Dict[str, Any]] = Field(None, alias="model_config")
     is_active: bool
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
 
 
 # 对话相关模型
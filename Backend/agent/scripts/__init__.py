@@ -0,0 +1 @@
+"""Agent服务运维脚本"""
@@ -0,0 +1,86 @@
+"""
+Agent服务导入耗时预算检查
+
+Usage (在 Backend 目录下):
+  python -m agent.scripts.import_budget            # 默认预算 AGENT_IMPORT_BUDGET_MS 或 1500ms
+  python -m agent.scripts.import_budget --budget-ms 1200 --top 15 --repeat 5
+
+在独立子进程中以 `python -X importtime` 导入 agent.app，统计总耗时并列出最耗时的模块；
+默认测量 3 次取最快一次（导入耗时的抖动只会使结果偏大），超出预算时以非零状态码退出。
+pytest 用例 agent/tests/test_import_budget.py 以同样方式检查导入耗时回归。
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+_BACKEND_DIR = Path(__file__).resolve().parents[2]
+# -X importtime 输出格式：import time: self [us] | cumulative | imported package
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+
+DEFAULT_BUDGET_MS = float(os.getenv("AGENT_IMPORT_BUDGET_MS", "1500"))
+
+
+def measure(module: str = "agent.app", repeat: int = 1) -> Tuple[float, List[Tuple[int, str]]]:
+    """
+    导入指定模块并统计耗时。
+    输入参数：
+      - module: 模块名
+      - repeat: 测量次数，取总耗时最短的一次
+    输出数据格式：
+      - (总耗时毫秒, [(自身耗时微秒, 模块名)]，按自身耗时降序)
+    """
+    return min((_measure_once(module) for _ in range(max(1, repeat))), key=lambda result: result[0])
+
+
+def _measure_once(module: str) -> Tuple[float, List[Tuple[int, str]]]:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(_BACKEND_DIR),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+    total_us = 0
+    modules: List[Tuple[int, str]] = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+        modules.append((self_us, name.strip()))
+        # 顶层导入（缩进为一个空格）的累计耗时之和即总导入耗时
+        if len(indent) == 1:
+            total_us += cumulative_us
+    modules.sort(reverse=True)
+    return total_us / 1000.0, modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="检查 agent.app 的导入耗时是否超出预算")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3, help="测量次数，取最快一次")
+    parser.add_argument("--top", type=int, default=10, help="列出自身耗时最多的模块数量")
+    parser.add_argument("--module", default="agent.app")
+    args = parser.parse_args()
+
+    total_ms, modules = measure(args.module, args.repeat)
+    print(f"导入 {args.module} 耗时 {total_ms:.0f}ms（预算 {args.budget_ms:.0f}ms）")
+    for self_us, name in modules[: args.top]:
+        print(f"  {self_us / 1000:8.1f}ms  {name}")
+    if total_ms > args.budget_ms:
+        print(f"❌ 导入耗时超出预算 {total_ms - args.budget_ms:.0f}ms")
+        return 1
+    print("✅ 导入耗时在预算内")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+RAG 源表导入
+
+Usage (在 Backend 目录下):
+  python -m agent.scripts.ingest_rag_sql                         # 导入 rag/源表/*.sql 到 RAG PostgreSQL（COPY）
+  python -m agent.scripts.ingest_rag_sql rag/源表/学校.sql --method executemany --batch-size 1000
+  python -m agent.scripts.ingest_rag_sql --no-db --documents-out rag_documents.jsonl
+
+流式解析 SQL 导出文件并按批写入 RAG_POSTGRES_* 指定的数据库（默认先清空目标表，--append 时追加；每张表的清空与写入在一个事务中），
+可同时把每批数据行生成的知识库文档写成 JSONL（每行 {filename, content, file_type, metadata, document_id}，可直接作为文档上传请求）；
+结束时输出各表行数与 rows/s 吞吐。
+"""
+import argparse
+import json
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+
+from agent.knowledge.ingest import IngestStats, PostgresSink, SqlDumpIngester, default_dump_paths
+from agent.models.schemas import DocumentUpload
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="流式导入 RAG 源表 SQL 导出文件")
+    parser.add_argument("paths", nargs="*", type=Path, help="导出文件路径，默认 rag/源表/*.sql")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批行数，默认 AGENT_RAG_INGEST_BATCH_SIZE")
+    parser.add_argument("--method", choices=("copy", "executemany"), default="copy", help="数据库写入方式")
+    parser.add_argument("--append", action="store_true", help="追加写入，不清空目标表")
+    parser.add_argument("--no-db", action="store_true", help="不写数据库（仅解析 / 生成文档）")
+    parser.add_argument("--documents-out", type=Path, default=None, help="知识库文档输出 JSONL 文件")
+    args = parser.parse_args()
+
+    paths = args.paths or default_dump_paths()
+    if not paths:
+        print("⚠️ 未找到 SQL 导出文件")
+        return 1
+
+    with ExitStack() as stack:
+        sink = None
+        if not args.no_db:
+            try:
+                sink = stack.enter_context(PostgresSink(method=args.method, replace=not args.append))
+            except ImportError:
+                print("⚠️ 写入 RAG PostgreSQL 需要安装 psycopg（pip install \"psycopg[binary]\"），或使用 --no-db")
+                return 1
+        on_document = None
+        if args.documents_out is not None:
+            output = stack.enter_context(open(args.documents_out, "w", encoding="utf-8"))
+
+            def on_document(document_id: str, upload: DocumentUpload) -> None:
+                output.write(json.dumps(upload.model_dump(), ensure_ascii=False) + "\n")
+
+        ingester = SqlDumpIngester(sink=sink, on_document=on_document, batch_size=args.batch_size)
+        stats = IngestStats()
+        for path in paths:
+            rows, seconds = stats.rows, stats.seconds
+            ingester.ingest_file(path, stats)
+            rows, seconds = stats.rows - rows, stats.seconds - seconds
+            print(f"  {path.name}: {rows} 行，{seconds:.3f}s，{rows / seconds if seconds > 0 else 0:.0f} rows/s")
+
+    print(
+        f"✅ 导入完成：{stats.files} 个文件，{stats.rows} 行，{stats.documents} 个文档，"
+        f"{stats.seconds:.2f}s（数据库 {stats.db_seconds:.2f}s，文档 {stats.document_seconds:.2f}s），"
+        f"{stats.rows_per_second:.0f} rows/s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
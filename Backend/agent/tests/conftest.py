@@ -0,0 +1,11 @@
+"""
+测试公共配置
+在 Backend 目录下运行：python -m pytest -q agent/tests
+"""
+import sys
+from pathlib import Path
+
+# 以 agent.* 绝对导入被测模块
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
@@ -0,0 +1,126 @@
+"""
+多步智能体循环：工具循环、步数上限、checkpoint 继续与已结束运行
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent.core.agent_graph import AgentGraph, RunFinished
+
+OPTIONS = {"model": "qwen-max", "temperature": 0.0, "conversation_id": "test-graph", "max_steps": 5}
+
+
+def _tool_call(name, call_id):
+    return AIMessage(content="", tool_calls=[{"name": name, "args": {}, "id": call_id}])
+
+
+class ScriptedModel:
+    """按顺序返回预设消息；用完后一直返回最后一条"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    async def __call__(self, messages, options):
+        reply = self.replies[min(self.calls, len(self.replies) - 1)]
+        self.calls += 1
+        return reply
+
+
+class RecordingTools:
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.batches = []
+
+    async def __call__(self, tool_calls, options):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("tool failed")
+        self.batches.append([call["name"] for call in tool_calls])
+        return [ToolMessage(content=f"{call['name']} ok", tool_call_id=call["id"]) for call in tool_calls]
+
+
+def _run(graph, run_id=None, **options):
+    return asyncio.run(graph.run([HumanMessage(content="缓冲区分析后保存")], {**OPTIONS, **options}, run_id))
+
+
+def test_tool_loop_until_model_stops_calling_tools():
+    model = ScriptedModel(_tool_call("buffer_analysis", "1"), _tool_call("save_buffer_results_as_layer", "2"), AIMessage(content="完成"))
+    tools = RecordingTools()
+    graph = AgentGraph(model, tools, MemorySaver())
+
+    run = _run(graph)
+    assert tools.batches == [["buffer_analysis"], ["save_buffer_results_as_layer"]]
+    assert model.calls == 3
+    assert run["resumed"] is False
+    assert run["messages"][-1].content == "完成"
+    assert [m.tool_call_id for m in run["messages"] if isinstance(m, ToolMessage)] == ["1", "2"]
+
+
+def test_max_steps_stops_with_pending_tool_calls():
+    model = ScriptedModel(_tool_call("buffer_analysis", "1"), _tool_call("buffer_analysis", "2"), _tool_call("buffer_analysis", "3"))
+    tools = RecordingTools()
+    graph = AgentGraph(model, tools, MemorySaver())
+
+    run = _run(graph, max_steps=2)
+    assert model.calls == 2
+    assert tools.batches == [["buffer_analysis"]]
+    assert run["messages"][-1].tool_calls
+
+    state = asyncio.run(graph.state(run["run_id"]))
+    assert state["steps"] == 2 and state["next"] == []
+
+
+def test_resume_continues_from_last_checkpoint():
+    model = ScriptedModel(_tool_call("buffer_analysis", "1"), AIMessage(content="完成"))
+    tools = RecordingTools(fail_times=1)
+    graph = AgentGraph(model, tools, MemorySaver())
+
+    with pytest.raises(RuntimeError):
+        _run(graph, run_id="run-1")
+    state = asyncio.run(graph.state("run-1"))
+    assert state["next"] == ["tools"] and state["steps"] == 1
+
+    run = _run(graph, run_id="run-1")
+    assert run["resumed"] is True
+    # 模型调用不重复，只重新执行失败的工具节点
+    assert model.calls == 2
+    assert tools.batches == [["buffer_analysis"]]
+    assert run["messages"][-1].content == "完成"
+
+
+def test_finished_run_id_is_rejected():
+    graph = AgentGraph(ScriptedModel(AIMessage(content="完成")), RecordingTools(), MemorySaver())
+    _run(graph, run_id="run-1")
+    with pytest.raises(RunFinished):
+        _run(graph, run_id="run-1")
+
+
+def test_run_endpoint_returns_409_for_finished_run(monkeypatch):
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+
+    from agent import app as agent_app
+
+    async def no_history(conversation_id):
+        return []
+
+    graph = AgentGraph(ScriptedModel(AIMessage(content="完成")), RecordingTools(), MemorySaver())
+    monkeypatch.setattr(agent_app, "_agent_graph", graph)
+    monkeypatch.setattr(agent_app._history_store, "get", no_history)
+    client = TestClient(agent_app.app)
+    payload = {"model": "qwen-max", "temperature": 0.0, "prompt": "你好", "conversation_id": "test-graph"}
+
+    first = client.post("/agent/run", json=payload)
+    assert first.status_code == 200
+    run_id = first.json()["data"]["run_id"]
+    assert run_id
+
+    second = client.post("/agent/run", json={**payload, "prompt": "换个问题", "run_id": run_id})
+    assert second.status_code == 409
+    assert second.json()["success"] is False
+    assert second.json()["data"] == {"run_id": run_id}
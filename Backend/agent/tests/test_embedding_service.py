@@ -0,0 +1,121 @@
+"""
+向量化服务：去重、缓存、分批与重试（httpx.MockTransport 离线模拟 /embeddings 接口），以及未开启远程向量化时的回退
+"""
+import json
+import logging
+import threading
+
+import httpx
+import numpy as np
+import pytest
+
+from agent.core.config import settings
+from agent.knowledge.embedding_service import EmbeddingCache, EmbeddingService, RemoteEmbedder, RequestLimiter
+from agent.knowledge.embeddings import create_embedder
+from agent.knowledge.engine import KnowledgeBase
+
+
+def _vector(text):
+    return [float(len(text)), float(ord(text[0]))]
+
+
+class FakeEmbeddingsApi:
+    """模拟 OpenAI 兼容 /embeddings：记录每次请求的输入，可预设若干失败响应"""
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.inputs = []
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        with self._lock:
+            if self.failures:
+                status, headers = self.failures.pop(0)
+                return httpx.Response(status, headers=headers, json={"error": "failed"})
+            texts = json.loads(request.content)["input"]
+            self.inputs.append(texts)
+        # 乱序返回，由 index 还原顺序
+        data = [{"index": i, "embedding": _vector(text)} for i, text in enumerate(texts)]
+        return httpx.Response(200, json={"data": data[::-1]})
+
+    @property
+    def requests(self):
+        return len(self.inputs)
+
+
+def _service(api, **kwargs):
+    embedder = RemoteEmbedder("text-embedding-v3", "https://embedding.example/v1", "key", dimensions=2, transport=httpx.MockTransport(api))
+    kwargs.setdefault("base_delay", 0.0)
+    kwargs.setdefault("max_delay", 0.01)
+    return EmbeddingService(embedder, **kwargs)
+
+
+def test_duplicate_texts_are_embedded_once():
+    api = FakeEmbeddingsApi()
+    service = _service(api)
+    vectors = service.embed(["黄陂区", "横店中学", "黄陂区"])
+    assert api.inputs == [["黄陂区", "横店中学"]]
+    assert vectors.shape == (3, 2)
+    np.testing.assert_array_equal(vectors[0], vectors[2])
+    np.testing.assert_array_equal(vectors[1], _vector("横店中学"))
+    assert service.stats()["embedded"] == 2
+
+
+def test_cache_hits_skip_requests(tmp_path):
+    api = FakeEmbeddingsApi()
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    _service(api, cache=cache).embed(["学校", "水系"])
+    assert api.requests == 1
+
+    # 新的服务实例（如进程重启）直接命中磁盘缓存
+    service = _service(api, cache=cache)
+    vectors = service.embed(["水系", "学校", "医院"])
+    assert api.inputs[1:] == [["医院"]]
+    assert service.stats()["cache_hits"] == 2
+    np.testing.assert_array_equal(vectors[0], _vector("水系"))
+    assert cache.count("text-embedding-v3:2") == 3
+    cache.close()
+
+
+@pytest.mark.parametrize("limiter", [None, RequestLimiter(max_concurrency=3, qps=0)])
+def test_missing_texts_are_batched(limiter):
+    api = FakeEmbeddingsApi()
+    service = _service(api, batch_size=2, limiter=limiter)
+    texts = [f"文本{i}" for i in range(5)]
+    vectors = service.embed(texts)
+    assert sorted(len(batch) for batch in api.inputs) == [1, 2, 2]
+    assert sorted(text for batch in api.inputs for text in batch) == sorted(texts)
+    np.testing.assert_array_equal(vectors, np.asarray([_vector(text) for text in texts], dtype=np.float32))
+    assert service.stats()["requests"] == 3
+
+
+def test_retryable_errors_are_retried():
+    api = FakeEmbeddingsApi(failures=[(429, {"Retry-After": "0"}), (503, {})])
+    service = _service(api, max_retries=3)
+    vectors = service.embed(["学校"])
+    np.testing.assert_array_equal(vectors[0], _vector("学校"))
+    assert service.stats()["retries"] == 2
+    assert service.stats()["requests"] == 1
+
+
+def test_retries_are_bounded_and_skip_client_errors():
+    service = _service(FakeEmbeddingsApi(failures=[(503, {})] * 3), max_retries=1)
+    with pytest.raises(httpx.HTTPStatusError):
+        service.embed(["学校"])
+    assert service.stats()["retries"] == 1
+
+    service = _service(FakeEmbeddingsApi(failures=[(400, {})]), max_retries=3)
+    with pytest.raises(httpx.HTTPStatusError):
+        service.embed(["学校"])
+    assert service.stats()["retries"] == 0
+
+
+def test_fallback_to_hashing_is_logged_and_reported(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "embedding_remote", False)
+    with caplog.at_level(logging.WARNING, logger="agent.knowledge.embeddings"):
+        embedder = create_embedder("text-embedding-ada-002")
+    assert embedder.model == "hashing-512"
+    assert any("text-embedding-ada-002" in record.getMessage() for record in caplog.records)
+
+    base = KnowledgeBase("fallback", embedding_model="text-embedding-ada-002")
+    assert base.to_response()["embedding_model"] == "hashing-512"
@@ -0,0 +1,50 @@
+"""
+会话历史压缩：历史条目的分析类型识别
+"""
+import pytest
+
+from agent.core.history_compactor import HistoryCompactor, classify_entry, latest_analysis_type
+
+BUFFER_LAYER = "缓冲区分析结果_学校_r500_s8"
+
+
+@pytest.mark.parametrize(
+    "entry, analysis_type",
+    [
+        ("缓冲区分析操作已发送到前端，图层：学校，半径：500meters", "缓冲区分析"),
+        (f"相交分析操作已发送到前端，目标图层：{BUFFER_LAYER}，掩膜图层：医院", "相交分析"),
+        (f"擦除分析操作已发送到前端，目标图层：{BUFFER_LAYER}，擦除图层：水系", "擦除分析"),
+        (f"最短路径分析操作已发送到前端，起点图层：{BUFFER_LAYER}，终点图层：医院", "最短路径分析"),
+        (f"保存缓冲区分析结果为图层：{BUFFER_LAYER}", "缓冲区分析"),
+        ("intersection.save_layer", "相交分析"),
+        ("buffer.export_json", "缓冲区分析"),
+        (f"query:{BUFFER_LAYER}:NAME:eq:学校", "属性查询"),
+        (f"保存操作已发送到前端，图层名称：{BUFFER_LAYER}", "属性查询"),
+        (f"导出操作已发送到前端，文件名：{BUFFER_LAYER}", "属性查询"),
+        (f"show:{BUFFER_LAYER}", "图层显示"),
+        (f"工具执行失败: save_buffer_results_as_layer: 相交分析", "其他操作"),
+    ],
+)
+def test_classify_entry_uses_leading_action(entry, analysis_type):
+    assert classify_entry(entry) == analysis_type
+
+
+def test_latest_analysis_ignores_layer_names():
+    history = [
+        "缓冲区分析操作已发送到前端，图层：学校，半径：500meters",
+        f"保存缓冲区分析结果为图层：{BUFFER_LAYER}",
+        f"相交分析操作已发送到前端，目标图层：{BUFFER_LAYER}，掩膜图层：医院",
+        f"hide:{BUFFER_LAYER}",
+    ]
+    assert latest_analysis_type(history) == "相交分析"
+
+
+def test_summary_counts_by_leading_action():
+    history = [
+        "缓冲区分析操作已发送到前端，图层：学校，半径：500meters",
+        f"相交分析操作已发送到前端，目标图层：{BUFFER_LAYER}，掩膜图层：医院",
+        "show:学校",
+    ]
+    compact = HistoryCompactor(keep_recent=1, max_tokens=1000).compact(history)
+    assert "缓冲区分析×1" in compact.history_text
+    assert "相交分析×1" in compact.history_text
@@ -0,0 +1,113 @@
+"""
+会话历史存储：接口约束、读写往返、条数上限与空闲淘汰
+"""
+import asyncio
+import time
+
+import pytest
+
+from agent.core.history_store import ConversationHistoryStore, InMemoryHistoryStore, SQLiteHistoryStore
+
+
+def test_history_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        ConversationHistoryStore()
+
+    class Partial(ConversationHistoryStore):
+        async def get(self, conversation_id):
+            return []
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def _memory_store(tmp_path, **options):
+    return InMemoryHistoryStore(**options)
+
+
+def _sqlite_memory_store(tmp_path, **options):
+    return SQLiteHistoryStore(":memory:", **options)
+
+
+def _sqlite_file_store(tmp_path, **options):
+    return SQLiteHistoryStore(str(tmp_path / "history.sqlite3"), **options)
+
+
+STORES = pytest.mark.parametrize(
+    "make_store",
+    [_memory_store, _sqlite_memory_store, _sqlite_file_store],
+    ids=["memory", "sqlite-memory", "sqlite-file"],
+)
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@STORES
+def test_round_trip(tmp_path, make_store):
+    store = make_store(tmp_path)
+
+    async def scenario():
+        assert await store.get("c1") == []
+        await store.append("c1", "缓冲区分析")
+        await store.extend("c1", ["相交分析", "保存为图层"])
+        await store.append("c2", "打开图层")
+        assert await store.get("c1") == ["缓冲区分析", "相交分析", "保存为图层"]
+        assert await store.get("c2") == ["打开图层"]
+        await store.clear("c1")
+        assert await store.get("c1") == []
+        assert await store.get("c2") == ["打开图层"]
+        await store.close()
+
+    _run(scenario())
+
+
+@STORES
+def test_trim_keeps_latest_entries(tmp_path, make_store):
+    store = make_store(tmp_path, max_entries=3)
+
+    async def scenario():
+        await store.extend("c1", [f"操作{i}" for i in range(5)])
+        assert await store.get("c1") == ["操作2", "操作3", "操作4"]
+        await store.append("c1", "操作5")
+        assert await store.get("c1") == ["操作3", "操作4", "操作5"]
+        await store.close()
+
+    _run(scenario())
+
+
+@STORES
+def test_idle_conversations_expire(tmp_path, make_store):
+    store = make_store(tmp_path, idle_ttl=0.2)
+
+    async def scenario():
+        await store.append("idle", "缓冲区分析")
+        await store.append("active", "相交分析")
+        await asyncio.sleep(0.15)
+        assert await store.get("active") == ["相交分析"]
+        await asyncio.sleep(0.15)
+        await store.append("active", "保存为图层")
+        assert await store.get("idle") == []
+        assert await store.get("active") == ["相交分析", "保存为图层"]
+        await store.close()
+
+    _run(scenario())
+
+
+def test_sqlite_read_does_not_wait_for_writer(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "history.sqlite3"
+    store = SQLiteHistoryStore(str(path))
+    _run(store.append("c1", "缓冲区分析"))
+    writer = sqlite3.connect(str(path), isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        assert _run(store.get("c1")) == ["缓冲区分析"]
+        assert time.monotonic() - started < 1.0
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+        _run(store.close())
@@ -0,0 +1,15 @@
+"""
+agent.app 导入耗时预算（AGENT_IMPORT_BUDGET_MS，默认 1500ms）
+"""
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("langchain")
+
+from agent.scripts.import_budget import DEFAULT_BUDGET_MS, measure
+
+
+def test_agent_app_import_within_budget():
+    total_ms, modules = measure("agent.app", repeat=3)
+    slowest = ", ".join(f"{name} {self_us / 1000:.0f}ms" for self_us, name in modules[:5])
+    assert total_ms <= DEFAULT_BUDGET_MS, f"导入 agent.app 耗时 {total_ms:.0f}ms，超出预算 {DEFAULT_BUDGET_MS:.0f}ms（最慢: {slowest}）"
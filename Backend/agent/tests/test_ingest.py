@@ -0,0 +1,112 @@
+"""
+RAG 源表导入：整表列类型推断与按表事务写入
+"""
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+
+from agent.knowledge.ingest import PostgresSink, SqlDumpIngester, infer_column_types
+
+DUMP = """-- 学校
+INSERT INTO "学校" ("SmID", "名称", "编码", "公办") VALUES (1, '横店中学', 101, true), (2, '前川中学', 102, true);
+INSERT INTO "学校" ("SmID", "名称", "编码", "公办") VALUES (3, '二中', 103, false), (4, '三中', 104, NULL);
+INSERT INTO "学校" ("SmID", "名称", "编码", "公办") VALUES (5, '四中', 'X105', true), (6, '五中', 106.5, true);
+INSERT INTO "水系" ("SmID", "名称") VALUES (1, '府河'), (2, '滠水');
+"""
+
+
+class FakeCopy:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, statement):
+        self.connection.log.append(statement.as_string(None))
+
+    def copy(self, statement):
+        self.connection.log.append(statement.as_string(None))
+        if self.connection.fail_on_copy and len(self.connection.rows) >= self.connection.fail_on_copy:
+            raise RuntimeError("copy failed")
+        return FakeCopy(self.connection.rows)
+
+
+class FakeConnection:
+    def __init__(self, fail_on_copy=0):
+        self.fail_on_copy = fail_on_copy
+        self.log = []
+        self.rows = []
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def dump(tmp_path):
+    path = tmp_path / "学校.sql"
+    path.write_text(DUMP, encoding="utf-8")
+    return path
+
+
+def test_infer_column_types_uses_whole_table(dump):
+    types = infer_column_types(dump)
+    assert types["学校"] == {"SmID": "NUMERIC", "名称": "TEXT", "编码": "TEXT", "公办": "BOOLEAN"}
+    assert types["水系"] == {"SmID": "NUMERIC", "名称": "TEXT"}
+
+
+def test_each_table_is_replaced_in_one_transaction(dump, monkeypatch):
+    connection = FakeConnection()
+    monkeypatch.setattr(psycopg, "connect", lambda dsn: connection)
+    with PostgresSink(dsn="postgresql://test", schema="public") as sink:
+        SqlDumpIngester(sink=sink, batch_size=1).ingest_file(dump)
+
+    log = connection.log
+    create = next(statement for statement in log if statement.startswith('CREATE TABLE IF NOT EXISTS "public"."学校"'))
+    assert '"编码" TEXT' in create and '"SmID" NUMERIC' in create and '"公办" BOOLEAN' in create
+    assert log.count('TRUNCATE "public"."学校"') == 1
+    # 学校 的清空与全部批次在同一事务中，切换到 水系 时提交
+    school = log[:log.index("COMMIT")]
+    assert school[0].startswith("CREATE TABLE") and school[1].startswith("TRUNCATE")
+    assert sum(statement.startswith("COPY") for statement in school) >= 2
+    assert not any("水系" in statement for statement in school)
+    assert log.count("COMMIT") == 2
+    assert len(connection.rows) == 8
+    assert connection.closed
+
+
+def test_failure_rolls_back_table(dump, monkeypatch):
+    connection = FakeConnection(fail_on_copy=2)
+    monkeypatch.setattr(psycopg, "connect", lambda dsn: connection)
+    with pytest.raises(RuntimeError):
+        with PostgresSink(dsn="postgresql://test", schema="public") as sink:
+            SqlDumpIngester(sink=sink, batch_size=1).ingest_file(dump)
+    assert "COMMIT" not in connection.log
+    assert connection.log[-1] == "ROLLBACK"
@@ -0,0 +1,76 @@
+"""
+确定性意图路由：保存/导出指令的参数
+"""
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from agent.tools import map_tool_registry
+from agent.tools.intent_router import route_intent
+
+HISTORY = ["缓冲区分析操作已发送到前端，图层：学校，半径：500meters"]
+
+
+def _single_call(prompt, history=HISTORY):
+    match = route_intent(prompt, history)
+    assert match is not None
+    assert len(match.tool_calls) == 1
+    return match.tool_calls[0]
+
+
+def test_save_without_name_leaves_layer_name_to_frontend():
+    call = _single_call("保存缓冲区分析结果为图层")
+    assert call["name"] == "save_buffer_results_as_layer"
+    assert call["args"] == {}
+
+
+def test_save_with_name_passes_layer_name():
+    call = _single_call("保存为图层，名称为学校缓冲区")
+    assert call["args"] == {"layer_name": "学校缓冲区"}
+
+
+def test_export_without_name_uses_default_file_name():
+    call = _single_call("导出相交分析结果为JSON")
+    assert call["name"] == "export_intersection_results_as_json"
+    assert call["args"] == {"file_name": "相交分析结果"}
+
+
+def test_visibility_command():
+    match = route_intent("打开@学校和@水系线")
+    assert [call["args"] for call in match.tool_calls] == [
+        {"layer_name": "学校", "action": "show"},
+        {"layer_name": "水系线", "action": "show"},
+    ]
+
+
+@pytest.mark.parametrize("prompt", ["保存为图层", "保存查询结果为图层"])
+def test_save_tools_accept_missing_layer_name(prompt):
+    import asyncio
+
+    call = _single_call(prompt, ["query:学校:NAME:eq:横店中学"])
+    result = asyncio.run(map_tool_registry.ainvoke(call["name"], call["args"]))
+    assert "默认名称" in str(result)
+
+
+BUFFER_THEN_INTERSECTION = [
+    "缓冲区分析操作已发送到前端，图层：学校，半径：500meters",
+    "保存缓冲区分析结果为图层：缓冲区分析结果_学校_r500_s8",
+    "相交分析操作已发送到前端，目标图层：缓冲区分析结果_学校_r500_s8，掩膜图层：医院",
+]
+
+
+def test_save_targets_latest_analysis_not_layer_name_keyword():
+    call = _single_call("保存为图层", BUFFER_THEN_INTERSECTION)
+    assert call["name"] == "save_intersection_results_as_layer"
+
+
+def test_export_targets_latest_analysis_not_layer_name_keyword():
+    call = _single_call("导出为JSON", BUFFER_THEN_INTERSECTION)
+    assert call["name"] == "export_intersection_results_as_json"
+
+
+def test_query_on_buffer_layer_routes_to_query_results():
+    history = BUFFER_THEN_INTERSECTION + ["query:缓冲区分析结果_学校_r500_s8:NAME:eq:横店中学"]
+    assert _single_call("保存为图层", history)["name"] == "save_query_results_as_layer"
+    history = history + ["导出操作已发送到前端，文件名：缓冲区分析结果_学校_r500_s8"]
+    assert _single_call("导出为JSON", history)["name"] == "export_query_results_as_json"
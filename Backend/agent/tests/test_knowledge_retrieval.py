@@ -0,0 +1,55 @@
+"""
+知识库检索：本地哈希向量化下的默认相似度阈值与各检索模式
+"""
+import pytest
+
+from agent.core.config import settings
+from agent.knowledge.embedding_service import EmbeddingService
+from agent.knowledge.embeddings import HashingEmbedder, default_score_threshold
+from agent.knowledge.engine import KnowledgeBase
+from agent.models.schemas import DocumentUpload, KnowledgeQuery
+
+CORPUS = {
+    "school": "学校｜名称：横店中学，行政区：黄陂区，地址：横店街道临空北路",
+    "school2": "学校｜名称：武汉市第二中学，行政区：江岸区，地址：胜利街",
+    "river": "水系线｜名称：府河，流经：黄陂区、东西湖区",
+    "hospital": "医院｜名称：黄陂区人民医院，地址：前川街道",
+}
+
+
+@pytest.fixture(scope="module")
+def base():
+    base = KnowledgeBase("fixture")
+    for document_id, content in CORPUS.items():
+        base.add_document(DocumentUpload(filename=f"{document_id}.txt", file_type="txt", content=content), document_id=document_id)
+    return base
+
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid", "bm25"])
+def test_default_threshold_finds_exact_match(base, mode):
+    results = base.query(KnowledgeQuery(query="黄陂区 横店中学", mode=mode))
+    assert results
+    assert results[0].document_id == "school"
+
+
+def test_hybrid_uses_dense_candidates(base):
+    dense = base.query(KnowledgeQuery(query="黄陂区 横店中学", mode="dense", top_k=10))
+    # 哈希向量化的余弦相似度低于语义模型的常用阈值，默认阈值不能把向量候选全部过滤
+    assert all(0 < result.score < settings.knowledge_score_threshold for result in dense)
+    hybrid = base.query(KnowledgeQuery(query="黄陂区 横店中学", mode="hybrid", top_k=10))
+    assert {result.document_id for result in hybrid} == set(CORPUS)
+
+
+def test_explicit_threshold_still_applies(base):
+    assert base.query(KnowledgeQuery(query="黄陂区 横店中学", mode="dense", score_threshold=0.99)) == []
+
+
+def test_default_threshold_depends_on_embedder():
+    assert default_score_threshold(HashingEmbedder()) == 0.0
+    assert default_score_threshold(EmbeddingService(HashingEmbedder())) == 0.0
+
+    class SemanticEmbedder:
+        model = "text-embedding-v3"
+        dimension = 4
+
+    assert default_score_threshold(SemanticEmbedder()) == settings.knowledge_score_threshold
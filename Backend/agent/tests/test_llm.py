@@ -0,0 +1,30 @@
+"""
+LLM调用基础设施：连接预热结果记录到日志
+"""
+import asyncio
+import logging
+
+import pytest
+
+pytest.importorskip("fastapi")
+from agent.core.llm import ChatModelRegistry
+
+
+@pytest.mark.parametrize(
+    "result, level, text",
+    [
+        ({"ok": True, "status_code": 200, "error": None}, logging.INFO, "HTTP 200"),
+        ({"ok": False, "status_code": None, "error": "ConnectError()"}, logging.WARNING, "ConnectError()"),
+    ],
+)
+def test_warm_up_logs_result(monkeypatch, caplog, capsys, result, level, text):
+    registry = ChatModelRegistry([])
+
+    async def reachability():
+        return result
+
+    monkeypatch.setattr(registry, "reachability", reachability)
+    with caplog.at_level(logging.INFO, logger="agent.core.llm"):
+        asyncio.run(registry.warm_up())
+    assert [(record.levelno, text in record.getMessage()) for record in caplog.records] == [(level, True)]
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,132 @@
+"""
+模型池：单个模型超时后回退
+"""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("langchain_core")
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+from agent.core import model_pool as model_pool_module
+from agent.core.llm import ClientDisconnected
+from agent.core.model_pool import ModelPool
+
+
+class _FakeLLM:
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return AIMessage(content=self.name)
+
+
+class _FakeRegistry:
+    def __init__(self, models):
+        self.models = models
+
+    @staticmethod
+    def model_key(model, temperature, max_tokens=None):
+        return model, round(float(temperature), 3), int(max_tokens or 0)
+
+    def get(self, model, temperature, max_tokens=None):
+        return self.models[model]
+
+
+@pytest.fixture(autouse=True)
+def _settings(monkeypatch):
+    monkeypatch.setattr(model_pool_module.settings, "model_attempt_timeout", 0.1)
+    monkeypatch.setattr(model_pool_module.settings, "hedge_enabled", False)
+    monkeypatch.setattr(model_pool_module.settings, "llm_max_retries", 0)
+
+
+def _ask(pool, model="primary"):
+    return asyncio.run(pool.ainvoke(model, 0.0, [HumanMessage(content="打开@学校")]))
+
+
+def test_slow_primary_falls_back_after_its_own_timeout():
+    models = {"primary": _FakeLLM("primary", delay=1.0), "backup": _FakeLLM("backup")}
+    pool = ModelPool(_FakeRegistry(models), fallback_models=["backup"])
+    assert _ask(pool).content == "backup"
+    assert models["primary"].calls == 1
+    assert pool.stats()["models"]["primary"]["failures"] == 1
+
+
+def test_all_models_timing_out_raises_timeout():
+    models = {"primary": _FakeLLM("primary", delay=1.0), "backup": _FakeLLM("backup", delay=1.0)}
+    pool = ModelPool(_FakeRegistry(models), fallback_models=["backup"])
+    with pytest.raises(asyncio.TimeoutError):
+        _ask(pool)
+
+
+def test_upstream_error_falls_back():
+    models = {"primary": _FakeLLM("primary", error=ValueError("bad response")), "backup": _FakeLLM("backup")}
+    pool = ModelPool(_FakeRegistry(models), fallback_models=["backup"])
+    assert _ask(pool).content == "backup"
+
+
+def test_client_disconnect_does_not_fall_back():
+    models = {"primary": _FakeLLM("primary", error=ClientDisconnected()), "backup": _FakeLLM("backup")}
+    pool = ModelPool(_FakeRegistry(models), fallback_models=["backup"])
+    with pytest.raises(ClientDisconnected):
+        _ask(pool)
+    assert models["backup"].calls == 0
+
+
+def test_attempt_timeout_splits_request_timeout(monkeypatch):
+    monkeypatch.setattr(model_pool_module.settings, "model_attempt_timeout", 0)
+    monkeypatch.setattr(model_pool_module.settings, "request_timeout", 60)
+    pool = ModelPool(_FakeRegistry({}), fallback_models=["backup"])
+    assert pool.attempt_timeout(1) == 60
+    assert pool.attempt_timeout(2) == 30
+
+
+def test_stats_for_unconfigured_models_are_bounded(monkeypatch):
+    monkeypatch.setattr(model_pool_module.settings, "model", "primary")
+    monkeypatch.setattr(model_pool_module.settings, "fallback_models", "backup")
+    monkeypatch.setattr(model_pool_module.settings, "model_cache_size", 2)
+    pool = ModelPool(_FakeRegistry({}), fallback_models=["backup"])
+    pool.route("primary")
+    for i in range(10):
+        pool.route(f"client-model-{i}")
+    assert set(pool.stats()["models"]) == {"primary", "backup", "client-model-8", "client-model-9"}
+
+
+class _FakeStreamLLM:
+    def __init__(self, name, first_chunk_delay=0.0):
+        self.name = name
+        self.first_chunk_delay = first_chunk_delay
+        self.calls = 0
+
+    async def _chunks(self):
+        await asyncio.sleep(self.first_chunk_delay)
+        for piece in ("正在", "执行"):
+            yield AIMessageChunk(content=piece)
+
+    def astream(self, messages):
+        self.calls += 1
+        return self._chunks()
+
+
+def test_stream_hung_primary_falls_back_within_attempt_timeout():
+    models = {"primary": _FakeStreamLLM("primary", first_chunk_delay=5.0), "backup": _FakeStreamLLM("backup")}
+    pool = ModelPool(_FakeRegistry(models), fallback_models=["backup"])
+
+    async def collect():
+        return [chunk.content async for chunk in pool.astream("primary", 0.0, [HumanMessage(content="你好")])]
+
+    started = time.perf_counter()
+    assert asyncio.run(collect()) == ["正在", "执行"]
+    # 首选模型只占用 attempt_timeout（0.1s），而不是整个 request_timeout
+    assert time.perf_counter() - started < 1.0
+    assert models["primary"].calls == 1 and models["backup"].calls == 1
+    assert pool.stats()["models"]["primary"]["failures"] == 1
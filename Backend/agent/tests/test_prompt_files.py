@@ -0,0 +1,62 @@
+"""
+提示词文件：热重载与系统提示词拼接
+"""
+import os
+
+import pytest
+
+from agent.core.prompt_files import PromptFile
+
+
+def test_missing_file_returns_fallback(tmp_path):
+    prompt_file = PromptFile([tmp_path / "missing.md"], fallback="默认", check_interval=0)
+    assert prompt_file.read() == "默认"
+    assert not prompt_file.loaded
+    assert prompt_file.path is None
+
+
+def test_reloads_when_mtime_changes(tmp_path):
+    path = tmp_path / "tools.md"
+    path.write_text("第一版", encoding="utf-8")
+    prompt_file = PromptFile([path], check_interval=0)
+    assert prompt_file.read() == "第一版"
+    assert prompt_file.loaded and prompt_file.path == path
+
+    path.write_text("第二版", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert prompt_file.read() == "第二版"
+
+
+def test_check_interval_skips_stat(tmp_path):
+    path = tmp_path / "tools.md"
+    path.write_text("第一版", encoding="utf-8")
+    prompt_file = PromptFile([path], check_interval=3600)
+    assert prompt_file.read() == "第一版"
+    path.write_text("第二版", encoding="utf-8")
+    os.utime(path, (path.stat().st_atime, path.stat().st_mtime + 10))
+    assert prompt_file.read() == "第一版"
+
+
+def test_system_message_includes_prompt_file(tmp_path, monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("langchain_core")
+    from agent import app as agent_app
+
+    path = tmp_path / "tools.md"
+    path.write_text("你是空间分析助手。", encoding="utf-8")
+    monkeypatch.setattr(agent_app, "_system_prompt_file", PromptFile([path], check_interval=0))
+    req = agent_app.ToolChatRequest(prompt="打开@学校", model="qwen-plus", temperature=0)
+
+    system = agent_app._build_first_messages(req, [])[0]
+    text = system.content if isinstance(system.content, str) else "".join(
+        block.get("text", "") for block in system.content
+    )
+    assert text.startswith("你是空间分析助手。\n\n")
+    assert agent_app._CALL_SYSTEM_PROMPT in text
+
+    path.write_text("你是GIS助手。", encoding="utf-8")
+    os.utime(path, (path.stat().st_atime, path.stat().st_mtime + 10))
+    call_prompt, reply_prompt, tokens = agent_app._system_prompts()
+    assert call_prompt.startswith("你是GIS助手。") and reply_prompt.startswith("你是GIS助手。")
+    assert tokens > 0
@@ -0,0 +1,65 @@
+"""
+上游调用限流：相同请求合并与按上游调用计数
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.core.rate_limiter import UpstreamLimiter, messages_key
+
+
+class _FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return AIMessage(content="ok", usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12})
+
+
+def _limiter():
+    return UpstreamLimiter(max_concurrency=4, qps=0, tpm=0, max_retries=0, base_delay=0.01, max_delay=0.01)
+
+
+def test_messages_key_depends_on_model_parameters_not_instance():
+    messages = [HumanMessage(content="打开@学校")]
+    key = ("qwen-max", 0.0, 1024)
+    assert messages_key(key, messages) == messages_key(("qwen-max", 0.0, 1024), list(messages))
+    assert messages_key(key, messages) != messages_key(("qwen-max", 0.7, 1024), messages)
+    assert messages_key(key, messages) != messages_key(key, [HumanMessage(content="打开@水系")])
+
+
+def test_coalesced_waiters_record_usage_once():
+    limiter = _limiter()
+    recorded = []
+    limiter.add_listener(recorded.append)
+    llm = _FakeLLM()
+    messages = [HumanMessage(content="打开@学校")]
+
+    async def scenario():
+        return await asyncio.gather(*(limiter.ainvoke(llm, messages, ("qwen-max", 0.0, 1024)) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+    assert llm.calls == 1
+    assert all(result.content == "ok" for result in results)
+    assert len(recorded) == 1
+    assert limiter.stats()["coalesced"] == 2
+
+
+def test_requests_without_model_key_are_not_coalesced():
+    limiter = _limiter()
+    recorded = []
+    limiter.add_listener(recorded.append)
+    llm = _FakeLLM()
+    messages = [HumanMessage(content="打开@学校")]
+
+    async def scenario():
+        return await asyncio.gather(*(limiter.ainvoke(llm, messages) for _ in range(2)))
+
+    asyncio.run(scenario())
+    assert llm.calls == 2
+    assert len(recorded) == 2
@@ -0,0 +1,69 @@
+"""
+工具决策缓存：只缓存参数完全取自用户输入的决策
+"""
+import time
+
+import pytest
+
+from agent.core.response_cache import ResponseCache, prompt_derived
+
+
+def _call(name, **args):
+    return {"name": name, "args": args, "id": "call_1", "type": "tool_call"}
+
+
+def test_prompt_derived_arguments():
+    assert prompt_derived("对@学校做500米缓冲区分析", [_call("execute_buffer_analysis", layer_name="学校", radius=500.0, unit="meters")])
+    assert prompt_derived("打开@ＡＢＣ图层", [_call("toggle_layer_visibility", layer_name="abc", action="show")])
+    assert not prompt_derived("隐藏刚才打开的图层", [_call("toggle_layer_visibility", layer_name="学校", action="hide")])
+    assert not prompt_derived("对@学校做缓冲区分析", [_call("execute_buffer_analysis", layer_name="学校", radius=500.0)])
+
+
+def test_context_dependent_decision_is_not_cached():
+    cache = ResponseCache()
+    calls = [_call("toggle_layer_visibility", layer_name="学校", action="hide")]
+    assert cache.put("隐藏刚才打开的图层", "", "qwen-max", calls) is False
+    assert cache.get("隐藏刚才打开的图层", "", "qwen-max") is None
+    assert cache.stats()["rejected"] == 1
+
+
+def test_prompt_derived_decision_round_trip():
+    cache = ResponseCache()
+    calls = [_call("execute_buffer_analysis", layer_name="学校", radius=500, unit="meters")]
+    assert cache.put("对@学校做500米缓冲区分析", "", "qwen-max", calls)
+    hit = cache.get("对@学校做500米缓冲区分析。", "", "qwen-max")
+    assert hit[0]["name"] == "execute_buffer_analysis"
+    assert hit[0]["args"] == {"layer_name": "学校", "radius": 500, "unit": "meters"}
+    assert hit[0]["id"].startswith("call_cached_")
+    # 会话状态或模型不同不命中
+    assert cache.get("对@学校做500米缓冲区分析", "缓冲区分析", "qwen-max") is None
+    assert cache.get("对@学校做500米缓冲区分析", "", "qwen-turbo") is None
+
+
+def test_entries_expire_and_evict():
+    cache = ResponseCache(max_size=1, ttl=0.05)
+    cache.put("打开@学校", "", "m", [_call("toggle_layer_visibility", layer_name="学校", action="show")])
+    cache.put("打开@水系", "", "m", [_call("toggle_layer_visibility", layer_name="水系", action="show")])
+    assert cache.get("打开@学校", "", "m") is None
+    assert cache.stats()["evictions"] == 1
+    time.sleep(0.1)
+    assert cache.get("打开@水系", "", "m") is None
+
+
+def test_intersection_after_buffer_changes_decision_state():
+    pytest.importorskip("fastapi")
+    from agent import app as agent_app
+
+    buffer_history = [
+        "缓冲区分析操作已发送到前端，图层：学校，半径：500meters",
+        "保存缓冲区分析结果为图层：缓冲区分析结果_学校_r500_s8",
+    ]
+    intersection_history = buffer_history + ["相交分析操作已发送到前端，目标图层：缓冲区分析结果_学校_r500_s8，掩膜图层：医院"]
+    assert agent_app._decision_state(buffer_history) == "缓冲区分析"
+    assert agent_app._decision_state(intersection_history) == "相交分析"
+
+    cache = ResponseCache()
+    assert cache.put("保存为图层", agent_app._decision_state(buffer_history), "qwen-max", [_call("save_buffer_results_as_layer")])
+    assert cache.get("保存为图层", agent_app._decision_state(buffer_history), "qwen-max") is not None
+    # 最近一次结果已是相交分析，不能重放缓冲区分析的保存决策
+    assert cache.get("保存为图层", agent_app._decision_state(intersection_history), "qwen-max") is None
@@ -0,0 +1,83 @@
+"""
+/agent/tool-chat 上游错误处理
+"""
+import asyncio
+
+import httpx
+import pytest
+
+pytest.importorskip("fastapi")
+openai = pytest.importorskip("openai")
+from fastapi.testclient import TestClient
+
+from agent import app as agent_app
+
+
+def _status_error(cls, status_code):
+    request = httpx.Request("POST", "https://llm.example/v1/chat/completions")
+    return cls("upstream failed", response=httpx.Response(status_code, request=request), body=None)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(agent_app.settings, "intent_router_enabled", False)
+    monkeypatch.setattr(agent_app.settings, "response_cache_enabled", False)
+    return TestClient(agent_app.app)
+
+
+def _payload(**overrides):
+    payload = {"model": "qwen-max", "temperature": 0.0, "prompt": "你好", "conversation_id": "test-errors"}
+    payload.update(overrides)
+    return payload
+
+
+@pytest.mark.parametrize(
+    "error, status_code",
+    [
+        (_status_error(openai.InternalServerError, 500), 503),
+        (_status_error(openai.RateLimitError, 429), 503),
+        (_status_error(openai.BadRequestError, 400), 502),
+        (RuntimeError("tool registry broken"), 502),
+    ],
+)
+def test_non_stream_upstream_error_maps_to_http_status(client, monkeypatch, error, status_code):
+    async def failing_ainvoke(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(agent_app._model_pool, "ainvoke", failing_ainvoke)
+    response = client.post("/agent/tool-chat", json=_payload())
+    assert response.status_code == status_code
+    body = response.json()
+    assert body["success"] is False
+    assert body["error"].startswith("LLM调用失败")
+
+
+def test_non_stream_timeout_keeps_chat_response(client, monkeypatch):
+    async def slow_ainvoke(*args, **kwargs):
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(agent_app._model_pool, "ainvoke", slow_ainvoke)
+    response = client.post("/agent/tool-chat", json=_payload())
+    assert response.status_code == 200
+    assert response.json() == {"success": False, "data": None, "error": "LLM调用超时"}
+
+
+def _sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], lines["data"]))
+    return events
+
+
+def test_stream_upstream_error_ends_with_error_event(client, monkeypatch):
+    async def failing_astream(*args, **kwargs):
+        raise _status_error(openai.InternalServerError, 500)
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(agent_app._model_pool, "astream", failing_astream)
+    response = client.post("/agent/tool-chat", json=_payload(stream=True))
+    assert response.status_code == 200
+    events = _sse_events(response.text)
+    assert [event for event, _ in events] == ["error"]
+    assert "LLM调用失败" in events[0][1]
@@ -0,0 +1,38 @@
+"""
+请求耗时分解：LLM调用指标的模型标签
+"""
+import pytest
+
+from agent.core import tracing
+from agent.core.config import settings
+
+
+@pytest.fixture
+def configured(monkeypatch):
+    monkeypatch.setattr(settings, "model", "qwen-max")
+    monkeypatch.setattr(settings, "fallback_models", "qwen-plus, qwen-turbo")
+
+
+def test_model_label_keeps_configured_models(configured):
+    assert tracing.model_label("qwen-max") == "qwen-max"
+    assert tracing.model_label("qwen-turbo") == "qwen-turbo"
+    assert tracing.model_label("attacker-model-12345") == "other"
+
+
+def test_unconfigured_models_share_one_series(configured):
+    prometheus_client = pytest.importorskip("prometheus_client")
+    trace = tracing.RequestTrace("test")
+    for i in range(5):
+        trace.record_llm(f"random-model-{i}", None, 0.01, RuntimeError("failed"))
+    trace.record_llm("qwen-max", None, 0.01, RuntimeError("failed"))
+
+    labels = {
+        sample.labels["model"]
+        for metric in prometheus_client.REGISTRY.collect()
+        if metric.name == "agent_llm_call_seconds"
+        for sample in metric.samples
+    }
+    assert not any(label.startswith("random-model-") for label in labels)
+    assert {"other", "qwen-max"} <= labels
+    # debug 字段保留请求中的模型名称
+    assert trace.to_dict()["models"][0] == "random-model-0"
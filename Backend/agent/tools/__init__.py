@@ -0,0 +1,7 @@
+"""
+Agent服务工具
+"""
+from agent.tools.registry import DEFAULT_FRONTEND_ANSWER, ToolRegistry, ToolSpec
+from agent.tools.map_tools import map_tool_registry
+
+__all__ = ["DEFAULT_FRONTEND_ANSWER", "ToolRegistry", "ToolSpec", "map_tool_registry"]
@@ -0,0 +1,127 @@
+"""
+确定性意图路由
+对"打开@学校"、"隐藏@水系线"、"导出为JSON"、"保存为图层"等格式固定的指令，
+在本地用规则直接解析为工具调用，无需请求LLM；无法高置信度解析时交由LLM处理
+"""
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from agent.core.history_compactor import latest_analysis_type
+
+# 分析类型 -> (工具名前缀, 默认导出文件名)
+_RESULT_TARGETS: Dict[str, tuple] = {
+    "缓冲区分析": ("buffer", "缓冲区分析结果"),
+    "相交分析": ("intersection", "相交分析结果"),
+    "擦除分析": ("erase", "擦除分析结果"),
+    "最短路径分析": ("path", "最短路径分析结果"),
+    "属性查询": ("query", "属性查询结果"),
+}
+# 指令中显式提到的分析类型
+_EXPLICIT_TYPES = (
+    ("缓冲区", "缓冲区分析"),
+    ("相交", "相交分析"),
+    ("擦除", "擦除分析"),
+    ("最短路径", "最短路径分析"),
+    ("路径", "最短路径分析"),
+    ("查询", "属性查询"),
+)
+
+_VISIBILITY_VERBS = {
+    "打开": "show", "显示": "show", "展示": "show",
+    "隐藏": "hide", "关闭": "hide",
+    "切换": "toggle",
+}
+_LAYER_NAME = r"@([^\s@，,。；;、和及与]+)"
+_LAYER_SEPARATOR = r"(?:\s*(?:[，,、和及与]|以及)\s*)"
+_VISIBILITY_PATTERN = re.compile(
+    rf"^(?:请|帮我)?\s*(?P<verb>{'|'.join(_VISIBILITY_VERBS)})\s*(?:图层)?\s*"
+    rf"(?P<layers>{_LAYER_NAME}(?:{_LAYER_SEPARATOR}?{_LAYER_NAME})*)\s*(?:图层)?$"
+)
+# 图层名称中出现这些词时，说明指令包含多个动作或参数，交由LLM解析
+_COMPOUND_KEYWORDS = ("然后", "并且", "再", "之后", "缓冲", "分析", "查询", "查找", "筛选", "导出", "保存", "打开", "隐藏", "显示", "切换")
+_SUBJECTS = r"缓冲区|相交|擦除|最短路径|路径|查询"
+_RESULT_SUBJECT = rf"(?:(?P<subject>{_SUBJECTS})(?:分析)?)?(?:结果)?"
+_RESULT_SUBJECT_BEFORE = rf"(?:(?:将|把)\s*(?P<subject_before>{_SUBJECTS})(?:分析)?(?:结果)?)?"
+_EXPORT_PATTERN = re.compile(
+    rf"^(?:请|帮我)?\s*(?:将|把)?\s*{_RESULT_SUBJECT_BEFORE}\s*导出\s*{_RESULT_SUBJECT}\s*(?:为|成)?\s*(?:geo)?json"
+    r"(?:\s*(?:文件)?\s*(?:[,，:：]?\s*(?:文件名|名称|命名为|名为)?\s*[:：为]?\s*(?P<name>[^\s,，。]+)))?$",
+    re.IGNORECASE,
+)
+_SAVE_PATTERN = re.compile(
+    rf"^(?:请|帮我)?\s*(?:将|把)?\s*{_RESULT_SUBJECT_BEFORE}\s*(?:保存|另存)\s*{_RESULT_SUBJECT}\s*(?:为|成)?\s*(?:新)?\s*(?:图层)?"
+    r"(?:\s*[,，:：]?\s*(?:图层名|名称|命名为|名为)\s*[:：为]?\s*(?P<name>[^\s,，。]+))?$"
+)
+_TRAILING_PUNCTUATION = "。.!！~～ "
+
+
+@dataclass(frozen=True)
+class IntentMatch:
+    """本地路由结果：与LLM返回结构一致的工具调用列表及置信度"""
+    tool_calls: List[Dict[str, Any]]
+    confidence: float
+
+
+def _tool_call(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    return {"name": name, "args": args, "id": f"call_local_{uuid.uuid4().hex[:16]}", "type": "tool_call"}
+
+
+def _explicit_analysis_type(subject: Optional[str]) -> Optional[str]:
+    if not subject:
+        return None
+    for keyword, analysis_type in _EXPLICIT_TYPES:
+        if keyword in subject:
+            return analysis_type
+    return None
+
+
+def _route_result_action(match: "re.Match[str]", history: Sequence[str], action: str) -> Optional[IntentMatch]:
+    explicit_type = _explicit_analysis_type(match.group("subject") or match.group("subject_before"))
+    # 未显式指明时取最近一次分析的类型（按历史条目开头的动作识别，图层名称中的关键字不参与）
+    analysis_type = explicit_type or latest_analysis_type(history)
+    if analysis_type is None:
+        return None
+    prefix, default_file_name = _RESULT_TARGETS[analysis_type]
+    name = match.group("name")
+    if action == "save":
+        # 未指定图层名称时不传 layer_name，由前端生成带分析参数的默认名称
+        call = _tool_call(f"save_{prefix}_results_as_layer", {"layer_name": name} if name else {})
+    else:
+        call = _tool_call(f"export_{prefix}_results_as_json", {"file_name": name or default_file_name})
+    # 显式指明分析类型时完全确定；依据历史推断时置信度略低
+    return IntentMatch([call], 1.0 if explicit_type else 0.95)
+
+
+def route_intent(prompt: str, history: Sequence[str] = ()) -> Optional[IntentMatch]:
+    """
+    解析格式固定的地图指令。
+    输入参数：
+      - prompt: 用户输入
+      - history: 会话历史（用于判断"保存为图层"、"导出为JSON"针对的分析类型）
+    输出数据格式：
+      - IntentMatch: 可直接执行的工具调用；无法解析时返回 None
+    """
+    text = prompt.strip().rstrip(_TRAILING_PUNCTUATION)
+    if not text:
+        return None
+
+    visibility = _VISIBILITY_PATTERN.match(text)
+    if visibility:
+        action = _VISIBILITY_VERBS[visibility.group("verb")]
+        layers = re.findall(_LAYER_NAME, visibility.group("layers"))
+        if any(keyword in layer for layer in layers for keyword in _COMPOUND_KEYWORDS):
+            return None
+        return IntentMatch(
+            [_tool_call("toggle_layer_visibility", {"layer_name": layer, "action": action}) for layer in layers],
+            1.0,
+        )
+
+    export = _EXPORT_PATTERN.match(text)
+    if export:
+        return _route_result_action(export, history, "export")
+
+    save = _SAVE_PATTERN.match(text)
+    if save:
+        return _route_result_action(save, history, "save")
+    return None
@@ -0,0 +1,396 @@
+"""
+地图操作工具（前端执行）
+后端不直接操作地图，工具仅回传动作与参数，由前端完成实际操作
+"""
+from typing import Any, Dict
+
+from langchain_core.tools import tool
+
+from agent.tools.registry import ToolRegistry, ToolSpec
+
+
+@tool
+def toggle_layer_visibility(layer_name: str, action: str) -> str:
+    """
+    切换前端图层可见性（前端执行）。
+    输入参数：
+      - layer_name: string 图层名称
+      - action: string 'show'|'hide'|'toggle'
+    业务处理：
+      - 后端不直接操作地图，仅返回动作与图层名称供前端执行
+    输出数据格式：
+      - string: 格式 "action:layer_name"
+    """
+    return f"{action}:{layer_name}"
+
+
+@tool
+def query_features_by_attribute(layer_name: str, field: str, operator: str, value: str) -> str:
+    """
+    按属性选择要素（前端执行）。
+    输入参数：
+      - layer_name: string 图层名称
+      - field: string 属性字段名
+      - operator: string 比较操作符 '='|'!='|'>'|'>='|'<'|'<='|'like'
+      - value: string 查询值
+    业务处理：
+      - 后端不直接操作地图，仅返回查询参数供前端执行
+    输出数据格式：
+      - string: 格式 "query:layer_name:field:operator:value"
+    """
+    return f"query:{layer_name}:{field}:{operator}:{value}"
+
+
+@tool
+def save_query_results_as_layer(layer_name: str = "") -> str:
+    """
+    保存查询结果为新图层（前端执行）。
+    输入参数：
+      - layer_name: string 新图层名称（可选，为空时前端按分析参数生成默认名称）
+    业务处理：
+      - 后端不直接操作地图，仅返回保存参数供前端执行
+    输出数据格式：
+      - string: 格式 "save_layer:layer_name"
+    """
+    return f"保存操作已发送到前端，图层名称：{layer_name or '默认名称'}"
+
+
+@tool
+def export_query_results_as_json(file_name: str) -> str:
+    """
+    导出查询结果为GeoJSON文件（前端执行）。
+    输入参数：
+      - file_name: string 文件名（不包含扩展名）
+    业务处理：
+      - 后端不直接操作地图，仅返回导出指令供前端执行
+    输出数据格式：
+      - string: 格式 "export_json:file_name"
+    """
+    return f"导出操作已发送到前端，文件名：{file_name}"
+
+
+@tool
+def execute_buffer_analysis(layer_name: str, radius: float, unit: str = "meters") -> str:
+    """
+    执行缓冲区分析（前端执行）。
+    输入参数：
+      - layer_name: string 图层名称
+      - radius: float 缓冲区半径
+      - unit: string 单位（默认meters）
+    业务处理：
+      - 后端不直接操作地图，仅返回分析参数供前端执行
+    输出数据格式：
+      - string: 格式 "buffer_analysis:layer_name:radius:unit"
+    """
+    return f"缓冲区分析操作已发送到前端，图层：{layer_name}，半径：{radius}{unit}"
+
+
+@tool
+def execute_intersection_analysis(target_layer_name: str, mask_layer_name: str) -> str:
+    """
+    执行相交分析（前端执行）。
+    输入参数：
+      - target_layer_name: string 目标图层名称
+      - mask_layer_name: string 掩膜图层名称
+    业务处理：
+      - 后端不直接操作地图，仅返回分析参数供前端执行
+    输出数据格式：
+      - string: 格式 "intersection_analysis:target_layer_name:mask_layer_name"
+    """
+    return f"相交分析操作已发送到前端，目标图层：{target_layer_name}，掩膜图层：{mask_layer_name}"
+
+
+@tool
+def execute_erase_analysis(target_layer_name: str, erase_layer_name: str) -> str:
+    """
+    执行擦除分析（前端执行）。
+    输入参数：
+      - target_layer_name: string 目标图层名称
+      - erase_layer_name: string 擦除图层名称
+    业务处理：
+      - 后端不直接操作地图，仅返回分析参数供前端执行
+    输出数据格式：
+      - string: 格式 "erase_analysis:target_layer_name:erase_layer_name"
+    """
+    return f"擦除分析操作已发送到前端，目标图层：{target_layer_name}，擦除图层：{erase_layer_name}"
+
+
+@tool
+def execute_shortest_path_analysis(start_layer_name: str, end_layer_name: str, obstacle_layer_name: str = "") -> str:
+    """
+    执行最短路径分析（前端执行）。
+    输入参数：
+      - start_layer_name: string 起点图层名称
+      - end_layer_name: string 终点图层名称
+      - obstacle_layer_name: string 障碍物图层名称（可选）
+    业务处理：
+      - 后端不直接操作地图，仅返回分析参数供前端执行
+    输出数据格式：
+      - string: 格式 "shortest_path_analysis:start_layer_name:end_layer_name:obstacle_layer_name"
+    """
+    obstacle_info = f"，障碍物图层：{obstacle_layer_name}" if obstacle_layer_name else ""
+    return f"最短路径分析操作已发送到前端，起点图层：{start_layer_name}，终点图层：{end_layer_name}{obstacle_info}"
+
+
+# ===== 4个分析功能的导出和保存工具函数 =====
+
+@tool
+def save_buffer_results_as_layer(layer_name: str = "") -> Dict[str, Any]:
+    """
+    保存缓冲区分析结果为图层（前端执行）。
+    输入参数：
+      - layer_name: string 新图层名称（可选，为空时前端按分析参数生成默认名称）
+    业务处理：
+      - 后端不直接操作地图，仅返回保存参数供前端执行
+    输出数据格式：
+      - { action: 'buffer.save_layer', params: { layer_name: string } }
+    """
+    return {"action": "buffer.save_layer", "params": {"layer_name": layer_name}}
+
+
+@tool
+def export_buffer_results_as_json(file_name: str) -> Dict[str, Any]:
+    """
+    导出缓冲区分析结果为GeoJSON文件（前端执行）。
+    输入参数：
+      - file_name: string 文件名（不包含扩展名）
+    业务处理：
+      - 后端不直接操作地图，仅返回导出指令供前端执行
+    输出数据格式：
+      - { action: 'buffer.export_json', params: { file_name: string } }
+    """
+    return {"action": "buffer.export_json", "params": {"file_name": file_name}}
+
+
+@tool
+def save_intersection_results_as_layer(layer_name: str = "") -> Dict[str, Any]:
+    """
+    保存相交分析结果为图层（前端执行）。
+    输入参数：
+      - layer_name: string 新图层名称（可选，为空时前端按分析参数生成默认名称）
+    业务处理：
+      - 后端不直接操作地图，仅返回保存参数供前端执行
+    输出数据格式：
+      - { action: 'intersection.save_layer', params: { layer_name: string } }
+    """
+    return {"action": "intersection.save_layer", "params": {"layer_name": layer_name}}
+
+
+@tool
+def export_intersection_results_as_json(file_name: str) -> Dict[str, Any]:
+    """
+    导出相交分析结果为GeoJSON文件（前端执行）。
+    输入参数：
+      - file_name: string 文件名（不包含扩展名）
+    业务处理：
+      - 后端不直接操作地图，仅返回导出指令供前端执行
+    输出数据格式：
+      - { action: 'intersection.export_json', params: { file_name: string } }
+    """
+    return {"action": "intersection.export_json", "params": {"file_name": file_name}}
+
+
+@tool
+def save_erase_results_as_layer(layer_name: str = "") -> Dict[str, Any]:
+    """
+    保存擦除分析结果为图层（前端执行）。
+    输入参数：
+      - layer_name: string 新图层名称（可选，为空时前端按分析参数生成默认名称）
+    业务处理：
+      - 后端不直接操作地图，仅返回保存参数供前端执行
+    输出数据格式：
+      - { action: 'erase.save_layer', params: { layer_name: string } }
+    """
+    return {"action": "erase.save_layer", "params": {"layer_name": layer_name}}
+
+
+@tool
+def export_erase_results_as_json(file_name: str) -> Dict[str, Any]:
+    """
+    导出擦除分析结果为GeoJSON文件（前端执行）。
+    输入参数：
+      - file_name: string 文件名（不包含扩展名）
+    业务处理：
+      - 后端不直接操作地图，仅返回导出指令供前端执行
+    输出数据格式：
+      - { action: 'erase.export_json', params: { file_name: string } }
+    """
+    return {"action": "erase.export_json", "params": {"file_name": file_name}}
+
+
+@tool
+def save_path_results_as_layer(layer_name: str = "") -> Dict[str, Any]:
+    """
+    保存最短路径分析结果为图层（前端执行）。
+    输入参数：
+      - layer_name: string 新图层名称（可选，为空时前端按分析参数生成默认名称）
+    业务处理：
+      - 后端不直接操作地图，仅返回保存参数供前端执行
+    输出数据格式：
+      - { action: 'path.save_layer', params: { layer_name: string } }
+    """
+    return {"action": "path.save_layer", "params": {"layer_name": layer_name}}
+
+
+@tool
+def export_path_results_as_json(file_name: str) -> Dict[str, Any]:
+    """
+    导出最短路径分析结果为GeoJSON文件（前端执行）。
+    输入参数：
+      - file_name: string 文件名（不包含扩展名）
+    业务处理：
+      - 后端不直接操作地图，仅返回导出指令供前端执行
+    输出数据格式：
+      - { action: 'path.export_json', params: { file_name: string } }
+    """
+    return {"action": "path.export_json", "params": {"file_name": file_name}}
+
+
+_TOGGLE_ANSWERS: Dict[str, str] = {"show": "图层已显示", "hide": "图层已隐藏", "toggle": "图层已切换"}
+_FILE_NAME_NOTE = "需要指定文件名（不包含扩展名）。"
+_LAYER_NAME_NOTE = "图层名称可选：未指定时系统自动生成默认名称。"
+
+_LAYER_GROUP = "图层显示与查询"
+_ANALYSIS_GROUP = "空间分析"
+_SAVE_GROUP = "保存为图层"
+
+
+def _toggle_answer(args: Dict[str, Any]) -> str:
+    return _TOGGLE_ANSWERS.get(str(args.get("action", "")), "图层已切换")
+
+
+def _save_after_note(analysis: str, tool_name: str) -> str:
+    return f"重要：只有在执行了{analysis}({tool_name})后，用户要求保存结果时才调用此工具。"
+
+
+# 注册顺序即提示词中的编号顺序
+map_tool_registry = ToolRegistry()
+for _spec in (
+    # 第一组：图层显示与查询
+    ToolSpec(
+        tool=toggle_layer_visibility,
+        group=_LAYER_GROUP,
+        signature="layer_name:str, action:'show'|'hide'|'toggle'",
+        triggers=("打开@图层名称", "隐藏@图层名称", "切换@图层名称"),
+        notes=("使用图层名称而非图层ID进行操作。",),
+        answer=_toggle_answer,
+    ),
+    ToolSpec(
+        tool=query_features_by_attribute,
+        group=_LAYER_GROUP,
+        signature="layer_name:str, field:str, operator:str, value:str",
+        triggers=("在@图层名称中查找字段=值", "查询@图层名称的属性", "筛选@图层名称"),
+        notes=(
+            "操作符映射要求: 必须使用前端支持的格式\n"
+            "  * '=' 映射为 'eq'\n"
+            "  * '!=' 映射为 'ne'\n"
+            "  * '>' 映射为 'gt'\n"
+            "  * '>=' 映射为 'gte'\n"
+            "  * '<' 映射为 'lt'\n"
+            "  * '<=' 映射为 'lte'\n"
+            "  * 'like' 保持不变",
+            "例如: 用户说'查找NAME=学校'时，operator参数必须传递'eq'而不是'='",
+        ),
+    ),
+    ToolSpec(
+        tool=export_query_results_as_json,
+        group=_LAYER_GROUP,
+        signature="file_name:str",
+        triggers=("导出为JSON", "导出为GeoJSON", "导出查询结果"),
+        notes=(_FILE_NAME_NOTE,),
+    ),
+    # 第二组：空间分析
+    ToolSpec(
+        tool=execute_buffer_analysis,
+        group=_ANALYSIS_GROUP,
+        signature="layer_name:str, radius:float, unit:str",
+        triggers=("对@图层名称进行缓冲区分析", "创建@图层名称的缓冲区", "缓冲区分析"),
+        notes=("需要指定图层名称、半径和单位（默认meters）。",),
+    ),
+    ToolSpec(
+        tool=execute_intersection_analysis,
+        group=_ANALYSIS_GROUP,
+        signature="target_layer_name:str, mask_layer_name:str",
+        triggers=("对@图层名称进行相交分析", "计算@图层名称与@图层名称的相交", "相交分析"),
+        notes=("需要指定目标图层名称和掩膜图层名称。",),
+    ),
+    ToolSpec(
+        tool=execute_erase_analysis,
+        group=_ANALYSIS_GROUP,
+        signature="target_layer_name:str, erase_layer_name:str",
+        triggers=("对@图层名称进行擦除分析", "从@图层名称中擦除@图层名称", "擦除分析"),
+        notes=("需要指定目标图层名称和擦除图层名称。",),
+    ),
+    ToolSpec(
+        tool=execute_shortest_path_analysis,
+        group=_ANALYSIS_GROUP,
+        signature="start_layer_name:str, end_layer_name:str, obstacle_layer_name:str",
+        triggers=("计算@图层名称到@图层名称的最短路径", "最短路径分析"),
+        notes=("需要指定起点图层名称、终点图层名称，障碍物图层名称可选。",),
+    ),
+    ToolSpec(
+        tool=export_buffer_results_as_json,
+        group=_ANALYSIS_GROUP,
+        signature="file_name:str",
+        triggers=("导出缓冲区分析结果为JSON", "导出缓冲区结果为GeoJSON"),
+        notes=(_FILE_NAME_NOTE,),
+    ),
+    ToolSpec(
+        tool=export_intersection_results_as_json,
+        group=_ANALYSIS_GROUP,
+        signature="file_name:str",
+        triggers=("导出相交分析结果为JSON", "导出相交结果为GeoJSON"),
+        notes=(_FILE_NAME_NOTE,),
+    ),
+    ToolSpec(
+        tool=export_erase_results_as_json,
+        group=_ANALYSIS_GROUP,
+        signature="file_name:str",
+        triggers=("导出擦除分析结果为JSON", "导出擦除结果为GeoJSON"),
+        notes=(_FILE_NAME_NOTE,),
+    ),
+    ToolSpec(
+        tool=export_path_results_as_json,
+        group=_ANALYSIS_GROUP,
+        signature="file_name:str",
+        triggers=("导出最短路径分析结果为JSON", "导出路径结果为GeoJSON"),
+        notes=(_FILE_NAME_NOTE,),
+    ),
+    # 第三组：保存为图层
+    ToolSpec(
+        tool=save_query_results_as_layer,
+        group=_SAVE_GROUP,
+        signature="layer_name?:str",
+        triggers=("保存查询结果为图层", "另存为图层", "保存为新图层"),
+        notes=(_LAYER_NAME_NOTE,),
+    ),
+    ToolSpec(
+        tool=save_buffer_results_as_layer,
+        group=_SAVE_GROUP,
+        signature="layer_name?:str",
+        triggers=("保存缓冲区分析结果为图层", "另存缓冲区结果为图层"),
+        notes=(_save_after_note("缓冲区分析", "execute_buffer_analysis"), _LAYER_NAME_NOTE),
+    ),
+    ToolSpec(
+        tool=save_intersection_results_as_layer,
+        group=_SAVE_GROUP,
+        signature="layer_name?:str",
+        triggers=("保存相交分析结果为图层", "另存相交结果为图层"),
+        notes=(_save_after_note("相交分析", "execute_intersection_analysis"), _LAYER_NAME_NOTE),
+    ),
+    ToolSpec(
+        tool=save_erase_results_as_layer,
+        group=_SAVE_GROUP,
+        signature="layer_name?:str",
+        triggers=("保存擦除分析结果为图层", "另存擦除结果为图层"),
+        notes=(_save_after_note("擦除分析", "execute_erase_analysis"), _LAYER_NAME_NOTE),
+    ),
+    ToolSpec(
+        tool=save_path_results_as_layer,
+        group=_SAVE_GROUP,
+        signature="layer_name?:str",
+        triggers=("保存最短路径分析结果为图层", "另存路径结果为图层"),
+        notes=(_save_after_note("最短路径分析", "execute_shortest_path_analysis"), _LAYER_NAME_NOTE),
+    ),
+):
+    map_tool_registry.register(_spec)
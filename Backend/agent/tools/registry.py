@@ -0,0 +1,113 @@
+"""
+工具注册表
+以声明式 ToolSpec 统一描述工具：绑定到模型的工具列表、系统提示词中的工具说明、
+工具分发与前端执行工具的模板回答均由同一注册表生成
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.tools import BaseTool
+
+_GROUP_ORDINALS = "一二三四五六七八九十"
+DEFAULT_FRONTEND_ANSWER = "正在执行请稍后"
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """
+    工具声明。
+    字段说明：
+      - tool: LangChain 工具对象
+      - group: 提示词中的分组名称
+      - signature: 提示词中展示的参数签名
+      - triggers: 触发该工具的典型用户说法
+      - notes: 追加在触发说明后的补充规则（每项一行，可包含换行的子项）
+      - frontend_executed: 是否为前端执行工具（后端仅回传动作参数）
+      - answer: 前端执行工具的模板回答，参数为工具调用参数；为空时使用默认回答
+    """
+    tool: BaseTool
+    group: str
+    signature: str
+    triggers: Tuple[str, ...]
+    notes: Tuple[str, ...] = ()
+    frontend_executed: bool = True
+    answer: Optional[Callable[[Dict[str, Any]], str]] = field(default=None, compare=False)
+
+    @property
+    def name(self) -> str:
+        return self.tool.name
+
+    def render_answer(self, args: Dict[str, Any]) -> str:
+        """生成前端执行工具的模板回答"""
+        if self.answer is None:
+            return DEFAULT_FRONTEND_ANSWER
+        return self.answer(args)
+
+
+class ToolRegistry:
+    """
+    工具注册表，按名称 O(1) 查找。
+    注册顺序即提示词中的编号顺序，分组按首次出现的顺序排列。
+    """
+
+    def __init__(self) -> None:
+        self._specs: Dict[str, ToolSpec] = {}
+
+    def register(self, spec: ToolSpec) -> ToolSpec:
+        """注册工具，名称重复时抛出 ValueError"""
+        if spec.name in self._specs:
+            raise ValueError(f"工具重复注册: {spec.name}")
+        self._specs[spec.name] = spec
+        return spec
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._specs.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    @property
+    def specs(self) -> List[ToolSpec]:
+        return list(self._specs.values())
+
+    @property
+    def tools(self) -> List[BaseTool]:
+        """绑定到模型的工具列表"""
+        return [spec.tool for spec in self._specs.values()]
+
+    async def ainvoke(self, name: str, args: Dict[str, Any]) -> Any:
+        """按名称执行工具，未注册的工具返回提示文本"""
+        spec = self._specs.get(name)
+        if spec is None:
+            return f"未知工具: {name}"
+        return await spec.tool.ainvoke(args)
+
+    def prompt_section(self, style: str = "call") -> str:
+        """
+        生成系统提示词中的工具说明。
+        输入参数：
+          - style: 'call' 用于第一步调用（"当用户说…时调用"），'reply' 用于第二步调用（"遇到…的请求时调用"）
+        输出数据格式：
+          - string: 按分组编号的工具说明文本
+        """
+        groups: Dict[str, List[ToolSpec]] = {}
+        for spec in self._specs.values():
+            groups.setdefault(spec.group, []).append(spec)
+        sections: List[str] = []
+        index = 0
+        for group_index, (group, specs) in enumerate(groups.items()):
+            lines = [f"=== 第{_GROUP_ORDINALS[group_index]}组：{group} ==="]
+            for spec in specs:
+                index += 1
+                triggers = "、".join(f"'{t}'" for t in spec.triggers)
+                lines.append(f"{index}) {spec.name}({spec.signature})")
+                if style == "reply":
+                    lines.append(f"- 遇到{triggers}的请求时调用。")
+                else:
+                    lines.append(f"- 当用户说{triggers}时调用。")
+                lines.extend(f"- {note}" for note in spec.notes)
+            sections.append("\n".join(lines))
+        return "\n\n".join(sections) + "\n\n"